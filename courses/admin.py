@@ -1,3 +1,170 @@
 from django.contrib import admin
 
-# Register your models here.
+from .models import (
+    Certificate, Course, CoursePart, CourseTopic, DocumentUpload, Job, Quiz, QuizAnswer, QuizCompletion, QuizQuestion,
+    TopicDocument, TopicText, UserProgress,
+)
+from .pagination import EstimatedCountPaginator
+
+# Every changelist row and inline row is rendered with str(), and most __str__
+# methods read a parent (CourseTopic -> part.title, QuizAnswer -> question.text).
+# list_select_related / Inline.select_related fetch those parents in the same query.
+# Foreign keys use autocomplete or raw id widgets, so no form renders a <select>
+# with every course, topic or user in it.
+
+
+class BaseAdmin(admin.ModelAdmin):
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    list_per_page = 50
+    raw_id_fields = ('created_by',)
+    readonly_fields = ('created_at', 'updated_at', 'deleted_at')
+
+    def get_search_results(self, request, queryset, search_term):
+        queryset, may_have_duplicates = super().get_search_results(request, queryset, search_term)
+        # Autocomplete results are rendered with str() too, but that view ignores list_select_related.
+        if isinstance(self.list_select_related, (list, tuple)):
+            queryset = queryset.select_related(*self.list_select_related)
+        return queryset, may_have_duplicates
+
+
+class BaseInline(admin.TabularInline):
+    extra = 0
+    show_change_link = True
+    select_related = ()
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related(*self.select_related)
+
+
+class CoursePartInline(BaseInline):
+    model = CoursePart
+    fields = ('title',)
+    select_related = ('course',)
+
+
+class CourseTopicInline(BaseInline):
+    model = CourseTopic
+    fields = ('title',)
+    select_related = ('part',)
+
+
+class QuizQuestionInline(BaseInline):
+    model = QuizQuestion
+    fields = ('text',)
+    select_related = ('quiz',)
+
+
+class QuizAnswerInline(BaseInline):
+    model = QuizAnswer
+    fields = ('text', 'is_correct')
+    select_related = ('question',)
+
+
+@admin.register(Course)
+class CourseAdmin(BaseAdmin):
+    list_display = ('title', 'created_at', 'updated_at')
+    search_fields = ('title',)
+    inlines = [CoursePartInline]
+
+
+@admin.register(CoursePart)
+class CoursePartAdmin(BaseAdmin):
+    list_display = ('title', 'course')
+    list_select_related = ('course',)
+    search_fields = ('title',)
+    autocomplete_fields = ('course',)
+    inlines = [CourseTopicInline]
+
+
+@admin.register(CourseTopic)
+class CourseTopicAdmin(BaseAdmin):
+    list_display = ('title', 'part')
+    list_select_related = ('part__course',)
+    search_fields = ('title',)
+    autocomplete_fields = ('part',)
+
+
+@admin.register(TopicDocument)
+class TopicDocumentAdmin(BaseAdmin):
+    list_display = ('name', 'topic', 'created_at')
+    list_select_related = ('topic__part',)
+    # created_at is covered by topicdoc_live_listing_idx.
+    list_filter = ('created_at',)
+    search_fields = ('name',)
+    autocomplete_fields = ('topic',)
+    readonly_fields = BaseAdmin.readonly_fields + ('sha256',)
+
+
+@admin.register(DocumentUpload)
+class DocumentUploadAdmin(BaseAdmin):
+    list_display = ('filename', 'topic', 'size', 'created_at')
+    list_select_related = ('topic__part',)
+    search_fields = ('filename',)
+    autocomplete_fields = ('topic',)
+    raw_id_fields = BaseAdmin.raw_id_fields + ('document',)
+
+
+@admin.register(TopicText)
+class TopicTextAdmin(BaseAdmin):
+    list_display = ('__str__', 'created_at')
+    list_select_related = ('topic',)
+    autocomplete_fields = ('topic',)
+
+
+@admin.register(Quiz)
+class QuizAdmin(BaseAdmin):
+    list_display = ('__str__', 'created_at')
+    list_select_related = ('course',)
+    search_fields = ('title',)
+    autocomplete_fields = ('course',)
+    inlines = [QuizQuestionInline]
+
+
+@admin.register(QuizQuestion)
+class QuizQuestionAdmin(BaseAdmin):
+    list_display = ('__str__', 'text')
+    list_select_related = ('quiz',)
+    search_fields = ('text',)
+    autocomplete_fields = ('quiz',)
+    inlines = [QuizAnswerInline]
+
+
+@admin.register(QuizAnswer)
+class QuizAnswerAdmin(BaseAdmin):
+    list_display = ('__str__', 'text', 'is_correct')
+    list_select_related = ('question',)
+    search_fields = ('text',)
+    autocomplete_fields = ('question',)
+
+
+@admin.register(UserProgress)
+class UserProgressAdmin(BaseAdmin):
+    list_display = ('user', 'course', 'updated_at')
+    list_select_related = ('user', 'course')
+    raw_id_fields = BaseAdmin.raw_id_fields + ('user',)
+    autocomplete_fields = ('course',)
+
+
+@admin.register(Certificate)
+class CertificateAdmin(BaseAdmin):
+    list_display = ('user', 'course', 'created_at')
+    list_select_related = ('user', 'course')
+    raw_id_fields = BaseAdmin.raw_id_fields + ('user',)
+    autocomplete_fields = ('course',)
+
+
+@admin.register(QuizCompletion)
+class QuizCompletionAdmin(BaseAdmin):
+    list_display = ('user', 'quiz', 'score', 'completed_at')
+    list_select_related = ('user', 'quiz__course')
+    raw_id_fields = BaseAdmin.raw_id_fields + ('user',)
+    autocomplete_fields = ('quiz', 'course')
+
+
+@admin.register(Job)
+class JobAdmin(BaseAdmin):
+    list_display = ('kind', 'status', 'attempts', 'run_after', 'locked_at')
+    # status leads job_status_run_after_idx.
+    list_filter = ('status',)
+    readonly_fields = BaseAdmin.readonly_fields + ('locked_at', 'last_error')
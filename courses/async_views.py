@@ -0,0 +1,76 @@
+"""
+Async counterparts of the document views, for deployments served over ASGI
+(``ASYNC_DOCUMENT_VIEWS = True``). Queries go through the async ORM; forms,
+templates and file writes are still synchronous in Django and run in a thread.
+"""
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.exceptions import PermissionDenied
+from django.http import HttpResponseBadRequest
+from django.shortcuts import aget_object_or_404, redirect, render
+from django.views.decorators.http import require_GET
+
+from .forms import TopicDocumentForm
+from .models import TopicDocument
+from .pagination import InvalidCursor, akeyset_paginate
+from .serving import acan_view_document, aserve_document_file
+
+
+def _document_form(request, instance=None):
+    # Building the form reads topic choices, so it runs in a thread like the save.
+    if request.method != 'POST':
+        return TopicDocumentForm(instance=instance), False
+    form = TopicDocumentForm(request.POST, request.FILES, instance=instance)
+    saved = form.is_valid()
+    if saved:
+        form.save()
+    return form, saved
+
+
+async def document_list(request):
+    form, saved = await sync_to_async(_document_form)(request)
+    if saved:
+        return redirect('success')
+
+    try:
+        documents = await akeyset_paginate(
+            TopicDocument.objects.for_listing(),
+            cursor=request.GET.get('cursor'),
+            page_size=getattr(settings, 'DOCUMENT_LIST_PAGE_SIZE', 50),
+        )
+    except InvalidCursor:
+        return HttpResponseBadRequest('Invalid cursor')
+    return await sync_to_async(render)(request, 'document_list.html', {'form': form, 'documents': documents})
+
+
+async def update_document(request, document_id):
+    document = await aget_object_or_404(TopicDocument, id=document_id)
+
+    form, saved = await sync_to_async(_document_form)(request, document)
+    if saved:
+        return redirect('document_list')
+
+    return await sync_to_async(render)(request, 'update_document.html', {'form': form, 'document': document})
+
+
+async def delete_document(request, document_id):
+    document = await aget_object_or_404(TopicDocument, id=document_id)
+
+    if request.method == 'POST':
+        await sync_to_async(document.soft_delete)()
+        return redirect('document_list')
+
+    return await sync_to_async(render)(request, 'confirm_delete.html', {'document': document})
+
+
+@require_GET
+async def serve_document(request, document_id):
+    document = await aget_object_or_404(
+        TopicDocument.objects.select_related('topic__part').only(
+            'id', 'file', 'sha256', 'updated_at', 'created_by', 'topic__part__course',
+        ),
+        id=document_id,
+    )
+    if not await acan_view_document(await request.auser(), document):
+        raise PermissionDenied
+    return await aserve_document_file(request, document)
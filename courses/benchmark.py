@@ -0,0 +1,324 @@
+"""
+Synthetic data and repeatable benchmarks for the courses app.
+
+``generate`` builds course trees, users, progress rows and quiz completions
+with ``bulk_create`` in bounded batches, so the 10k courses / 1M topics /
+10M progress rows scale fits in memory. ``run`` drives the main paths
+through the test client (or directly, where a path has no view) and
+reports query counts, latency percentiles and peak Python memory per scenario.
+"""
+import itertools
+import platform
+import random
+import statistics
+import subprocess
+import time
+import tracemalloc
+
+import django
+from django.conf import settings
+from django.contrib import admin
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection, connections, transaction
+from django.test import Client
+from django.urls import reverse
+from django.utils import timezone
+
+from .counters import recount
+from .grading import Submission, grade_submissions
+from .metrics import QueryTracker
+from .models import (
+    Course, CoursePart, CourseTopic, Quiz, QuizAnswer, QuizCompletion, QuizQuestion, TopicDocument, TopicText,
+    UserProgress,
+)
+from .pagination import keyset_paginate
+from .progress import record_quiz_completion
+
+BATCH_SIZE = 5000
+COURSE_PREFIX = 'Bench course'
+USER_PREFIX = 'bench-user'
+
+
+def _chunks(iterable, size):
+    iterator = iter(iterable)
+    while chunk := list(itertools.islice(iterator, size)):
+        yield chunk
+
+
+def generate(courses=100, parts=5, topics=10, texts=1, documents=1, quizzes=2, questions=5, answers=4,
+             users=100, progress_per_user=10, completions_per_progress=1, seed=0, batch_size=BATCH_SIZE, log=None):
+    """
+    Build a dataset of ``courses`` courses with ``parts`` parts of ``topics`` topics each,
+    and ``users`` users enrolled in ``progress_per_user`` random courses each.
+    Returns the number of rows created per model.
+    """
+    rng = random.Random(seed)
+    created = dict.fromkeys(
+        ['course', 'part', 'topic', 'text', 'document', 'quiz', 'question', 'answer', 'user', 'progress', 'completion'],
+        0,
+    )
+    start = Course.all_objects.filter(title__startswith=COURSE_PREFIX).count()
+    course_quizzes = {}
+    # Enough courses per round that a round of topics is about one batch.
+    courses_per_round = max(1, batch_size // max(1, parts * topics))
+    for numbers in _chunks(range(start, start + courses), courses_per_round):
+        with transaction.atomic():
+            course_objs = Course.objects.bulk_create([
+                Course(
+                    title=f'{COURSE_PREFIX} {n:06d}', description=f'Generated course {n} about topic {rng.random()}',
+                    part_count=parts, topic_count=parts * topics, document_count=parts * topics * documents,
+                )
+                for n in numbers
+            ])
+            part_objs = CoursePart.objects.bulk_create(
+                [
+                    CoursePart(course=course, title=f'Part {p + 1}', topic_count=topics, document_count=topics * documents)
+                    for course in course_objs for p in range(parts)
+                ],
+                batch_size=batch_size,
+            )
+            topic_objs = CourseTopic.objects.bulk_create(
+                [
+                    CourseTopic(part=part, title=f'Topic {t + 1}', document_count=documents, text_count=texts)
+                    for part in part_objs for t in range(topics)
+                ],
+                batch_size=batch_size,
+            )
+            TopicText.objects.bulk_create(
+                (TopicText(topic=topic, text=f'{topic.title} notes {rng.random()}') for topic in topic_objs for _ in range(texts)),
+                batch_size=batch_size,
+            )
+            TopicDocument.objects.bulk_create(
+                (
+                    TopicDocument(topic=topic, name=f'{topic.title} handout {d + 1}', file=f'topic_documents/bench-{topic.pk}-{d}.pdf')
+                    for topic in topic_objs for d in range(documents)
+                ),
+                batch_size=batch_size,
+            )
+            quiz_objs = Quiz.objects.bulk_create(
+                [Quiz(course=course, title=f'Quiz {q + 1}') for course in course_objs for q in range(quizzes)],
+                batch_size=batch_size,
+            )
+            question_objs = QuizQuestion.objects.bulk_create(
+                [QuizQuestion(quiz=quiz, text=f'Question {q + 1}') for quiz in quiz_objs for q in range(questions)],
+                batch_size=batch_size,
+            )
+            QuizAnswer.objects.bulk_create(
+                (
+                    QuizAnswer(question=question, text=f'Answer {a + 1}', is_correct=a == 0)
+                    for question in question_objs for a in range(answers)
+                ),
+                batch_size=batch_size,
+            )
+        for quiz in quiz_objs:
+            course_quizzes.setdefault(quiz.course_id, []).append(quiz.pk)
+        created['course'] += len(course_objs)
+        created['part'] += len(part_objs)
+        created['topic'] += len(topic_objs)
+        created['text'] += len(topic_objs) * texts
+        created['document'] += len(topic_objs) * documents
+        created['quiz'] += len(quiz_objs)
+        created['question'] += len(question_objs)
+        created['answer'] += len(question_objs) * answers
+        if log:
+            log(f'{created["course"]} courses, {created["topic"]} topics')
+
+    course_ids = list(Course.objects.filter(title__startswith=COURSE_PREFIX).values_list('id', flat=True))
+    if not course_ids or not users:
+        return created
+    if len(course_quizzes) < len(course_ids):
+        # Courses from an earlier run: load their quizzes once, not per progress row.
+        for quiz_id, course_id in Quiz.objects.filter(course_id__in=course_ids).values_list('id', 'course_id'):
+            if quiz_id not in course_quizzes.get(course_id, ()):
+                course_quizzes.setdefault(course_id, []).append(quiz_id)
+
+    password = make_password(None)
+    user_start = User.objects.filter(username__startswith=USER_PREFIX).count()
+    now = timezone.now()
+    per_user = min(progress_per_user, len(course_ids))
+    for numbers in _chunks(range(user_start, user_start + users), max(1, batch_size // max(1, per_user))):
+        with transaction.atomic():
+            user_objs = User.objects.bulk_create(
+                [User(username=f'{USER_PREFIX}-{n:07d}', password=password) for n in numbers]
+            )
+            progress, completions = [], []
+            for user in user_objs:
+                for course_id in rng.sample(course_ids, per_user):
+                    quiz_ids = course_quizzes.get(course_id, [])[:completions_per_progress]
+                    progress.append(UserProgress(
+                        user=user, course_id=course_id,
+                        completed_quizzes={str(q): {'score': 1.0, 'completed_at': now.isoformat()} for q in quiz_ids},
+                    ))
+                    completions.extend(
+                        QuizCompletion(user=user, quiz_id=q, course_id=course_id, score=1.0, completed_at=now)
+                        for q in quiz_ids
+                    )
+            UserProgress.objects.bulk_create(progress, batch_size=batch_size)
+            QuizCompletion.objects.bulk_create(completions, batch_size=batch_size)
+        created['user'] += len(user_objs)
+        created['progress'] += len(progress)
+        created['completion'] += len(completions)
+        if log:
+            log(f'{created["user"]} users, {created["progress"]} progress rows')
+    recount(Course.objects.filter(title__startswith=COURSE_PREFIX))
+    return created
+
+
+class Scenario:
+    def __init__(self, name, call, writes=False):
+        self.name = name
+        self.call = call
+        self.writes = writes
+
+
+def _client_get(client, path, **params):
+    def call():
+        response = client.get(path, params)
+        if response.status_code >= 400:
+            raise RuntimeError(f'GET {path} returned {response.status_code}')
+        if response.streaming:
+            for _ in response.streaming_content:
+                pass
+        return response
+    return call
+
+
+def scenarios(client, user):
+    document = TopicDocument.objects.order_by('-created_at', '-id').first()
+    course = Course.objects.order_by('id').first()
+    quiz = Quiz.objects.filter(questions__isnull=False).order_by('id').first()
+    result = [Scenario('document_list', _client_get(client, reverse('document_list')))]
+    if document is not None:
+        cursor = keyset_paginate(
+            TopicDocument.objects.for_listing(), page_size=getattr(settings, 'DOCUMENT_LIST_PAGE_SIZE', 50),
+        ).next_cursor
+        if cursor:
+            result.append(Scenario('document_list_page_2', _client_get(client, reverse('document_list'), cursor=cursor)))
+        result.append(Scenario('update_document_form', _client_get(client, reverse('update_document', args=[document.pk]))))
+        result.append(Scenario('update_document_post', lambda: client.post(
+            reverse('update_document', args=[document.pk]), {'name': document.name, 'topic': document.topic_id},
+        ), writes=True))
+    if course is not None:
+        result.append(Scenario('course_outline', _client_get(client, reverse('course_outline', args=[course.pk]))))
+        result.append(Scenario('search', _client_get(client, reverse('search'), q='topic notes')))
+        result.append(Scenario('course_catalog', lambda: list(Course.objects.for_catalog()[:50])))
+    for model in (Course, TopicDocument, UserProgress, QuizCompletion):
+        if admin.site.is_registered(model):
+            url = reverse(f'admin:{model._meta.app_label}_{model._meta.model_name}_changelist')
+            result.append(Scenario(f'admin_{model._meta.model_name}_changelist', _client_get(client, url)))
+    if quiz is not None:
+        questions = {q.pk: [a.pk for a in q.answers.all()[:1]] for q in quiz.questions.prefetch_related('answers')}
+        submissions = [Submission(user.pk, quiz.pk, questions)]
+        result.append(Scenario('grade_submissions', lambda: grade_submissions(submissions), writes=True))
+        result.append(Scenario('record_quiz_completion', lambda: record_quiz_completion(user, quiz, 1.0), writes=True))
+        result.append(Scenario('quiz_leaderboard', lambda: list(QuizCompletion.objects.leaderboard(quiz.course_id))))
+        result.append(Scenario('course_completion_stats', lambda: list(
+            Course.objects.filter(pk=quiz.course_id).with_completion_stats().values('quiz_count', 'completed_count')
+        )))
+    return result
+
+
+def _run_once(scenario):
+    if not scenario.writes:
+        return scenario.call()
+    # Write paths run in a transaction that is rolled back, so every iteration sees the same data.
+    with transaction.atomic():
+        scenario.call()
+        transaction.set_rollback(True)
+
+
+def _percentile(sorted_values, fraction):
+    index = min(len(sorted_values) - 1, max(0, round(fraction * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def measure(scenario, iterations=20, warmup=2):
+    for _ in range(warmup):
+        _run_once(scenario)
+
+    tracker = QueryTracker()
+    with connection.execute_wrapper(tracker):
+        _run_once(scenario)
+
+    tracemalloc.start()
+    try:
+        _run_once(scenario)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    timings = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        _run_once(scenario)
+        timings.append((time.perf_counter() - started) * 1000)
+    timings.sort()
+    return {
+        'queries': tracker.count,
+        'duplicate_queries': tracker.duplicates(),
+        'query_ms': round(tracker.seconds * 1000, 2),
+        'p50_ms': round(statistics.median(timings), 2),
+        'p99_ms': round(_percentile(timings, 0.99), 2),
+        'mean_ms': round(statistics.fmean(timings), 2),
+        'peak_memory_kb': round(peak / 1024, 1),
+        'iterations': iterations,
+    }
+
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, cwd=settings.BASE_DIR, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(iterations=20, warmup=2, only=None, host='localhost', log=None):
+    user = User.objects.filter(is_staff=True, is_superuser=True).first()
+    if user is None:
+        user = User.objects.create_superuser('bench-admin', password=None)
+    client = Client(HTTP_HOST=host)
+    client.force_login(user)
+    cache.clear()
+
+    results = {}
+    for scenario in scenarios(client, user):
+        if only and scenario.name not in only:
+            continue
+        results[scenario.name] = measure(scenario, iterations, warmup)
+        if log:
+            log(f'{scenario.name}: {results[scenario.name]}')
+    return {
+        'meta': {
+            'commit': _git_commit(),
+            'created_at': timezone.now().isoformat(),
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'database': connections['default'].vendor,
+            'rows': {
+                'course': Course.objects.count(),
+                'topic': CourseTopic.objects.count(),
+                'document': TopicDocument.objects.count(),
+                'progress': UserProgress.objects.count(),
+            },
+        },
+        'scenarios': results,
+    }
+
+
+def compare(baseline, current, tolerance=0.2):
+    """Return human-readable regressions of ``current`` against ``baseline`` results."""
+    regressions = []
+    for name, now in current['scenarios'].items():
+        before = baseline.get('scenarios', {}).get(name)
+        if before is None:
+            continue
+        if now['queries'] > before['queries']:
+            regressions.append(f'{name}: queries {before["queries"]} -> {now["queries"]}')
+        for key in ('p50_ms', 'p99_ms', 'peak_memory_kb'):
+            if now[key] > before[key] * (1 + tolerance):
+                regressions.append(f'{name}: {key} {before[key]} -> {now[key]}')
+    return regressions
@@ -0,0 +1,126 @@
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import transaction
+from django.db.models import Exists, OuterRef
+
+from .counters import recount
+from .jobs import enqueue, register
+from .models import Certificate, Course, QuizCompletion
+from .pdf import render_certificate
+
+ISSUE_CERTIFICATES = 'issue_certificates'
+RENDER_CERTIFICATES = 'render_certificates'
+ISSUE_BATCH_SIZE = 1000
+RENDER_BATCH_SIZE = 200
+
+_pool = None
+
+
+def schedule_issuance(course_ids):
+    """Cheap enough for a web request: one job row, shared while it is still pending."""
+    return enqueue(ISSUE_CERTIFICATES, {'course_ids': sorted(set(course_ids))}, unique=True)
+
+
+def eligible_without_certificate(course_ids=None):
+    completions = QuizCompletion.objects.all()
+    if course_ids is not None:
+        completions = completions.filter(course_id__in=course_ids)
+    # Soft-deleted (revoked) certificates still count as issued.
+    issued = Certificate.all_objects.filter(user_id=OuterRef('user_id'), course_id=OuterRef('course_id'))
+    return completions.filter(~Exists(issued)).eligible_for_certificate()
+
+
+def _batches(iterable, size):
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _issued_pairs(pairs):
+    # Revoked (soft-deleted) certificates hold their pair too.
+    rows = Certificate.all_objects.filter(
+        user_id__in={user_id for user_id, _ in pairs}, course_id__in={course_id for _, course_id in pairs},
+    ).values_list('user_id', 'course_id')
+    return set(rows) & set(pairs)
+
+
+def _insert_certificates(pairs):
+    """
+    Insert ``(user_id, course_id)`` certificates, skipping pairs that already
+    have one, and return how many rows went in.
+    """
+    before = _issued_pairs(pairs)
+    new = [Certificate(user_id=user_id, course_id=course_id) for user_id, course_id in set(pairs) - before]
+    Certificate.all_objects.bulk_create(new, ignore_conflicts=True)
+    # bulk_create(ignore_conflicts=True) cannot say which rows went in; the difference can.
+    return len(_issued_pairs(pairs) - before)
+
+
+@register(ISSUE_CERTIFICATES)
+def issue_certificates(course_ids=None):
+    # ignore_conflicts + unique_together make re-running the job harmless.
+    eligible = eligible_without_certificate(course_ids).values_list('user_id', 'course_id')
+    issued = 0
+    issued_courses = set()
+    for batch in _batches(eligible.iterator(), ISSUE_BATCH_SIZE):
+        inserted = _insert_certificates(batch)
+        if inserted:
+            issued += inserted
+            issued_courses.update(course_id for _, course_id in batch)
+    # bulk_create sends no signals.
+    recount(Course.objects.filter(pk__in=issued_courses))
+
+    unrendered = Certificate.objects.filter(pdf='')
+    if course_ids is not None:
+        unrendered = unrendered.filter(course_id__in=course_ids)
+    ids = unrendered.order_by('id').values_list('id', flat=True).iterator()
+    for batch in _batches(ids, RENDER_BATCH_SIZE):
+        enqueue(RENDER_CERTIFICATES, {'certificate_ids': batch}, unique=True)
+    return issued
+
+
+def _render_pool():
+    global _pool
+    if _pool is None:
+        # spawn, not fork: children must not inherit the parent's database sockets.
+        _pool = ProcessPoolExecutor(
+            max_workers=getattr(settings, 'CERTIFICATE_RENDER_PROCESSES', None),
+            mp_context=multiprocessing.get_context('spawn'),
+        )
+    return _pool
+
+
+def render_pdfs(rows):
+    if getattr(settings, 'CERTIFICATE_RENDER_PROCESSES', None) == 0:
+        return [render_certificate(*row) for row in rows]
+    return list(_render_pool().map(render_certificate, *zip(*rows), chunksize=16))
+
+
+@register(RENDER_CERTIFICATES)
+def render_certificates(certificate_ids):
+    with transaction.atomic():
+        # Rows another worker is already rendering are skipped, not waited on.
+        certificates = list(
+            Certificate.objects
+            .select_for_update(skip_locked=True, of=('self',))
+            .filter(id__in=certificate_ids, pdf='')
+            .select_related('user', 'course')
+        )
+        if not certificates:
+            return 0
+        rows = [
+            (c.user.get_full_name() or c.user.username, c.course.title if c.course else '', c.created_at.date().isoformat())
+            for c in certificates
+        ]
+        for certificate, pdf in zip(certificates, render_pdfs(rows)):
+            certificate.pdf.save(f'certificate-{certificate.pk}.pdf', ContentFile(pdf), save=False)
+        Certificate.objects.bulk_update(certificates, ['pdf'])
+    return len(certificates)
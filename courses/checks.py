@@ -0,0 +1,22 @@
+from django.conf import settings
+from django.core.checks import Error, Tags, register
+
+PER_PROCESS_CACHES = ('django.core.cache.backends.locmem.LocMemCache',)
+
+
+@register(Tags.caches)
+def check_shared_cache(app_configs, **kwargs):
+    # Invalidation writes cache keys after commit; a per-process cache keeps the
+    # other workers' copies stale until their timeouts, some of which never come.
+    if settings.DEBUG:
+        return []
+    aliases = {'default', getattr(settings, 'RESPONSE_CACHE_ALIAS', 'default')}
+    return [
+        Error(
+            f"CACHES['{alias}'] is not shared between processes.",
+            hint='Use Redis, memcached or the database cache backend.',
+            id='courses.E001',
+        )
+        for alias in sorted(aliases)
+        if settings.CACHES.get(alias, {}).get('BACKEND') in PER_PROCESS_CACHES
+    ]
@@ -0,0 +1,66 @@
+from django.db import transaction
+
+from .jobs import enqueue, register
+from .models import Course, CoursePart, CourseTopic, TopicDocument, TopicText
+from .storage import document_storage
+
+DELETE_FILES = 'delete_document_files'
+PURGE_BATCH_SIZE = 500
+# Children before parents, so no delete cascades into a large subtree at once.
+PURGE_ORDER = (TopicDocument, TopicText, CourseTopic, CoursePart, Course)
+
+
+def schedule_file_deletion(names):
+    """
+    Queue ``names`` for removal from the document storage.
+
+    The job row is written in the caller's transaction, so the files are only
+    removed if the change that orphaned them commits, and never inline in the request.
+    """
+    names = sorted({name for name in names if name})
+    if names:
+        enqueue(DELETE_FILES, {'names': names})
+
+
+def unreferenced(names):
+    # Soft-deleted rows still own their files until purged; only names no row mentions are orphans.
+    referenced = set(TopicDocument.all_objects.filter(file__in=names).values_list('file', flat=True))
+    return [name for name in names if name not in referenced]
+
+
+@register(DELETE_FILES)
+def delete_document_files(names):
+    storage = document_storage()
+    for name in unreferenced(names):
+        storage.delete(name)
+
+
+def document_file_replaced(sender, instance, **kwargs):
+    previous = getattr(instance, 'replaced_file_name', None)
+    if previous:
+        schedule_file_deletion([previous])
+
+
+def document_deleted(sender, instance, **kwargs):
+    schedule_file_deletion([instance.file.name])
+
+
+def purge_soft_deleted(older_than, batch_size=PURGE_BATCH_SIZE, dry_run=False):
+    """
+    Hard-delete rows soft-deleted before ``older_than``, in primary key batches.
+
+    The deletes send post_delete, so the files of purged documents are queued
+    for removal like those of any deleted document. Returns the number of
+    rows per model; with ``dry_run`` they are only counted.
+    """
+    purged = {}
+    for model in PURGE_ORDER:
+        expired = model.all_objects.filter(deleted_at__lt=older_than)
+        if dry_run:
+            purged[model] = expired.count()
+            continue
+        purged[model] = 0
+        while ids := list(expired.order_by('pk').values_list('pk', flat=True)[:batch_size]):
+            with transaction.atomic():
+                purged[model] += model.all_objects.filter(pk__in=ids).delete()[1].get(model._meta.label, 0)
+    return purged
@@ -0,0 +1,184 @@
+"""
+Denormalized counts on Course, CoursePart and CourseTopic.
+
+Each counter holds the number of live rows below its row. The signal handlers
+here add to or subtract from the counters with ``F()`` as rows are created,
+deleted, soft-deleted, restored and moved to another parent. A change only
+reaches an ancestor when every row between them is live, so a soft-deleted
+subtree stops counting as a whole, and restoring it recounts it from scratch.
+Bulk writes skip signals, so bulk writers call ``recount()``, and
+``reconcile()`` fixes whatever drift remains.
+"""
+from django.db.models import Count, F, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from django.db.models.signals import post_delete, post_save
+
+from .models import (
+    Certificate, Course, CoursePart, CourseTopic, TopicDocument, TopicText, UserProgress, restored, soft_deleted,
+)
+
+RECONCILE_BATCH_SIZE = 1000
+
+# Row counted -> (counter model, foreign key to it, counter)
+LEAF_COUNTERS = {
+    TopicDocument: (CourseTopic, 'topic_id', 'document_count'),
+    TopicText: (CourseTopic, 'topic_id', 'text_count'),
+    UserProgress: (Course, 'course_id', 'enrolled_count'),
+    Certificate: (Course, 'course_id', 'certificate_count'),
+}
+
+# Counter model -> the rows whose counters include its rows, with the lookup from each.
+ANCESTORS = {
+    CourseTopic: ((CourseTopic, 'pk'), (CoursePart, 'topics'), (Course, 'parts__topics')),
+    CoursePart: ((CoursePart, 'pk'), (Course, 'parts')),
+    Course: ((Course, 'pk'),),
+}
+
+
+def _live_count(queryset, lookup):
+    counts = queryset.filter(**{lookup: OuterRef('pk')}).order_by().values(lookup).annotate(n=Count('pk')).values('n')
+    return Coalesce(Subquery(counts, output_field=IntegerField()), 0)
+
+
+def _actual_counts(model):
+    """The expression each counter of ``model`` should equal, per row."""
+    live_topic_documents = TopicDocument.objects.filter(topic__deleted_at__isnull=True)
+    if model is CourseTopic:
+        return {
+            'document_count': _live_count(TopicDocument.objects, 'topic'),
+            'text_count': _live_count(TopicText.objects, 'topic'),
+        }
+    if model is CoursePart:
+        return {
+            'topic_count': _live_count(CourseTopic.objects, 'part'),
+            'document_count': _live_count(live_topic_documents, 'topic__part'),
+        }
+    return {
+        'part_count': _live_count(CoursePart.objects, 'course'),
+        'topic_count': _live_count(CourseTopic.objects.filter(part__deleted_at__isnull=True), 'part__course'),
+        'document_count': _live_count(
+            live_topic_documents.filter(topic__part__deleted_at__isnull=True), 'topic__part__course',
+        ),
+        'enrolled_count': _live_count(UserProgress.objects, 'course'),
+        'certificate_count': _live_count(Certificate.objects, 'course'),
+    }
+
+
+def recount(queryset):
+    """Set the counters of every row in ``queryset`` from the tables, in one UPDATE."""
+    return queryset.update(**_actual_counts(queryset.model))
+
+
+def _add(model, lookup, pk, deltas):
+    changes = {field: F(field) + delta for field, delta in deltas.items() if field in model.COUNTERS and delta}
+    if not changes:
+        return
+    filters = {lookup: pk}
+    if lookup != 'pk':
+        steps = lookup.split('__')
+        filters.update({'__'.join(steps[:i]) + '__deleted_at__isnull': True for i in range(1, len(steps) + 1)})
+    model.objects.filter(**filters).update(**changes)
+
+
+def add_counts(model, pk, **deltas):
+    """Add ``deltas`` to the ``model`` row ``pk`` and to each ancestor reached through live rows."""
+    for ancestor, lookup in ANCESTORS[model]:
+        _add(ancestor, lookup, pk, deltas)
+
+
+def _direction(signal, instance, created=False):
+    if signal is post_save:
+        return 1 if created and instance.deleted_at is None else 0
+    if signal is post_delete:
+        return -1 if instance.deleted_at is None else 0  # a soft-deleted row was subtracted already
+    return -1 if signal is soft_deleted else 1
+
+
+def _moved_from(signal, instance, created, foreign_key):
+    """The parent a live row was saved away from, when this save moved it."""
+    if signal is post_save and not created and instance.deleted_at is None:
+        return instance.moved_from(foreign_key)
+    return None
+
+
+def _move_counts(model, old_pk, new_pk, deltas):
+    add_counts(model, old_pk, **{field: -delta for field, delta in deltas.items()})
+    add_counts(model, new_pk, **deltas)
+
+
+def leaf_counts_changed(sender, instance, signal, created=False, **kwargs):
+    model, foreign_key, counter = LEAF_COUNTERS[sender]
+    pk = getattr(instance, foreign_key)
+    old_pk = _moved_from(signal, instance, created, foreign_key)
+    if old_pk is not None:
+        _move_counts(model, old_pk, pk, {counter: 1})
+    elif pk is not None:
+        add_counts(model, pk, **{counter: _direction(signal, instance, created)})
+
+
+def _subtree_changed(instance, signal, created, parent, foreign_key, own_counter):
+    model = type(instance)
+    parent_id = getattr(instance, foreign_key)
+    old_parent_id = _moved_from(signal, instance, created, foreign_key)
+    if old_parent_id is not None:
+        # The whole subtree changes parent, counted as the row holds it.
+        counts = model.objects.filter(pk=instance.pk).values(*model.COUNTERS).first() or {}
+        _move_counts(parent, old_parent_id, parent_id, {own_counter: 1, **counts})
+        return
+    direction = _direction(signal, instance, created)
+    if not direction:
+        return
+    deltas = {own_counter: direction}
+    if signal is soft_deleted:
+        # The cascade hid everything below; subtract it as the row last counted it.
+        deltas.update({
+            field: -count
+            for field, count in (model.all_objects.filter(pk=instance.pk).values(*model.COUNTERS).first() or {}).items()
+        })
+    elif signal is restored:
+        # Nothing below was counted while the subtree was deleted.
+        if model is CoursePart:
+            recount(CourseTopic.objects.filter(part=instance.pk))
+        recount(model.objects.filter(pk=instance.pk))
+        deltas.update(model.objects.filter(pk=instance.pk).values(*model.COUNTERS).first() or {})
+    # Hard deletes remove the rows below first, and those subtracted themselves.
+    add_counts(parent, parent_id, **deltas)
+
+
+def topic_counts_changed(sender, instance, signal, created=False, **kwargs):
+    _subtree_changed(instance, signal, created, CoursePart, 'part_id', 'topic_count')
+
+
+def part_counts_changed(sender, instance, signal, created=False, **kwargs):
+    _subtree_changed(instance, signal, created, Course, 'course_id', 'part_count')
+
+
+def course_counts_restored(sender, instance, **kwargs):
+    recount(CourseTopic.objects.filter(part__course=instance.pk))
+    recount(CoursePart.objects.filter(course=instance.pk))
+    recount(Course.objects.filter(pk=instance.pk))
+
+
+def reconcile(model, batch_size=RECONCILE_BATCH_SIZE, dry_run=False):
+    """
+    Recount the live rows of ``model`` in primary key batches.
+
+    Returns the number of rows whose counters had drifted; unless ``dry_run``,
+    they are fixed batch by batch.
+    """
+    expressions = _actual_counts(model)
+    drifted = 0
+    last = 0
+    while True:
+        rows = list(
+            model.objects.filter(pk__gt=last).order_by('pk')
+            .annotate(**{f'actual_{field}': expression for field, expression in expressions.items()})
+            .values('pk', *expressions, *(f'actual_{field}' for field in expressions))[:batch_size]
+        )
+        if not rows:
+            return drifted
+        last = rows[-1]['pk']
+        ids = [row['pk'] for row in rows if any(row[field] != row[f'actual_{field}'] for field in expressions)]
+        drifted += len(ids)
+        if ids and not dry_run:
+            recount(model.objects.filter(pk__in=ids))
@@ -0,0 +1,363 @@
+"""
+Streaming course import/export.
+
+A course is written as JSON Lines, one record per row, parents before
+children. Courses, parts and topics are identified by their natural keys
+(titles, unique among live rows). Quizzes and questions have no natural key,
+so they carry an export-local ``ref``. Zip bundles hold one
+``course-<n>.jsonl`` per course plus the document files under ``files/``.
+
+Importing is idempotent: a row matching one that existed before the import
+(same parent and title, name or text) is reused instead of duplicated.
+"""
+import json
+import os
+import zipfile
+
+from django.core.files import File
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .counters import recount
+from .http_cache import invalidate_document_list
+from .models import Course, CoursePart, CourseTopic, Quiz, QuizAnswer, QuizQuestion, TopicDocument, TopicText
+from .outline import rebuild_course
+from .search import EXTRACT_BATCH_SIZE, reindex_courses, schedule_extraction
+from .storage import document_storage
+from .topic_choices import invalidate_topic_choices
+
+BATCH_SIZE = 1000
+ITERATOR_CHUNK_SIZE = 2000
+
+
+class BundleError(ValueError):
+    pass
+
+
+def _rows(queryset, *fields):
+    return queryset.values(*fields).iterator(chunk_size=ITERATOR_CHUNK_SIZE)
+
+
+def _bundle_path(document_id, name):
+    return f'files/{document_id}/{os.path.basename(name)}'
+
+
+def course_records(course, with_files=False):
+    """Yield the records of one course, touching one streamed query per model."""
+    yield {'type': 'course', 'title': course.title, 'description': course.description}
+    for row in _rows(CoursePart.objects.filter(course=course).order_by('id'), 'title'):
+        yield {'type': 'part', 'course': course.title, 'title': row['title']}
+    topics = CourseTopic.objects.filter(part__course=course).order_by('part_id', 'id')
+    for row in _rows(topics, 'part__title', 'title'):
+        yield {'type': 'topic', 'course': course.title, 'part': row['part__title'], 'title': row['title']}
+    texts = TopicText.objects.filter(topic__part__course=course).order_by('topic_id', 'id')
+    for row in _rows(texts, 'topic__part__title', 'topic__title', 'text'):
+        yield {'type': 'text', 'course': course.title, 'part': row['topic__part__title'],
+               'topic': row['topic__title'], 'text': row['text']}
+    documents = TopicDocument.objects.filter(topic__part__course=course).order_by('topic_id', 'id')
+    for row in _rows(documents, 'id', 'topic__part__title', 'topic__title', 'name', 'file'):
+        yield {'type': 'document', 'course': course.title, 'part': row['topic__part__title'],
+               'topic': row['topic__title'], 'name': row['name'],
+               'file': _bundle_path(row['id'], row['file']) if with_files and row['file'] else None}
+    for row in _rows(Quiz.objects.filter(course=course).order_by('id'), 'id', 'title'):
+        yield {'type': 'quiz', 'course': course.title, 'ref': row['id'], 'title': row['title']}
+    questions = QuizQuestion.objects.filter(quiz__course=course).order_by('id')
+    for row in _rows(questions, 'id', 'quiz_id', 'text'):
+        yield {'type': 'question', 'quiz': row['quiz_id'], 'ref': row['id'], 'text': row['text']}
+    answers = QuizAnswer.objects.filter(question__quiz__course=course).order_by('id')
+    for row in _rows(answers, 'question_id', 'text', 'is_correct'):
+        yield {'type': 'answer', 'question': row['question_id'], 'text': row['text'], 'is_correct': row['is_correct']}
+
+
+def export_jsonl(courses):
+    for course in courses.iterator(chunk_size=100):
+        for record in course_records(course):
+            yield json.dumps(record) + '\n'
+
+
+class _StreamBuffer:
+    """Unseekable sink for ``zipfile``; whatever it wrote is handed on with ``drain()``."""
+
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def export_zip(courses, copy_buffer_size=64 * 1024):
+    """Yield a zip bundle chunk by chunk; no course or file is ever held whole in memory."""
+    buffer = _StreamBuffer()
+    storage = document_storage()
+    with zipfile.ZipFile(buffer, 'w', compression=zipfile.ZIP_DEFLATED) as bundle:
+        for number, course in enumerate(courses.iterator(chunk_size=100), start=1):
+            with bundle.open(f'course-{number}.jsonl', 'w') as entry:
+                for record in course_records(course, with_files=True):
+                    entry.write(json.dumps(record).encode() + b'\n')
+                    if buffer.chunks:
+                        yield buffer.drain()
+            yield buffer.drain()
+
+            documents = TopicDocument.objects.filter(topic__part__course=course).exclude(file='').order_by('topic_id', 'id')
+            for row in _rows(documents, 'id', 'file'):
+                with storage.open(row['file'], 'rb') as source, \
+                        bundle.open(_bundle_path(row['id'], row['file']), 'w', force_zip64=True) as entry:
+                    while data := source.read(copy_buffer_size):
+                        entry.write(data)
+                        yield buffer.drain()
+                yield buffer.drain()
+    yield buffer.drain()
+
+
+class CourseImporter:
+    """
+    Batch importer: records are buffered per type and written with
+    ``bulk_create``. Natural keys are resolved with one query per batch, never per row.
+    Existing courses, parts and topics are reused. Texts, documents, quizzes,
+    questions and answers are matched on their parent plus text, name or title
+    against the rows that existed before the import; only the rest are created.
+    """
+
+    ORDER = ['course', 'part', 'topic', 'text', 'document', 'quiz', 'question', 'answer']
+
+    def __init__(self, bundle=None, batch_size=BATCH_SIZE):
+        self.bundle = bundle
+        self.batch_size = batch_size
+        self.pending = {kind: [] for kind in self.ORDER}
+        self.courses = {}  # title -> id
+        self.parts = {}  # (course title, part title) -> id
+        self.topics = {}  # (course title, part title, topic title) -> id
+        self.quizzes = {}  # ref -> id
+        self.questions = {}  # ref -> id
+        self.counts = dict.fromkeys(self.ORDER, 0)
+        self.document_ids = []
+        self.saved_files = []
+        self.started = timezone.now()
+
+    def add(self, record):
+        kind = record.get('type')
+        if kind not in self.pending:
+            raise BundleError(f'Unknown record type {kind!r}')
+        self.pending[kind].append(record)
+        if len(self.pending[kind]) >= self.batch_size:
+            self.flush(kind)
+
+    def flush(self, kind=None):
+        # Flushing a type first flushes every type it may refer to.
+        last = self.ORDER.index(kind) if kind else len(self.ORDER) - 1
+        for name in self.ORDER[:last + 1]:
+            records, self.pending[name] = self.pending[name], []
+            if records:
+                getattr(self, f'_flush_{name}')(records)
+                self.counts[name] += len(records)
+
+    def _lookup(self, mapping, key, kind):
+        try:
+            return mapping[key]
+        except KeyError:
+            raise BundleError(f'{kind} {key!r} refers to a record that was not imported') from None
+
+    def _revive(self, model, ids):
+        # A soft-deleted match is brought back rather than duplicated under the same key.
+        if ids:
+            model.all_objects.filter(pk__in=ids).dead().restore()
+
+    def _matches(self, model, **filters):
+        # Titles are unique among live rows only: list the live match last so it wins,
+        # else the most recently deleted one.
+        return model.all_objects.filter(**filters).order_by(F('deleted_at').asc(nulls_last=True))
+
+    def _existing(self, model, keys, *fields):
+        """
+        Map each key in ``keys`` (values of ``fields``) that a live row held
+        before the import to that row's id. Rows this import created do not
+        count: a bundle may repeat a row on purpose.
+        """
+        if not keys:
+            return {}
+        filters = {f'{field}__in': {key[i] for key in keys} for i, field in enumerate(fields)}
+        rows = model.objects.filter(created_at__lt=self.started, **filters).order_by('id').values_list(*fields, 'id')
+        matches = {}
+        for *key, pk in rows:
+            matches.setdefault(tuple(key), pk)
+        return {key: pk for key, pk in matches.items() if key in keys}
+
+    def _flush_course(self, records):
+        titles = {r['title'] for r in records} - self.courses.keys()
+        existing = dict(self._matches(Course, title__in=titles).values_list('title', 'id'))
+        self._revive(Course, list(existing.values()))
+        self.courses.update(existing)
+        new = {r['title']: r for r in records if r['title'] not in self.courses}
+        created = Course.objects.bulk_create(
+            [Course(title=title, description=r.get('description', '')) for title, r in new.items()]
+        )
+        self.courses.update((c.title, c.pk) for c in created)
+
+    def _flush_part(self, records):
+        keys = {(r['course'], r['title']) for r in records} - self.parts.keys()
+        course_ids = {self._lookup(self.courses, course, 'part'): course for course, _ in keys}
+        existing = self._matches(CoursePart, course_id__in=course_ids, title__in={t for _, t in keys})
+        for course_id, title, pk in existing.values_list('course_id', 'title', 'id'):
+            if (course_ids[course_id], title) in keys:
+                self.parts[(course_ids[course_id], title)] = pk
+        self._revive(CoursePart, [self.parts[key] for key in keys if key in self.parts])
+        new = [key for key in keys if key not in self.parts]
+        created = CoursePart.objects.bulk_create(
+            [CoursePart(course_id=self.courses[course], title=title) for course, title in new]
+        )
+        self.parts.update(zip(new, (p.pk for p in created)))
+
+    def _flush_topic(self, records):
+        keys = {(r['course'], r['part'], r['title']) for r in records} - self.topics.keys()
+        part_ids = {self._lookup(self.parts, (c, p), 'topic'): (c, p) for c, p, _ in keys}
+        existing = self._matches(CourseTopic, part_id__in=part_ids, title__in={t for _, _, t in keys})
+        for part_id, title, pk in existing.values_list('part_id', 'title', 'id'):
+            key = (*part_ids[part_id], title)
+            if key in keys:
+                self.topics[key] = pk
+        self._revive(CourseTopic, [self.topics[key] for key in keys if key in self.topics])
+        new = [key for key in keys if key not in self.topics]
+        created = CourseTopic.objects.bulk_create(
+            [CourseTopic(part_id=self.parts[(c, p)], title=title) for c, p, title in new]
+        )
+        self.topics.update(zip(new, (t.pk for t in created)))
+
+    def _topic_id(self, record):
+        return self._lookup(self.topics, (record['course'], record['part'], record['topic']), record['type'])
+
+    def _flush_text(self, records):
+        rows = [(self._topic_id(r), r['text']) for r in records]
+        existing = self._existing(TopicText, set(rows), 'topic_id', 'text')
+        TopicText.objects.bulk_create([TopicText(topic_id=topic_id, text=text) for topic_id, text in rows
+                                       if (topic_id, text) not in existing])
+
+    def _flush_document(self, records):
+        storage = document_storage()
+        rows = [(self._topic_id(r), r['name'], r) for r in records]
+        existing = self._existing(TopicDocument, {(topic_id, name) for topic_id, name, _ in rows}, 'topic_id', 'name')
+        documents = []
+        for topic_id, name, record in rows:
+            if (topic_id, name) in existing:
+                continue  # imported before; its file is not written again
+            if not record.get('file') or self.bundle is None:
+                continue  # plain JSON Lines exports carry no file contents
+            with self.bundle.open(record['file']) as source:
+                file_name = storage.save(
+                    TopicDocument.file.field.generate_filename(None, os.path.basename(record['file'])),
+                    File(source),
+                )
+            self.saved_files.append(file_name)
+            documents.append(TopicDocument(topic_id=topic_id, name=name, file=file_name))
+        created = TopicDocument.objects.bulk_create(documents)
+        self.document_ids.extend(d.pk for d in created)
+
+    def discard_files(self):
+        """Remove the files this import stored, for when its rows were rolled back."""
+        storage = document_storage()
+        for name in self.saved_files:
+            storage.delete(name)
+        self.saved_files = []
+
+    def _flush_refs(self, model, rows, parent, field, refs):
+        # rows are (ref, parent id, title or text); a match lends its id to the ref.
+        existing = self._existing(model, {(parent_id, value) for _, parent_id, value in rows}, parent, field)
+        new = []
+        for ref, parent_id, value in rows:
+            if (parent_id, value) in existing:
+                refs[ref] = existing[parent_id, value]
+            else:
+                new.append((ref, parent_id, value))
+        created = model.objects.bulk_create([model(**{parent: parent_id, field: value}) for _, parent_id, value in new])
+        refs.update(zip((ref for ref, _, _ in new), (row.pk for row in created)))
+
+    def _flush_quiz(self, records):
+        rows = [(r['ref'], self._lookup(self.courses, r['course'], 'quiz'), r['title']) for r in records]
+        self._flush_refs(Quiz, rows, 'course_id', 'title', self.quizzes)
+
+    def _flush_question(self, records):
+        rows = [(r['ref'], self._lookup(self.quizzes, r['quiz'], 'question'), r['text']) for r in records]
+        self._flush_refs(QuizQuestion, rows, 'quiz_id', 'text', self.questions)
+
+    def _flush_answer(self, records):
+        rows = [(self._lookup(self.questions, r['question'], 'answer'), r['text'], r['is_correct']) for r in records]
+        keys = {(question_id, text) for question_id, text, _ in rows}
+        existing = self._existing(QuizAnswer, keys, 'question_id', 'text')
+        QuizAnswer.objects.bulk_create([
+            QuizAnswer(question_id=question_id, text=text, is_correct=is_correct)
+            for question_id, text, is_correct in rows
+            if (question_id, text) not in existing
+        ])
+
+
+def _iter_lines(fh):
+    for number, line in enumerate(fh, start=1):
+        line = line.strip()
+        if line:
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError as exc:
+                raise BundleError(f'Line {number}: {exc}') from exc
+
+
+def import_courses(path, batch_size=BATCH_SIZE):
+    """
+    Import a ``.jsonl`` file or ``.zip`` bundle in one transaction and return the importer.
+
+    Files are stored as documents are read; if the import fails they are
+    removed again. Should an enclosing transaction roll back later instead,
+    reconcile_documents removes them as orphans.
+    """
+    importer = None
+    try:
+        with transaction.atomic():
+            if zipfile.is_zipfile(path):
+                with zipfile.ZipFile(path) as bundle:
+                    importer = CourseImporter(bundle, batch_size)
+                    for name in sorted(n for n in bundle.namelist() if n.endswith('.jsonl')):
+                        with bundle.open(name) as fh:
+                            for record in _iter_lines(fh):
+                                importer.add(record)
+                    importer.flush()
+            else:
+                importer = CourseImporter(batch_size=batch_size)
+                with open(path, 'rb') as fh:
+                    for record in _iter_lines(fh):
+                        importer.add(record)
+                importer.flush()
+            transaction.on_commit(lambda: _after_import(importer))
+    except Exception:
+        if importer is not None:
+            importer.discard_files()
+        raise
+    return importer
+
+
+def _after_import(importer):
+    # bulk_create skips the save signals, so derived data is refreshed here in bulk.
+    course_ids = set(importer.courses.values())
+    invalidate_topic_choices()
+    invalidate_document_list()
+    recount(CourseTopic.objects.filter(part__course__in=course_ids))
+    recount(CoursePart.objects.filter(course__in=course_ids))
+    recount(Course.objects.filter(pk__in=course_ids))
+    reindex_courses(course_ids)
+    for course_id in course_ids:
+        rebuild_course(course_id)
+    ids = importer.document_ids
+    for start in range(0, len(ids), EXTRACT_BATCH_SIZE):
+        schedule_extraction(TopicDocument.objects.filter(pk__in=ids[start:start + EXTRACT_BATCH_SIZE]))
@@ -0,0 +1,66 @@
+import os
+import re
+import zlib
+
+from django.conf import settings
+
+try:
+    import pypdf
+except ImportError:  # optional, the built-in parser below handles simple PDFs
+    pypdf = None
+
+PLAIN_TEXT_EXTENSIONS = {'.txt', '.md', '.csv', '.html', '.htm'}
+
+STREAM_RE = re.compile(rb'stream\r?\n(.*?)\r?\nendstream', re.DOTALL)
+STRING_RE = re.compile(rb'\((?:\\.|[^\\)])*\)')
+TEXT_OP_RE = re.compile(rb'(\((?:\\.|[^\\)])*\))\s*(?:Tj|\'|")|\[((?:\\.|[^\]])*)\]\s*TJ', re.DOTALL)
+ESCAPES = {b'n': b'\n', b'r': b'\r', b't': b'\t', b'b': b'\b', b'f': b'\f', b'(': b'(', b')': b')', b'\\': b'\\'}
+
+
+def _unescape(literal):
+    body = literal[1:-1]
+    return re.sub(rb'\\(.)', lambda m: ESCAPES.get(m.group(1), m.group(1)), body)
+
+
+def _pdf_text_builtin(data):
+    """Pull text operators out of (optionally Flate-compressed) content streams."""
+    pieces = []
+    for match in STREAM_RE.finditer(data):
+        stream = match.group(1)
+        try:
+            stream = zlib.decompress(stream)
+        except zlib.error:
+            pass
+        for op in TEXT_OP_RE.finditer(stream):
+            if op.group(1):
+                pieces.append(_unescape(op.group(1)))
+            else:
+                pieces.append(b''.join(_unescape(s) for s in STRING_RE.findall(op.group(2))))
+    return b'\n'.join(pieces).decode('latin-1')
+
+
+def _pdf_text(fh, data):
+    if pypdf is not None:
+        try:
+            fh.seek(0)
+            return '\n'.join(page.extract_text() or '' for page in pypdf.PdfReader(fh).pages)
+        except Exception:
+            pass
+    return _pdf_text_builtin(data)
+
+
+def extract_text(fieldfile):
+    """Best-effort plain text of an uploaded document, truncated to ``SEARCH_MAX_DOCUMENT_CHARS``."""
+    max_bytes = getattr(settings, 'SEARCH_MAX_EXTRACT_BYTES', 50 * 1024 * 1024)
+    max_chars = getattr(settings, 'SEARCH_MAX_DOCUMENT_CHARS', 1_000_000)
+    extension = os.path.splitext(fieldfile.name)[1].lower()
+    if extension not in PLAIN_TEXT_EXTENSIONS and extension != '.pdf':
+        return ''
+
+    with fieldfile.open('rb') as fh:
+        data = fh.read(max_bytes)
+        if extension == '.pdf':
+            text = _pdf_text(fh, data)
+        else:
+            text = data.decode('utf-8', 'replace')
+    return text[:max_chars]
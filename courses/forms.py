@@ -1,9 +1,37 @@
 from django import forms
-from .models import TopicDocument, CourseTopic
+from django.conf import settings
+from django.urls import reverse
+
+from .models import DocumentUpload, TopicDocument, CourseTopic
+from .topic_choices import topic_choice_count, topic_choices, topic_label
+
+
+class CachedTopicChoiceIterator(forms.models.ModelChoiceIterator):
+    def __iter__(self):
+        if self.field.empty_label is not None:
+            yield ("", self.field.empty_label)
+        yield from topic_choices()
+
+    def __len__(self):
+        return topic_choice_count() + (1 if self.field.empty_label is not None else 0)
+
+    def __bool__(self):
+        return self.field.empty_label is not None or bool(topic_choice_count())
+
+
+class TopicChoiceField(forms.ModelChoiceField):
+    iterator = CachedTopicChoiceIterator
+
+
+class TopicAutocompleteSelect(forms.Select):
+    """A select holding only the chosen topic; topic_autocomplete.js fills it from topic_search."""
+
+    class Media:
+        js = ['courses/topic_autocomplete.js']
 
 
 class TopicDocumentForm(forms.ModelForm):
-    topic = forms.ModelChoiceField(
+    topic = TopicChoiceField(
         queryset=CourseTopic.objects.all(),
         empty_label="Select a topic",
         required = True
@@ -11,4 +39,33 @@ class TopicDocumentForm(forms.ModelForm):
 
     class Meta:
         model = TopicDocument
-        fields = ['name', 'file', 'topic']
\ No newline at end of file
+        fields = ['name', 'file', 'topic']
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        limit = getattr(settings, 'TOPIC_CHOICES_INLINE_LIMIT', 500)
+        if topic_choice_count() > limit:
+            self._use_topic_autocomplete()
+
+    def _use_topic_autocomplete(self):
+        # Only ship the selected option, the rest is fetched from topic_search.
+        field = self.fields['topic']
+        selected = self['topic'].value()
+        choices = [("", field.empty_label)]
+        if selected:
+            rows = CourseTopic.objects.filter(pk=selected).values_list('id', 'part__title', 'title')
+            try:
+                choices += [(pk, topic_label(part_title, title)) for pk, part_title, title in rows]
+            except (ValueError, TypeError):
+                pass  # a bound form with garbage in it; validation reports that
+        field.widget = TopicAutocompleteSelect(
+            attrs={'data-autocomplete-url': reverse('topic_search')}, choices=choices,
+        )
+
+
+class DocumentUploadForm(forms.ModelForm):
+    size = forms.IntegerField(min_value=1)
+
+    class Meta:
+        model = DocumentUpload
+        fields = ['name', 'topic', 'filename', 'size']
@@ -0,0 +1,113 @@
+from collections import defaultdict, namedtuple
+from functools import partial
+
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+
+from .certificates import schedule_issuance
+from .models import Quiz, QuizAnswer, QuizCompletion, QuizQuestion
+
+VERSION_KEY = 'courses:answer_key:{quiz_id}:version'
+ANSWER_KEY = 'courses:answer_key:{quiz_id}:v{version}'
+ANSWER_KEY_TIMEOUT = 60 * 60 * 24
+BATCH_SIZE = 1000
+
+# answers maps question id -> iterable of selected answer ids.
+Submission = namedtuple('Submission', 'user_id quiz_id answers')
+GradeResult = namedtuple('GradeResult', 'user_id quiz_id correct total score')
+
+
+def _bump_version(quiz_id):
+    key = VERSION_KEY.format(quiz_id=quiz_id)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, 2, timeout=None)
+
+
+def invalidate_answer_key(quiz_id):
+    # After commit, so a grader cannot cache the old answers under the new version.
+    transaction.on_commit(partial(_bump_version, quiz_id))
+
+
+def answer_keys(quiz_ids):
+    """
+    Return ``{quiz_id: {'course_id': ..., 'questions': {question_id: frozenset(correct ids)}}}``.
+
+    Keys are cached per quiz version; all misses are loaded together in two queries.
+    """
+    quiz_ids = set(quiz_ids)
+    versions = cache.get_many([VERSION_KEY.format(quiz_id=pk) for pk in quiz_ids])
+    cache_keys = {
+        pk: ANSWER_KEY.format(quiz_id=pk, version=versions.get(VERSION_KEY.format(quiz_id=pk), 1))
+        for pk in quiz_ids
+    }
+    cached = cache.get_many(cache_keys.values())
+    keys = {pk: cached[key] for pk, key in cache_keys.items() if key in cached}
+
+    missing = quiz_ids - keys.keys()
+    if missing:
+        loaded = {
+            pk: {'course_id': course_id, 'questions': {}}
+            for pk, course_id in Quiz.objects.filter(id__in=missing).values_list('id', 'course_id')
+        }
+        correct = defaultdict(set)
+        rows = QuizAnswer.objects.filter(question__quiz_id__in=missing, is_correct=True).values_list('question_id', 'id')
+        for question_id, answer_id in rows:
+            correct[question_id].add(answer_id)
+        for quiz_id, question_id in QuizQuestion.objects.filter(quiz_id__in=missing).values_list('quiz_id', 'id'):
+            loaded[quiz_id]['questions'][question_id] = frozenset(correct[question_id])
+        cache.set_many({cache_keys[pk]: key for pk, key in loaded.items()}, ANSWER_KEY_TIMEOUT)
+        keys.update(loaded)
+    return keys
+
+
+def grade(answer_key, answers):
+    questions = answer_key['questions']
+    correct = sum(
+        1 for question_id, expected in questions.items()
+        if frozenset(answers.get(question_id, ())) == expected
+    )
+    return correct, len(questions)
+
+
+def grade_submissions(submissions, completed_at=None):
+    """
+    Grade a batch of submissions and upsert their ``QuizCompletion`` rows.
+
+    A question counts as correct when the selected answers equal its correct
+    set exactly. ``score`` is the percentage of correct questions. Repeated
+    submissions for the same user and quiz in one batch keep the last one.
+    """
+    completed_at = completed_at or timezone.now()
+    latest = {(s.user_id, s.quiz_id): s for s in submissions}
+    keys = answer_keys({quiz_id for _, quiz_id in latest})
+
+    results = []
+    for (user_id, quiz_id), submission in latest.items():
+        if quiz_id not in keys:
+            continue
+        correct, total = grade(keys[quiz_id], submission.answers)
+        score = round(100 * correct / total, 2) if total else 0
+        results.append(GradeResult(user_id, quiz_id, correct, total, score))
+    if not results:
+        return results
+
+    with transaction.atomic():
+        # One INSERT ... ON CONFLICT: a concurrent grader inserting the same row cannot slip in between.
+        QuizCompletion.all_objects.bulk_create(
+            [
+                QuizCompletion(
+                    user_id=r.user_id, quiz_id=r.quiz_id, course_id=keys[r.quiz_id]['course_id'],
+                    score=r.score, completed_at=completed_at,
+                )
+                for r in results
+            ],
+            batch_size=BATCH_SIZE,
+            update_conflicts=True,
+            unique_fields=['user', 'quiz'],
+            update_fields=['score', 'completed_at', 'updated_at', 'deleted_at'],
+        )
+        schedule_issuance({keys[r.quiz_id]['course_id'] for r in results})
+    return results
@@ -0,0 +1,99 @@
+"""
+Conditional GET and a server-side response cache for read views.
+
+A view's *stamp* summarizes the data it renders without reading it: a build
+time the view's own cache already keeps, or a scope version that signal
+handlers move with ``touch_scope`` once a change commits. Either way a stamp
+costs a cache lookup, not a query. The stamp yields the ``ETag`` and
+``Last-Modified`` headers and is part of the response cache key, so any change
+moves every key and stale entries are never read again.
+The cache is whichever backend ``RESPONSE_CACHE_ALIAS`` names in ``CACHES``.
+"""
+import hashlib
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.http import HttpResponse
+from django.utils import timezone
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+
+RESPONSE_KEY = 'courses:response:{digest}'
+VERSION_KEY = 'courses:response:version:{scope}'
+
+# Documents with their topic, part and course titles, as the document list shows them.
+DOCUMENT_LIST = 'document_list'
+
+
+def _response_cache():
+    return caches[getattr(settings, 'RESPONSE_CACHE_ALIAS', 'default')]
+
+
+def scope_version(scope):
+    """When ``scope`` last changed; a scope nobody has touched yet starts now."""
+    return _response_cache().get_or_set(VERSION_KEY.format(scope=scope), timezone.now, timeout=None)
+
+
+def _set_version(scope):
+    _response_cache().set(VERSION_KEY.format(scope=scope), timezone.now(), None)
+
+
+def touch_scope(scope):
+    # After commit: moving earlier lets a concurrent request cache the old rows under the new version.
+    transaction.on_commit(lambda: _set_version(scope))
+
+
+def invalidate_document_list(**kwargs):
+    touch_scope(DOCUMENT_LIST)
+
+
+def conditional_page(stamp, cache_responses=True, vary_cookies=()):
+    """
+    Decorate a read view with ``stamp(request, *args, **kwargs) -> (last_modified, token)``.
+
+    Unchanged pages answer 304, or come from the response cache without
+    running the view. ``vary_cookies`` are folded into the key; requests without
+    them bypass the cache (e.g. a page with a CSRF token for a client that has no cookie yet).
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD') or any(name not in request.COOKIES for name in vary_cookies):
+                return view(request, *args, **kwargs)
+            result = stamp(request, *args, **kwargs)
+            if result is None:
+                return view(request, *args, **kwargs)
+            last_modified, token = result
+            vary = '|'.join(request.COOKIES[name] for name in vary_cookies)
+            digest = hashlib.sha256(
+                f'{view.__module__}.{view.__name__}|{request.get_full_path()}|{token}|{vary}'.encode()
+            ).hexdigest()
+            etag = quote_etag(digest)
+            timestamp = int(last_modified.timestamp()) if last_modified else None
+
+            response = get_conditional_response(request, etag=etag, last_modified=timestamp)
+            if response is None and cache_responses:
+                cached = _response_cache().get(RESPONSE_KEY.format(digest=digest))
+                if cached is not None:
+                    response = HttpResponse(cached['content'], content_type=cached['content_type'])
+            if response is None:
+                response = view(request, *args, **kwargs)
+                if response.status_code != 200 or response.streaming:
+                    return response
+                if cache_responses:
+                    _response_cache().set(
+                        RESPONSE_KEY.format(digest=digest),
+                        {'content': response.content, 'content_type': response['Content-Type']},
+                        getattr(settings, 'RESPONSE_CACHE_TIMEOUT', 300),
+                    )
+
+            response.headers['ETag'] = etag
+            if timestamp is not None:
+                response.headers['Last-Modified'] = http_date(timestamp)
+            # Always revalidate; private when the body depends on the client's cookies.
+            response.headers['Cache-Control'] = 'private, no-cache' if vary_cookies else 'no-cache'
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,115 @@
+import hashlib
+import json
+import logging
+import traceback
+from datetime import timedelta
+
+from django.db import IntegrityError, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+MAX_ATTEMPTS = 5
+RETRY_DELAY = timedelta(seconds=30)
+# A running job whose worker has not finished it in this long is assumed dead and re-claimed.
+LOCK_TIMEOUT = timedelta(minutes=30)
+
+registry = {}
+
+
+def register(kind):
+    def decorator(func):
+        registry[kind] = func
+        return func
+    return decorator
+
+
+def dedupe_key(kind, payload):
+    canonical = json.dumps([kind, payload], sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+def enqueue(kind, payload=None, run_after=None, unique=False):
+    """
+    Insert a job row; when called inside a transaction it only becomes visible
+    on commit, so jobs never run against data that was rolled back.
+    With ``unique`` an identical pending job is reused instead of duplicated;
+    the partial unique index on ``dedupe_key`` settles concurrent enqueues.
+    """
+    payload = payload or {}
+    run_after = run_after or timezone.now()
+    if not unique:
+        return Job.objects.create(kind=kind, payload=payload, run_after=run_after)
+    key = dedupe_key(kind, payload)
+    job = Job.objects.filter(dedupe_key=key, status=Job.PENDING).first()
+    if job is not None:
+        return job
+    try:
+        with transaction.atomic():
+            return Job.objects.create(kind=kind, payload=payload, run_after=run_after, dedupe_key=key)
+    except IntegrityError:
+        return Job.objects.get(dedupe_key=key, status=Job.PENDING)
+
+
+def enqueue_unique(kind, payloads, run_after=None):
+    """
+    ``enqueue(kind, payload, unique=True)`` for many payloads in one INSERT.
+    Payloads that already have a pending job are skipped by the partial unique index.
+    """
+    run_after = run_after or timezone.now()
+    Job.objects.bulk_create(
+        [Job(kind=kind, payload=payload, run_after=run_after, dedupe_key=dedupe_key(kind, payload)) for payload in payloads],
+        ignore_conflicts=True,
+    )
+
+
+def claim(limit):
+    now = timezone.now()
+    with transaction.atomic():
+        ids = list(
+            Job.objects
+            .select_for_update(skip_locked=True)
+            .filter(
+                Q(status=Job.PENDING, run_after__lte=now)
+                | Q(status=Job.RUNNING, locked_at__lt=now - LOCK_TIMEOUT)
+            )
+            .order_by('run_after', 'id')
+            .values_list('id', flat=True)[:limit]
+        )
+        Job.objects.filter(id__in=ids).update(status=Job.RUNNING, attempts=F('attempts') + 1, locked_at=now)
+    return list(Job.objects.filter(id__in=ids).order_by('run_after', 'id'))
+
+
+def run_job(job):
+    handler = registry.get(job.kind)
+    try:
+        if handler is None:
+            raise LookupError(f'No handler registered for job kind {job.kind!r}')
+        handler(**job.payload)
+    except Exception:
+        logger.exception('Job %s (%s) failed', job.pk, job.kind)
+        job.last_error = traceback.format_exc()
+        if job.attempts < MAX_ATTEMPTS:
+            job.status = Job.PENDING
+            job.run_after = timezone.now() + RETRY_DELAY * job.attempts
+            # An identical job may have been queued while this one ran; the retry must not collide with it.
+            job.dedupe_key = ''
+        else:
+            job.status = Job.FAILED
+    else:
+        job.status = Job.DONE
+        job.last_error = ''
+    job.locked_at = None
+    job.save(update_fields=['status', 'run_after', 'last_error', 'locked_at', 'dedupe_key', 'updated_at'])
+    return job.status == Job.DONE
+
+
+def run_pending(limit=100):
+    """Claim and run up to ``limit`` due jobs, returning how many were processed."""
+    jobs = claim(limit)
+    for job in jobs:
+        run_job(job)
+    return len(jobs)
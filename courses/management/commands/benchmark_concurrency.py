@@ -0,0 +1,142 @@
+import asyncio
+import importlib
+import io
+import json
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.handlers.asgi import ASGIHandler
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand
+from django.test.utils import override_settings
+from django.urls import clear_url_caches
+
+
+def _reload_urls():
+    importlib.reload(importlib.import_module(settings.ROOT_URLCONF))
+    clear_url_caches()
+
+
+def _summary(mode, latencies, elapsed, peak, statuses):
+    latencies.sort()
+    return {
+        'mode': mode,
+        'requests': len(latencies),
+        'seconds': round(elapsed, 3),
+        'requests_per_second': round(len(latencies) / elapsed, 1),
+        'latency_p50_ms': round(statistics.median(latencies) * 1000, 1),
+        'latency_p95_ms': round(latencies[int(len(latencies) * 0.95) - 1] * 1000, 1),
+        'latency_max_ms': round(latencies[-1] * 1000, 1),
+        'peak_in_flight': peak,
+        'statuses': statuses,
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        "Drive one in-process WSGI worker and one ASGI worker with the same concurrent "
+        "load and report how many connections each keeps in flight. --client-delay "
+        "simulates slow clients by pausing after every body chunk, which is what pins "
+        "a synchronous worker thread. No network is involved; only the Django side is measured."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--path', default='/document_list/')
+        parser.add_argument('--cookie', default='', help="Cookie header, e.g. a sessionid for protected documents.")
+        parser.add_argument('--connections', type=int, default=100)
+        parser.add_argument('--requests', type=int, default=5, help="Requests per connection, all issued at once.")
+        parser.add_argument('--client-delay', type=float, default=0.05, help="Seconds a client takes per body chunk.")
+        parser.add_argument('--wsgi-threads', type=int, default=1, help="Threads in the WSGI worker (gunicorn sync: 1).")
+        parser.add_argument('--mode', choices=['both', 'wsgi', 'asgi'], default='both')
+
+    def handle(self, *args, path, cookie, connections, requests, client_delay, wsgi_threads, mode, **options):
+        self.path, self.cookie, self.delay = path, cookie, client_delay
+        results = []
+        if mode in ('both', 'wsgi'):
+            results.append(self.run_wsgi(connections, requests, wsgi_threads))
+        if mode in ('both', 'asgi'):
+            with override_settings(ASYNC_DOCUMENT_VIEWS=True):
+                _reload_urls()
+                try:
+                    results.append(asyncio.run(self.run_asgi(connections, requests)))
+                finally:
+                    _reload_urls()
+        self.stdout.write(json.dumps(results, indent=2))
+
+    def run_wsgi(self, connections, requests, threads):
+        handler = WSGIHandler()
+        in_flight = peak = 0
+        lock = threading.Lock()
+        statuses = {}
+
+        def one_request():
+            nonlocal in_flight, peak
+            with lock:
+                in_flight += 1
+                peak = max(peak, in_flight)
+            environ = {
+                'REQUEST_METHOD': 'GET', 'PATH_INFO': self.path, 'QUERY_STRING': '', 'SERVER_NAME': 'localhost',
+                'SERVER_PORT': '80', 'HTTP_HOST': 'localhost', 'HTTP_COOKIE': self.cookie,
+                'wsgi.input': io.BytesIO(), 'wsgi.errors': io.StringIO(), 'wsgi.url_scheme': 'http',
+            }
+            status = []
+            body = handler(environ, lambda s, headers: status.append(s.split()[0]))
+            try:
+                for _ in body:
+                    time.sleep(self.delay)  # the worker thread is held while the client reads
+            finally:
+                if hasattr(body, 'close'):
+                    body.close()
+            with lock:
+                in_flight -= 1
+                statuses[status[0]] = statuses.get(status[0], 0) + 1
+            return time.perf_counter() - started
+
+        started = time.perf_counter()
+        # Every request arrives at once; the worker serves them `threads` at a time.
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            futures = [pool.submit(one_request) for _ in range(connections * requests)]
+            latencies = [future.result() for future in futures]
+        return _summary('wsgi', latencies, time.perf_counter() - started, peak, statuses)
+
+    async def run_asgi(self, connections, requests):
+        app = ASGIHandler()
+        in_flight = peak = 0
+        statuses = {}
+        latencies = []
+
+        async def one_request():
+            nonlocal in_flight, peak
+            scope = {
+                'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET',
+                'scheme': 'http', 'path': self.path, 'raw_path': self.path.encode(), 'query_string': b'',
+                'root_path': '', 'server': ('localhost', 80), 'client': ('127.0.0.1', 0),
+                'headers': [(b'host', b'localhost'), (b'cookie', self.cookie.encode())],
+            }
+            messages = iter([{'type': 'http.request', 'body': b'', 'more_body': False}])
+
+            async def receive():
+                try:
+                    return next(messages)
+                except StopIteration:
+                    await asyncio.Event().wait()  # no disconnect until the response is done
+
+            async def send(message):
+                if message['type'] == 'http.response.start':
+                    status = str(message['status'])
+                    statuses[status] = statuses.get(status, 0) + 1
+                elif message.get('body'):
+                    await asyncio.sleep(self.delay)  # only this coroutine waits on the slow client
+
+            in_flight += 1
+            peak = max(peak, in_flight)
+            await app(scope, receive, send)
+            in_flight -= 1
+            latencies.append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(one_request() for _ in range(connections * requests)))
+        return _summary('asgi', latencies, time.perf_counter() - started, peak, statuses)
@@ -0,0 +1,78 @@
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from courses.storage import ContentAddressedStorage, document_storage, file_sha256
+
+
+class Command(BaseCommand):
+    help = (
+        "Replace byte-identical files under the document storage with hard links "
+        "to a single content-addressed blob, in place."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--path', default='topic_documents',
+            help="Directory to scan, relative to the document storage root.",
+        )
+        parser.add_argument('--dry-run', action='store_true', help="Report savings without touching files.")
+        parser.add_argument('--prune', action='store_true', help="Also remove blobs no file refers to.")
+
+    def handle(self, *args, path, dry_run, prune, **options):
+        storage = document_storage()
+        if not isinstance(storage, ContentAddressedStorage):
+            raise CommandError("The 'documents' storage is not a ContentAddressedStorage.")
+
+        scanned = linked = saved = 0
+        dry_run_blobs = set()
+        blob_root = storage.path(storage.blob_dir)
+        for full_path in self._iter_files(storage.path(path), skip=blob_root):
+            scanned += 1
+            stat = os.stat(full_path)
+            if stat.st_nlink > 1:
+                continue  # already linked to a blob
+            digest = file_sha256(full_path)
+            blob = storage.blob_path(digest)
+            if not os.path.exists(blob) and digest not in dry_run_blobs:
+                if dry_run:
+                    dry_run_blobs.add(digest)
+                else:
+                    storage._makedirs(os.path.dirname(blob))
+                    os.link(full_path, blob)
+                continue
+
+            linked += 1
+            saved += stat.st_size
+            if not dry_run:
+                # Link next to the target first so the swap is a single atomic rename.
+                staged = f'{full_path}.dedupe'
+                os.link(blob, staged)
+                os.replace(staged, full_path)
+
+        pruned = 0
+        if prune:
+            for digest, blob in storage.iter_blobs():
+                if os.stat(blob).st_nlink == 1:
+                    pruned += 1
+                    if not dry_run:
+                        os.remove(blob)
+
+        prefix = "[dry run] " if dry_run else ""
+        self.stdout.write(self.style.SUCCESS(
+            f"{prefix}Scanned {scanned} files, replaced {linked} duplicates "
+            f"({saved} bytes reclaimed), pruned {pruned} unreferenced blobs."
+        ))
+
+    def _iter_files(self, root, skip):
+        # os.scandir keeps memory flat regardless of how many files a directory holds.
+        stack = [root]
+        while stack:
+            with os.scandir(stack.pop()) as entries:
+                for entry in entries:
+                    if entry.path == skip or entry.name.endswith('.dedupe'):
+                        continue
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append(entry.path)
+                    elif entry.is_file(follow_symlinks=False):
+                        yield entry.path
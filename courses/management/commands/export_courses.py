@@ -0,0 +1,28 @@
+import sys
+
+from django.core.management.base import BaseCommand
+
+from courses.exchange import export_jsonl, export_zip
+from courses.models import Course
+
+
+class Command(BaseCommand):
+    help = "Stream courses to a JSON Lines file or, with --zip, a bundle that includes the document files."
+
+    def add_arguments(self, parser):
+        parser.add_argument('output', help="Destination path, or - for stdout.")
+        parser.add_argument('--course', type=int, action='append', dest='course_ids', help="Course id; repeatable.")
+        parser.add_argument('--zip', action='store_true', help="Write a zip bundle with document files.")
+
+    def handle(self, *args, output, course_ids, zip, **options):
+        courses = Course.objects.order_by('id')
+        if course_ids:
+            courses = courses.filter(id__in=course_ids)
+        chunks = export_zip(courses) if zip else (line.encode() for line in export_jsonl(courses))
+        fh = sys.stdout.buffer if output == '-' else open(output, 'wb')
+        try:
+            for chunk in chunks:
+                fh.write(chunk)
+        finally:
+            if fh is not sys.stdout.buffer:
+                fh.close()
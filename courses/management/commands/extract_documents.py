@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from courses.models import TopicDocument
+from courses.search import EXTRACT_BATCH_SIZE, schedule_extraction
+
+
+class Command(BaseCommand):
+    help = (
+        "Queue text extraction for documents that have none yet, such as those uploaded before "
+        "search existed. run_jobs does the extracting; documents already queued are skipped."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=EXTRACT_BATCH_SIZE)
+        parser.add_argument('--all', dest='everything', action='store_true', help="Re-extract every document, not only those without text.")
+
+    def handle(self, *args, batch_size, everything, **options):
+        documents = TopicDocument.objects.exclude(file='') if everything else None
+        count = schedule_extraction(documents, batch_size=batch_size)
+        self.stdout.write(self.style.SUCCESS(f"Queued text extraction for {count} documents"))
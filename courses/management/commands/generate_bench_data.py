@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand
+
+from courses.benchmark import BATCH_SIZE, generate
+
+
+class Command(BaseCommand):
+    help = (
+        "Generate synthetic course trees, users and progress rows for benchmarking. "
+        "The defaults are small; --courses 10000 --parts 10 --topics 10 --users 100000 "
+        "--progress-per-user 100 gives 10k courses, 1M topics and 10M progress rows."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--courses', type=int, default=100)
+        parser.add_argument('--parts', type=int, default=5, help="Parts per course.")
+        parser.add_argument('--topics', type=int, default=10, help="Topics per part.")
+        parser.add_argument('--texts', type=int, default=1, help="Texts per topic.")
+        parser.add_argument('--documents', type=int, default=1, help="Documents per topic.")
+        parser.add_argument('--quizzes', type=int, default=2, help="Quizzes per course.")
+        parser.add_argument('--questions', type=int, default=5, help="Questions per quiz.")
+        parser.add_argument('--answers', type=int, default=4, help="Answers per question.")
+        parser.add_argument('--users', type=int, default=100)
+        parser.add_argument('--progress-per-user', type=int, default=10, help="Courses each user is enrolled in.")
+        parser.add_argument('--completions-per-progress', type=int, default=1, help="Quizzes completed per enrolment.")
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+
+    def handle(self, *args, verbosity, **options):
+        kwargs = {key: options[key] for key in (
+            'courses', 'parts', 'topics', 'texts', 'documents', 'quizzes', 'questions', 'answers', 'users',
+            'progress_per_user', 'completions_per_progress', 'seed', 'batch_size',
+        )}
+        created = generate(**kwargs, log=self.stdout.write if verbosity > 1 else None)
+        self.stdout.write(', '.join(f'{count} {kind}' for kind, count in created.items()))
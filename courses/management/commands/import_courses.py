@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from courses.exchange import BATCH_SIZE, BundleError, import_courses
+
+
+class Command(BaseCommand):
+    help = (
+        "Import courses from a JSON Lines file or zip bundle in a single transaction. "
+        "Courses, parts and topics are matched by title; the rest is added."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+
+    def handle(self, *args, path, batch_size, **options):
+        try:
+            importer = import_courses(path, batch_size=batch_size)
+        except (BundleError, KeyError) as exc:
+            raise CommandError(f'Import failed, nothing was written: {exc}')
+        self.stdout.write(', '.join(f'{count} {kind}' for kind, count in importer.counts.items()))
@@ -0,0 +1,32 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from courses.cleanup import PURGE_BATCH_SIZE, purge_soft_deleted
+
+
+class Command(BaseCommand):
+    help = (
+        "Hard-delete courses, parts, topics, documents and texts soft-deleted longer ago than the "
+        "retention period, queueing their document files for removal. Works in batches; meant to "
+        "run periodically."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days', type=int, default=getattr(settings, 'SOFT_DELETE_RETENTION_DAYS', 30),
+            help="Keep soft-deleted rows restorable for this many days.",
+        )
+        parser.add_argument('--batch-size', type=int, default=PURGE_BATCH_SIZE)
+        parser.add_argument('--dry-run', action='store_true', help="Count expired rows without deleting them.")
+
+    def handle(self, *args, days, batch_size, dry_run, **options):
+        purged = purge_soft_deleted(timezone.now() - timedelta(days=days), batch_size=batch_size, dry_run=dry_run)
+        action = "to purge" if dry_run else "purged"
+        self.stdout.write(self.style.SUCCESS(
+            f"Soft-deleted rows {action}: " + ', '.join(
+                f'{count} {model._meta.verbose_name_plural}' for model, count in purged.items()
+            )
+        ))
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from courses.counters import RECONCILE_BATCH_SIZE, reconcile
+from courses.models import Course, CoursePart, CourseTopic
+
+
+class Command(BaseCommand):
+    help = (
+        "Recount the denormalized counters on courses, parts and topics and fix rows that "
+        "drifted (bulk writes and update() skip the signals that maintain them). Works in batches; "
+        "meant to run periodically."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=RECONCILE_BATCH_SIZE)
+        parser.add_argument('--dry-run', action='store_true', help="Report drifted rows without fixing them.")
+
+    def handle(self, *args, batch_size, dry_run, **options):
+        results = [
+            (model._meta.verbose_name_plural, reconcile(model, batch_size=batch_size, dry_run=dry_run))
+            for model in (CourseTopic, CoursePart, Course)
+        ]
+        action = "found" if dry_run else "fixed"
+        self.stdout.write(self.style.SUCCESS(
+            f"Drifted counters {action}: " + ', '.join(f'{count} {name}' for name, count in results)
+        ))
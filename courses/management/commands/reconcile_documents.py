@@ -0,0 +1,77 @@
+import os
+import time
+
+from django.core.management.base import BaseCommand
+
+from courses.cleanup import unreferenced
+from courses.models import TopicDocument
+from courses.storage import document_storage
+
+
+class Command(BaseCommand):
+    help = (
+        "Reconcile the document storage with TopicDocument.file: remove files no row "
+        "refers to and report rows whose file is missing. Works in fixed-size batches."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--path', default='topic_documents', help="Directory to scan, relative to the storage root.")
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument(
+            '--min-age', type=int, default=3600,
+            help="Only remove files older than this many seconds, so uploads still in flight are left alone.",
+        )
+        parser.add_argument('--dry-run', action='store_true', help="Report orphans without deleting them.")
+        parser.add_argument('--check-missing', action='store_true', help="Also report rows whose file is gone.")
+
+    def handle(self, *args, path, batch_size, min_age, dry_run, check_missing, **options):
+        storage = document_storage()
+        cutoff = time.time() - min_age
+
+        scanned = orphaned = 0
+        for batch in self._batches(self._iter_names(storage, path, cutoff), batch_size):
+            scanned += len(batch)
+            for name in unreferenced(batch):
+                orphaned += 1
+                if dry_run:
+                    self.stdout.write(f"orphan: {name}")
+                else:
+                    storage.delete(name)
+
+        missing = 0
+        if check_missing:
+            rows = TopicDocument.all_objects.exclude(file='').values_list('id', 'file').iterator(chunk_size=batch_size)
+            for pk, name in rows:
+                if not storage.exists(name):
+                    missing += 1
+                    self.stdout.write(f"missing: document {pk} -> {name}")
+
+        action = "found" if dry_run else "removed"
+        self.stdout.write(self.style.SUCCESS(
+            f"Scanned {scanned} files, {action} {orphaned} orphans"
+            + (f", {missing} rows point at missing files." if check_missing else ".")
+        ))
+
+    def _iter_names(self, storage, path, cutoff):
+        # os.scandir streams directory entries, so memory stays flat for millions of files.
+        # ctime, not mtime: hard-linking a new name to an old blob only bumps ctime.
+        stack = [storage.path(path)]
+        while stack:
+            with os.scandir(stack.pop()) as entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append(entry.path)
+                    elif entry.name.endswith('.dedupe'):
+                        continue
+                    elif entry.is_file(follow_symlinks=False) and entry.stat().st_ctime < cutoff:
+                        yield os.path.relpath(entry.path, storage.location).replace('\\', '/')
+
+    def _batches(self, iterable, size):
+        batch = []
+        for item in iterable:
+            batch.append(item)
+            if len(batch) == size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
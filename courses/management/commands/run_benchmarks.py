@@ -0,0 +1,39 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from courses.benchmark import compare, run
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure query counts, p50/p99 latency and peak memory of the main courses paths "
+        "against the current database and write the results as JSON. Write paths are "
+        "rolled back after each iteration. Use --baseline to flag regressions."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', help="Write results to this JSON file instead of stdout.")
+        parser.add_argument('--baseline', help="Earlier results file to compare against.")
+        parser.add_argument('--tolerance', type=float, default=0.2, help="Allowed relative slowdown (0.2 = 20%%).")
+        parser.add_argument('--iterations', type=int, default=20)
+        parser.add_argument('--warmup', type=int, default=2)
+        parser.add_argument('--scenario', action='append', dest='only', help="Only run this scenario; repeatable.")
+        parser.add_argument('--host', default='localhost', help="Host header; must be in ALLOWED_HOSTS.")
+
+    def handle(self, *args, output, baseline, tolerance, iterations, warmup, only, host, verbosity, **options):
+        results = run(iterations, warmup, only, host, log=self.stderr.write if verbosity > 1 else None)
+        text = json.dumps(results, indent=2)
+        if output:
+            with open(output, 'w') as fh:
+                fh.write(text + '\n')
+        else:
+            self.stdout.write(text)
+
+        if baseline:
+            with open(baseline) as fh:
+                regressions = compare(json.load(fh), results, tolerance)
+            for line in regressions:
+                self.stderr.write(f'REGRESSION {line}')
+            if regressions:
+                raise CommandError(f'{len(regressions)} regression(s) against {baseline}')
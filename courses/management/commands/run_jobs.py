@@ -0,0 +1,25 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from courses.jobs import run_pending
+
+
+class Command(BaseCommand):
+    help = "Run queued background jobs (certificate issuance and rendering, ...)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help="Drain the queue once and exit.")
+        parser.add_argument('--batch', type=int, default=20, help="Jobs claimed per round.")
+        parser.add_argument('--sleep', type=float, default=2.0, help="Seconds to wait when the queue is empty.")
+
+    def handle(self, *args, once, batch, sleep, **options):
+        total = 0
+        while True:
+            processed = run_pending(batch)
+            total += processed
+            if not processed:
+                if once:
+                    break
+                time.sleep(sleep)
+        self.stdout.write(self.style.SUCCESS(f"Processed {total} jobs."))
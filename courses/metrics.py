@@ -0,0 +1,218 @@
+"""
+Per-view request metrics.
+
+``RequestMetricsMiddleware`` times every request, counts and times its queries
+through ``execute_wrapper`` and notes SQL that ran more than once (the
+signature of an N+1 loop). Results are aggregated per URL name in this
+process, exposed in the Prometheus text format by ``views.metrics``, and written
+as one JSON log line per request to the ``courses.metrics`` logger.
+Each worker process keeps its own counters, so scrape every worker.
+"""
+import bisect
+import json
+import logging
+import threading
+import time
+from collections import Counter
+from contextlib import ExitStack
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (1024, 10 * 1024, 100 * 1024, 1024 ** 2, 10 * 1024 ** 2, 100 * 1024 ** 2)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+SQL_LOG_LENGTH = 200
+DUPLICATE_QUERY_WARNING = 10
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def samples(self, name, labels):
+        cumulative = 0
+        for bound, count in zip((*self.buckets, '+Inf'), self.counts):
+            cumulative += count
+            yield f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}'
+        yield f'{name}_sum{{{labels}}} {self.sum}'
+        yield f'{name}_count{{{labels}}} {self.count}'
+
+
+class ViewMetrics:
+    def __init__(self):
+        self.latency = Histogram(LATENCY_BUCKETS)
+        self.response_size = Histogram(SIZE_BUCKETS)
+        self.queries = Histogram(QUERY_COUNT_BUCKETS)
+        self.query_seconds = 0.0
+        self.duplicate_queries = 0
+        self.statuses = Counter()
+
+
+class Registry:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.views = {}  # (view name, method) -> ViewMetrics
+
+    def record(self, sample):
+        key = (sample['view'], sample['method'])
+        with self.lock:
+            metrics = self.views.get(key)
+            if metrics is None:
+                metrics = self.views[key] = ViewMetrics()
+            metrics.latency.observe(sample['duration_ms'] / 1000)
+            metrics.queries.observe(sample['queries'])
+            metrics.query_seconds += sample['query_ms'] / 1000
+            metrics.duplicate_queries += sample['duplicate_queries']
+            metrics.statuses[sample['status']] += 1
+            if sample['bytes'] is not None:
+                metrics.response_size.observe(sample['bytes'])
+
+    def reset(self):
+        with self.lock:
+            self.views = {}
+
+    def render(self):
+        series = {
+            'courses_http_requests_total': ('counter', []),
+            'courses_http_request_duration_seconds': ('histogram', []),
+            'courses_http_response_size_bytes': ('histogram', []),
+            'courses_db_queries_per_request': ('histogram', []),
+            'courses_db_query_duration_seconds_total': ('counter', []),
+            'courses_db_duplicate_queries_total': ('counter', []),
+        }
+        with self.lock:
+            for (view, method), metrics in sorted(self.views.items()):
+                labels = f'view="{_escape(view)}",method="{method}"'
+                for status, count in sorted(metrics.statuses.items()):
+                    series['courses_http_requests_total'][1].append(
+                        f'courses_http_requests_total{{{labels},status="{status}"}} {count}'
+                    )
+                for name, histogram in (
+                    ('courses_http_request_duration_seconds', metrics.latency),
+                    ('courses_http_response_size_bytes', metrics.response_size),
+                    ('courses_db_queries_per_request', metrics.queries),
+                ):
+                    series[name][1].extend(histogram.samples(name, labels))
+                series['courses_db_query_duration_seconds_total'][1].append(
+                    f'courses_db_query_duration_seconds_total{{{labels}}} {metrics.query_seconds}'
+                )
+                series['courses_db_duplicate_queries_total'][1].append(
+                    f'courses_db_duplicate_queries_total{{{labels}}} {metrics.duplicate_queries}'
+                )
+        lines = []
+        for name, (kind, samples) in series.items():
+            lines.append(f'# TYPE {name} {kind}')
+            lines.extend(samples)
+        return '\n'.join(lines) + '\n'
+
+
+def _escape(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"')
+
+
+registry = Registry()
+
+
+class QueryTracker:
+    """``execute_wrapper`` hook: counts, times and fingerprints the queries of one request."""
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.statements = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.seconds += time.perf_counter() - started
+            self.count += 1
+            # Parameters are not part of the SQL, so an N+1 loop repeats the same string.
+            self.statements[sql] += 1
+
+    def duplicates(self):
+        return sum(count - 1 for count in self.statements.values() if count > 1)
+
+    def most_repeated(self):
+        sql, count = self.statements.most_common(1)[0] if self.statements else ('', 0)
+        return (sql[:SQL_LOG_LENGTH], count) if count > 1 else (None, 0)
+
+
+def _track_queries(stack, tracker):
+    for connection in connections.all():
+        stack.enter_context(connection.execute_wrapper(tracker))
+
+
+def _response_size(response):
+    if not response.streaming:
+        return len(response.content)
+    length = response.get('Content-Length')
+    return int(length) if length else None
+
+
+class RequestMetricsMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        tracker = QueryTracker()
+        started = time.perf_counter()
+        with ExitStack() as stack:
+            _track_queries(stack, tracker)
+            response = self.get_response(request)
+        self._record(request, response, tracker, time.perf_counter() - started)
+        return response
+
+    async def __acall__(self, request):
+        tracker = QueryTracker()
+        started = time.perf_counter()
+        stack = ExitStack()
+        # Connections belong to a thread: hook the one the async ORM's sync_to_async calls use.
+        await sync_to_async(_track_queries)(stack, tracker)
+        try:
+            response = await self.get_response(request)
+        finally:
+            await sync_to_async(stack.close)()
+        self._record(request, response, tracker, time.perf_counter() - started)
+        return response
+
+    def _record(self, request, response, tracker, duration):
+        match = request.resolver_match
+        sample = {
+            'view': match.view_name if match else '<unresolved>',
+            'method': request.method,
+            'status': response.status_code,
+            'duration_ms': round(duration * 1000, 2),
+            'queries': tracker.count,
+            'query_ms': round(tracker.seconds * 1000, 2),
+            'duplicate_queries': tracker.duplicates(),
+            'bytes': _response_size(response),
+        }
+        registry.record(sample)
+        # Requests that repeat a statement this often are likely N+1 loops and log as warnings.
+        level = logging.WARNING if sample['duplicate_queries'] >= DUPLICATE_QUERY_WARNING else logging.INFO
+        if logger.isEnabledFor(level):
+            sql, repeats = tracker.most_repeated()
+            if sql:
+                sample['most_repeated_sql'] = sql
+                sample['most_repeated_count'] = repeats
+            logger.log(level, json.dumps(sample))
@@ -0,0 +1,19 @@
+# Generated by Django 5.1.4 on 2026-10-18 08:40
+
+import courses.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0002_document_upload'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='topicdocument',
+            name='file',
+            field=models.FileField(storage=courses.storage.document_storage, upload_to='topic_documents/'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.4 on 2026-10-18 08:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0003_document_storage'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='topicdocument',
+            name='sha256',
+            field=models.CharField(blank=True, editable=False, max_length=64),
+        ),
+    ]
@@ -0,0 +1,85 @@
+# Generated by Django 5.1.4 on 2026-10-18 08:44
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.utils.dateparse import parse_datetime
+
+BATCH_SIZE = 2000
+
+
+def _completion_fields(value, default_completed_at):
+    # completed_quizzes maps quiz id -> score, True, or {"score": ..., "completed_at": ...}.
+    score, completed_at = None, None
+    if isinstance(value, dict):
+        score, completed_at = value.get('score'), value.get('completed_at')
+    elif isinstance(value, (int, float)) and not isinstance(value, bool):
+        score = value
+    elif not value:
+        return None
+    completed_at = parse_datetime(completed_at) if isinstance(completed_at, str) else None
+    return score, completed_at or default_completed_at
+
+
+def backfill_completions(apps, schema_editor):
+    UserProgress = apps.get_model('courses', 'UserProgress')
+    Quiz = apps.get_model('courses', 'Quiz')
+    QuizCompletion = apps.get_model('courses', 'QuizCompletion')
+
+    def flush(batch):
+        quiz_ids = {quiz_id for _, quiz_id, _ in batch}
+        course_of = dict(Quiz.objects.filter(id__in=quiz_ids).values_list('id', 'course_id'))
+        QuizCompletion.objects.bulk_create(
+            [
+                QuizCompletion(user_id=progress.user_id, quiz_id=quiz_id, course_id=course_of[quiz_id],
+                               score=fields[0], completed_at=fields[1])
+                for progress, quiz_id, fields in batch
+                if course_of.get(quiz_id) == progress.course_id
+            ],
+            ignore_conflicts=True,
+        )
+
+    batch = []
+    progress_rows = UserProgress.objects.only('user_id', 'course_id', 'completed_quizzes', 'updated_at')
+    for progress in progress_rows.iterator(chunk_size=BATCH_SIZE):
+        for key, value in (progress.completed_quizzes or {}).items():
+            fields = _completion_fields(value, progress.updated_at)
+            if fields is None or not str(key).isdigit():
+                continue
+            batch.append((progress, int(key), fields))
+        if len(batch) >= BATCH_SIZE:
+            flush(batch)
+            batch = []
+    if batch:
+        flush(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0004_document_sha256'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='QuizCompletion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('deleted_at', models.DateTimeField(blank=True, null=True)),
+                ('score', models.FloatField(blank=True, null=True)),
+                ('completed_at', models.DateTimeField()),
+                ('course', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='quiz_completions', to='courses.course')),
+                ('created_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL)),
+                ('quiz', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='completions', to='courses.quiz')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='quiz_completions', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['quiz', 'completed_at'], name='quizcompl_quiz_completed_idx'), models.Index(fields=['course', 'user'], name='quizcompl_course_user_idx')],
+                'unique_together': {('user', 'quiz')},
+            },
+        ),
+        migrations.RunPython(backfill_completions, migrations.RunPython.noop),
+    ]
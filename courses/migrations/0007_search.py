@@ -0,0 +1,81 @@
+# Generated by Django 5.1.4 on 2026-10-18 08:49
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.conf import settings
+from django.contrib.postgres.search import SearchVector
+from django.db import migrations, models
+
+import courses.operations
+
+VECTORS = {
+    'Course': [('title', 'A'), ('description', 'B')],
+    'TopicDocument': [('name', 'A'), ('text_content', 'C')],
+    'TopicText': [('text', 'B')],
+    'QuizQuestion': [('text', 'B')],
+}
+
+
+def backfill_search_vectors(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    config = getattr(settings, 'SEARCH_CONFIG', 'english')
+    for model_name, fields in VECTORS.items():
+        vector = None
+        for field, weight in fields:
+            part = SearchVector(field, weight=weight, config=config)
+            vector = part if vector is None else vector + part
+        apps.get_model('courses', model_name).objects.update(search_vector=vector)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0006_jobs_and_certificate_pdf'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='course',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='quizquestion',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='topicdocument',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='topicdocument',
+            name='text_content',
+            field=models.TextField(blank=True, editable=False),
+        ),
+        migrations.AddField(
+            model_name='topictext',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        courses.operations.PostgresOnly(migrations.AddIndex(
+            model_name='course',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='course_search_idx'),
+        )),
+        courses.operations.PostgresOnly(migrations.AddIndex(
+            model_name='quizquestion',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='quizquestion_search_idx'),
+        )),
+        courses.operations.PostgresOnly(migrations.AddIndex(
+            model_name='topicdocument',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='topicdocument_search_idx'),
+        )),
+        courses.operations.PostgresOnly(migrations.AddIndex(
+            model_name='topictext',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='topictext_search_idx'),
+        )),
+        migrations.RunPython(backfill_search_vectors, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,51 @@
+# Generated by Django 5.1.4 on 2026-10-18 08:52
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0007_search'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='coursepart',
+            index=models.Index(condition=models.Q(('deleted_at__isnull', True)), fields=['course'], name='coursepart_live_course_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='coursetopic',
+            index=models.Index(condition=models.Q(('deleted_at__isnull', True)), fields=['part'], name='coursetopic_live_part_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='quiz',
+            index=models.Index(condition=models.Q(('deleted_at__isnull', True)), fields=['course'], name='quiz_live_course_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='quizanswer',
+            index=models.Index(condition=models.Q(('deleted_at__isnull', True)), fields=['question'], name='quizanswer_live_question_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='quizquestion',
+            index=models.Index(condition=models.Q(('deleted_at__isnull', True)), fields=['quiz'], name='quizquestion_live_quiz_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='topicdocument',
+            index=models.Index(condition=models.Q(('deleted_at__isnull', True)), fields=['topic', 'created_at'], name='topicdoc_live_topic_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='topicdocument',
+            index=models.Index(condition=models.Q(('deleted_at__isnull', True)), fields=['created_at', 'id'], name='topicdoc_live_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='topictext',
+            index=models.Index(condition=models.Q(('deleted_at__isnull', True)), fields=['topic'], name='topictext_live_topic_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='userprogress',
+            index=models.Index(condition=models.Q(('deleted_at__isnull', True)), fields=['course'], name='userprogress_live_course_idx'),
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 5.1.4 on 2026-10-18 12:40
+
+from django.conf import settings
+from django.db import migrations, models
+
+import courses.operations
+
+
+class Migration(migrations.Migration):
+    # CREATE/DROP INDEX CONCURRENTLY cannot run inside a transaction.
+    atomic = False
+
+    dependencies = [
+        ('courses', '0008_soft_delete_partial_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        courses.operations.AddIndexConcurrently(
+            model_name='topicdocument',
+            index=models.Index(condition=models.Q(('deleted_at__isnull', True)), fields=['topic', 'created_at', 'id'], include=('name',), name='topicdoc_live_topic_cover_idx'),
+        ),
+        courses.operations.RemoveIndexConcurrently(
+            model_name='topicdocument',
+            name='topicdoc_live_topic_idx',
+        ),
+        courses.operations.AddIndexConcurrently(
+            model_name='topicdocument',
+            index=models.Index(condition=models.Q(('deleted_at__isnull', True)), fields=['created_at', 'id'], include=('name', 'file', 'topic'), name='topicdoc_live_listing_idx'),
+        ),
+        courses.operations.RemoveIndexConcurrently(
+            model_name='topicdocument',
+            name='topicdoc_live_created_idx',
+        ),
+        courses.operations.AddIndexConcurrently(
+            model_name='userprogress',
+            index=models.Index(condition=models.Q(('deleted_at__isnull', True)), fields=['user', '-updated_at'], include=('course',), name='userprogress_live_user_idx'),
+        ),
+        courses.operations.AddIndexConcurrently(
+            model_name='certificate',
+            index=models.Index(condition=models.Q(('deleted_at__isnull', True)), fields=['course', '-created_at'], include=('user',), name='certificate_live_course_idx'),
+        ),
+    ]
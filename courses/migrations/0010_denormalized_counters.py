@@ -0,0 +1,94 @@
+# Generated by Django 5.1.4 on 2026-10-18 12:55
+
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def _live_count(model, lookup, **filters):
+    counts = (
+        model.objects.filter(deleted_at__isnull=True, **filters, **{lookup: OuterRef('pk')})
+        .order_by().values(lookup).annotate(n=Count('pk')).values('n')
+    )
+    return Coalesce(Subquery(counts, output_field=IntegerField()), 0)
+
+
+def backfill_counters(apps, schema_editor):
+    # The counts courses.counters maintains, spelled out for the historical models.
+    Course, CoursePart, CourseTopic, TopicDocument, TopicText, UserProgress, Certificate = (
+        apps.get_model('courses', name)
+        for name in ('Course', 'CoursePart', 'CourseTopic', 'TopicDocument', 'TopicText', 'UserProgress', 'Certificate')
+    )
+    CourseTopic.objects.update(
+        document_count=_live_count(TopicDocument, 'topic'),
+        text_count=_live_count(TopicText, 'topic'),
+    )
+    CoursePart.objects.update(
+        topic_count=_live_count(CourseTopic, 'part'),
+        document_count=_live_count(TopicDocument, 'topic__part', topic__deleted_at__isnull=True),
+    )
+    Course.objects.update(
+        part_count=_live_count(CoursePart, 'course'),
+        topic_count=_live_count(CourseTopic, 'part__course', part__deleted_at__isnull=True),
+        document_count=_live_count(
+            TopicDocument, 'topic__part__course', topic__deleted_at__isnull=True, topic__part__deleted_at__isnull=True,
+        ),
+        enrolled_count=_live_count(UserProgress, 'course'),
+        certificate_count=_live_count(Certificate, 'course'),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0009_covering_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='course',
+            name='certificate_count',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='course',
+            name='document_count',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='course',
+            name='enrolled_count',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='course',
+            name='part_count',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='course',
+            name='topic_count',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='coursepart',
+            name='document_count',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='coursepart',
+            name='topic_count',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='coursetopic',
+            name='document_count',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='coursetopic',
+            name='text_count',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(backfill_counters, migrations.RunPython.noop),
+    ]
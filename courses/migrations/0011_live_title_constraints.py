@@ -0,0 +1,40 @@
+# Generated by Django 5.1.4 on 2026-10-18 13:10
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0010_denormalized_counters'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AlterUniqueTogether(
+            name='coursepart',
+            unique_together=set(),
+        ),
+        migrations.AlterUniqueTogether(
+            name='coursetopic',
+            unique_together=set(),
+        ),
+        migrations.AlterField(
+            model_name='course',
+            name='title',
+            field=models.CharField(max_length=255),
+        ),
+        migrations.AddConstraint(
+            model_name='course',
+            constraint=models.UniqueConstraint(condition=models.Q(('deleted_at__isnull', True)), fields=('title',), name='course_live_title_uniq', violation_error_message='A course with this title already exists.'),
+        ),
+        migrations.AddConstraint(
+            model_name='coursepart',
+            constraint=models.UniqueConstraint(condition=models.Q(('deleted_at__isnull', True)), fields=('course', 'title'), name='coursepart_live_title_uniq', violation_error_message='This course already has a part with this title.'),
+        ),
+        migrations.AddConstraint(
+            model_name='coursetopic',
+            constraint=models.UniqueConstraint(condition=models.Q(('deleted_at__isnull', True)), fields=('part', 'title'), name='coursetopic_live_title_uniq', violation_error_message='This part already has a topic with this title.'),
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 5.1.4 on 2026-10-18 13:30
+
+from django.db import migrations
+from django.utils import timezone
+
+from courses.jobs import dedupe_key
+
+EXTRACT_DOCUMENT_TEXT = 'extract_document_text'
+BATCH_SIZE = 1000
+
+
+def queue_extraction(apps, schema_editor):
+    # Documents uploaded before 0007 were never extracted; the extract_documents command does the same later on.
+    TopicDocument = apps.get_model('courses', 'TopicDocument')
+    Job = apps.get_model('courses', 'Job')
+    now = timezone.now()
+    ids = (
+        TopicDocument.objects.filter(deleted_at__isnull=True, text_content='').exclude(file='')
+        .order_by('pk').values_list('pk', flat=True)
+    )
+    batch = []
+    for pk in ids.iterator(chunk_size=BATCH_SIZE):
+        payload = {'document_id': pk}
+        batch.append(Job(kind=EXTRACT_DOCUMENT_TEXT, payload=payload, run_after=now,
+                         dedupe_key=dedupe_key(EXTRACT_DOCUMENT_TEXT, payload)))
+        if len(batch) == BATCH_SIZE:
+            Job.objects.bulk_create(batch, ignore_conflicts=True)
+            batch = []
+    Job.objects.bulk_create(batch, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0012_job_dedupe_key'),
+    ]
+
+    operations = [
+        migrations.RunPython(queue_extraction, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 5.1.4 on 2026-10-18 10:04
+
+import courses.models
+import courses.storage
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0013_queue_document_extraction'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='topicdocument',
+            name='file',
+            field=courses.models.DocumentFileField(storage=courses.storage.document_storage, upload_to='topic_documents/'),
+        ),
+    ]
@@ -1,5 +1,42 @@
-from django.db import models
+import math
+import uuid
+
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
+from django.db import models, transaction
+from django.db.models import Count, IntegerField, OuterRef, Q, Subquery, Sum
+from django.db.models.fields.files import FieldFile
+from django.db.models.functions import Coalesce
 from django.contrib.auth.models import User
+from django.dispatch import Signal
+from django.utils import timezone
+
+from .storage import document_storage
+
+# Sent after BaseModel.soft_delete() / restore(), like post_delete / post_save.
+soft_deleted = Signal()
+restored = Signal()
+
+LIVE = Q(deleted_at__isnull=True)
+
+class SoftDeleteQuerySet(models.QuerySet):
+    def alive(self):
+        return self.filter(deleted_at__isnull=True)
+
+    def dead(self):
+        return self.filter(deleted_at__isnull=False)
+
+    def soft_delete(self):
+        # Set-based like update(): no cascade and no signals.
+        now = timezone.now()
+        return self.filter(deleted_at__isnull=True).update(deleted_at=now, updated_at=now)
+
+    def restore(self):
+        return self.update(deleted_at=None, updated_at=timezone.now())
+
+class LiveManager(models.Manager):
+    def get_queryset(self):
+        return super().get_queryset().filter(deleted_at__isnull=True)
 
 class BaseModel(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
@@ -7,21 +44,173 @@ class BaseModel(models.Model):
     deleted_at = models.DateTimeField( null=True, blank=True)
     created_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True)
 
+    # objects must stay declared before all_objects: the first manager is the default one.
+    objects = LiveManager.from_queryset(SoftDeleteQuerySet)()
+    all_objects = SoftDeleteQuerySet.as_manager()
+
+    # (model name, lookup to this row) pairs soft-deleted and restored along with it.
+    soft_delete_cascade = ()
+    # Parent foreign keys (attnames) whose loaded values moved_from() keeps, so
+    # post_save handlers can tell a row moved and update the parent it left.
+    tracked_parents = ()
+
     class Meta:
         abstract = True
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._remember_parents()
+        return instance
+
+    def save(self, *args, **kwargs):
+        counters = getattr(self, 'COUNTERS', ())
+        if counters and not self._state.adding and not args and kwargs.get('update_fields') is None:
+            # Counters move with F() in the database; a stale copy must not write them back.
+            skip = {*counters, *self.get_deferred_fields()}
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in skip and field.attname not in skip
+            ]
+        super().save(*args, **kwargs)
+        self._remember_parents()
+
+    def _remember_parents(self):
+        # __dict__ rather than getattr: a deferred key must not cost a query.
+        self._loaded_parents = {name: self.__dict__.get(name) for name in self.tracked_parents}
+
+    def moved_from(self, attname):
+        """The parent ``attname`` held when loaded or last saved, if it has changed since."""
+        previous = getattr(self, '_loaded_parents', {}).get(attname)
+        return previous if previous is not None and previous != getattr(self, attname) else None
+
+    def validate_constraints(self, exclude=None):
+        # Forms never include deleted_at, and Django skips a conditional constraint
+        # whose condition reads an excluded field; the live-row ones all do.
+        if exclude:
+            exclude = set(exclude) - {'deleted_at'}
+        super().validate_constraints(exclude=exclude)
+
+    def _cascade_querysets(self):
+        for model_name, lookup in self.soft_delete_cascade:
+            model = self._meta.apps.get_model(self._meta.app_label, model_name)
+            yield model.all_objects.filter(**{lookup: self.pk})
+
+    def soft_delete(self):
+        """Mark this row and its cascade deleted with one UPDATE per model; a no-op if it already is."""
+        now = timezone.now()
+        with transaction.atomic():
+            # updated_at moves too: hiding the row is a change to it like any other.
+            row = type(self).all_objects.filter(pk=self.pk, deleted_at__isnull=True)
+            if not row.update(deleted_at=now, updated_at=now):
+                return
+            for queryset in self._cascade_querysets():
+                queryset.filter(deleted_at__isnull=True).update(deleted_at=now, updated_at=now)
+        self.deleted_at = self.updated_at = now
+        soft_deleted.send(sender=type(self), instance=self)
+
+    def restore(self):
+        """Undo soft_delete(); children deleted separately before it stay deleted."""
+        if self.deleted_at is None:
+            return
+        # A live row may have taken the title meanwhile; say so instead of hitting the constraint.
+        deleted_at, self.deleted_at = self.deleted_at, None
+        try:
+            self.validate_constraints()
+        finally:
+            self.deleted_at = deleted_at
+        now = timezone.now()
+        with transaction.atomic():
+            type(self).all_objects.filter(pk=self.pk).update(deleted_at=None, updated_at=now)
+            for queryset in self._cascade_querysets():
+                queryset.filter(deleted_at=self.deleted_at).update(deleted_at=None, updated_at=now)
+        self.deleted_at = None
+        self.updated_at = now
+        restored.send(sender=type(self), instance=self)
+
+class SubqueryCount(Subquery):
+    # COUNT(*) over a grouped subquery, which .count() cannot express inside an annotation.
+    template = '(SELECT COUNT(*) FROM (%(subquery)s) _count)'
+    output_field = IntegerField()
+
+class CourseQuerySet(SoftDeleteQuerySet):
+    def with_completion_stats(self):
+        # enrolled_count is a maintained column now.
+        quiz_count = Quiz.objects.filter(course=OuterRef('pk')).values('course').annotate(n=Count('id')).values('n')
+        completed = QuizCompletion.objects.filter(course=OuterRef('pk')).eligible_for_certificate()
+        return self.annotate(
+            quiz_count=Coalesce(Subquery(quiz_count, output_field=IntegerField()), 0),
+            completed_count=SubqueryCount(completed),
+        )
+
+    def for_catalog(self):
+        # Counters are columns (see courses.counters), so this reads the course table alone.
+        return self.only('id', 'title', *Course.COUNTERS).order_by('title')
+
 class Course(BaseModel):
-    title = models.CharField(max_length=255, unique=True)
+    title = models.CharField(max_length=255)
     description = models.TextField()
+    search_vector = SearchVectorField(null=True, editable=False)
+    # Live rows below, maintained by courses.counters.
+    part_count = models.IntegerField(default=0, editable=False)
+    topic_count = models.IntegerField(default=0, editable=False)
+    document_count = models.IntegerField(default=0, editable=False)
+    enrolled_count = models.IntegerField(default=0, editable=False)
+    certificate_count = models.IntegerField(default=0, editable=False)
+
+    COUNTERS = ('part_count', 'topic_count', 'document_count', 'enrolled_count', 'certificate_count')
+
+    objects = LiveManager.from_queryset(CourseQuerySet)()
+    all_objects = CourseQuerySet.as_manager()
+
+    soft_delete_cascade = (
+        ('CoursePart', 'course'),
+        ('CourseTopic', 'part__course'),
+        ('TopicDocument', 'topic__part__course'),
+        ('TopicText', 'topic__part__course'),
+    )
+
+    class Meta:
+        # Unique among live rows only, so a soft-deleted course's title can be reused.
+        constraints = [
+            models.UniqueConstraint(
+                fields=['title'], condition=LIVE, name='course_live_title_uniq',
+                violation_error_message='A course with this title already exists.',
+            ),
+        ]
+        indexes = [GinIndex(fields=['search_vector'], name='course_search_idx')]
+
     def __str__(self):
         return self.title
 
+    @property
+    def completion_percent(self):
+        """Share of enrolled learners holding a certificate."""
+        return round(100 * self.certificate_count / self.enrolled_count) if self.enrolled_count else 0
+
 class CoursePart(BaseModel):
     course = models.ForeignKey(Course, related_name='parts', on_delete=models.CASCADE)
     title = models.CharField(max_length=255)
+    topic_count = models.IntegerField(default=0, editable=False)
+    document_count = models.IntegerField(default=0, editable=False)
+
+    COUNTERS = ('topic_count', 'document_count')
+
+    tracked_parents = ('course_id',)
+    soft_delete_cascade = (
+        ('CourseTopic', 'part'),
+        ('TopicDocument', 'topic__part'),
+        ('TopicText', 'topic__part'),
+    )
 
     class Meta:
-        unique_together = ('course', 'title')
+        constraints = [
+            models.UniqueConstraint(
+                fields=['course', 'title'], condition=LIVE, name='coursepart_live_title_uniq',
+                violation_error_message='This course already has a part with this title.',
+            ),
+        ]
+        indexes = [models.Index(fields=['course'], condition=LIVE, name='coursepart_live_course_idx')]
 
     def __str__(self):
         return f"{self.course.title}-{self.title}"
@@ -29,24 +218,143 @@ class CoursePart(BaseModel):
 class CourseTopic(BaseModel):
     part = models.ForeignKey(CoursePart, related_name='topics', on_delete=models.CASCADE)
     title = models.CharField(max_length=255)
+    document_count = models.IntegerField(default=0, editable=False)
+    text_count = models.IntegerField(default=0, editable=False)
+
+    COUNTERS = ('document_count', 'text_count')
+
+    tracked_parents = ('part_id',)
+    soft_delete_cascade = (
+        ('TopicDocument', 'topic'),
+        ('TopicText', 'topic'),
+    )
 
     class Meta:
-        unique_together = ('part', 'title')
+        constraints = [
+            models.UniqueConstraint(
+                fields=['part', 'title'], condition=LIVE, name='coursetopic_live_title_uniq',
+                violation_error_message='This part already has a topic with this title.',
+            ),
+        ]
+        indexes = [models.Index(fields=['part'], condition=LIVE, name='coursetopic_live_part_idx')]
 
     def __str__(self):
         return f"{self.part.title}-{self.title}"
 
+class TopicDocumentQuerySet(SoftDeleteQuerySet):
+    def for_listing(self):
+        return self.select_related('topic__part__course').only(
+            'id', 'name', 'file', 'created_at',
+            'topic__title', 'topic__part__title', 'topic__part__course__title',
+        )
+
+
+class DocumentFieldFile(FieldFile):
+    def save(self, name, content, save=True):
+        super().save(name, content, save=False)
+        # ContentAddressedStorage leaves the digest it stored the bytes under on the content.
+        self.instance.sha256 = getattr(content, 'sha256', None) or ''
+        self.instance._hashed_file_name = self.name
+        if save:
+            self.instance.save()
+
+
+class DocumentFileField(models.FileField):
+    attr_class = DocumentFieldFile
+
+
 class TopicDocument(BaseModel):
     topic = models.ForeignKey(CourseTopic, related_name='documents', on_delete=models.CASCADE)
     name = models.CharField(max_length=255)
-    file = models.FileField(upload_to='topic_documents/')
+    file = DocumentFileField(upload_to='topic_documents/', storage=document_storage)
+    sha256 = models.CharField(max_length=64, blank=True, editable=False)
+    # Plain text pulled out of the file by the extract_document_text job, for search.
+    text_content = models.TextField(blank=True, editable=False)
+    search_vector = SearchVectorField(null=True, editable=False)
+
+    objects = LiveManager.from_queryset(TopicDocumentQuerySet)()
+    all_objects = TopicDocumentQuerySet.as_manager()
+
+    tracked_parents = ('topic_id',)
+
+    class Meta:
+        indexes = [
+            GinIndex(fields=['search_vector'], name='topicdocument_search_idx'),
+            # Covering: the outline reads a topic's documents, and the document list
+            # pages through all of them, from the index alone on PostgreSQL.
+            models.Index(
+                fields=['topic', 'created_at', 'id'], include=['name'], condition=LIVE,
+                name='topicdoc_live_topic_cover_idx',
+            ),
+            models.Index(
+                fields=['created_at', 'id'], include=['name', 'file', 'topic'], condition=LIVE,
+                name='topicdoc_live_listing_idx',
+            ),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        if 'file' in field_names:
+            instance._loaded_file_name = values[field_names.index('file')]
+        return instance
+
+    def save(self, *args, **kwargs):
+        # A replaced file has not been indexed yet; its text is filled in later.
+        self.replaced_file_name = None
+        if self._state.adding:
+            self.file_changed = bool(self.file)
+        else:
+            previous = getattr(self, '_loaded_file_name', self.file.name)
+            self.file_changed = not self.file._committed or self.file.name != previous
+            if self.file_changed:
+                self.text_content = ''
+                self.replaced_file_name = previous
+        if self.file and not self.file._committed:
+            # Stored here rather than in pre_save, so the digest lands in the same write.
+            self.file.save(self.file.name, self.file.file, save=False)
+        elif self.file_changed and self.file.name != getattr(self, '_hashed_file_name', None):
+            self.sha256 = ''  # a stored name was assigned; the extract job hashes it
+        super().save(*args, **kwargs)
+        self._loaded_file_name = self.file.name
 
     def __str__(self):
         return self.name
 
+class DocumentUpload(BaseModel):
+    token = models.UUIDField(default=uuid.uuid4, unique=True, editable=False)
+    topic = models.ForeignKey(CourseTopic, related_name='uploads', on_delete=models.CASCADE)
+    name = models.CharField(max_length=255)
+    filename = models.CharField(max_length=255)
+    size = models.PositiveBigIntegerField()
+    chunk_size = models.PositiveIntegerField()
+    sha256 = models.CharField(max_length=64, blank=True)
+    document = models.OneToOneField(TopicDocument, related_name='upload', null=True, blank=True, on_delete=models.SET_NULL)
+
+    @property
+    def chunk_count(self):
+        return math.ceil(self.size / self.chunk_size)
+
+    def expected_chunk_size(self, index):
+        if index == self.chunk_count - 1:
+            return self.size - self.chunk_size * index
+        return self.chunk_size
+
+    def __str__(self):
+        return f"Upload of {self.filename}"
+
 class TopicText(BaseModel):
     topic = models.ForeignKey(CourseTopic, related_name='texts', on_delete=models.CASCADE)
     text = models.TextField()
+    search_vector = SearchVectorField(null=True, editable=False)
+
+    tracked_parents = ('topic_id',)
+
+    class Meta:
+        indexes = [
+            GinIndex(fields=['search_vector'], name='topictext_search_idx'),
+            models.Index(fields=['topic'], condition=LIVE, name='topictext_live_topic_idx'),
+        ]
 
     def __str__(self):
         return f"Text for {self.topic.title}"
@@ -55,12 +363,24 @@ class Quiz(BaseModel):
     course = models.ForeignKey(Course, related_name='quizzes', on_delete=models.CASCADE)
     title = models.TextField()
 
+    class Meta:
+        indexes = [models.Index(fields=['course'], condition=LIVE, name='quiz_live_course_idx')]
+
     def __str__(self):
         return f"{self.course.title}-{self.title}"
 
 class QuizQuestion(BaseModel):
     quiz = models.ForeignKey(Quiz, related_name='questions', on_delete=models.CASCADE)
     text = models.TextField()
+    search_vector = SearchVectorField(null=True, editable=False)
+
+    tracked_parents = ('quiz_id',)
+
+    class Meta:
+        indexes = [
+            GinIndex(fields=['search_vector'], name='quizquestion_search_idx'),
+            models.Index(fields=['quiz'], condition=LIVE, name='quizquestion_live_quiz_idx'),
+        ]
 
     def __str__(self):
         return f"Question in {self.quiz.title}"
@@ -70,6 +390,11 @@ class QuizAnswer(BaseModel):
     text = models.TextField()
     is_correct = models.BooleanField()
 
+    tracked_parents = ('question_id',)
+
+    class Meta:
+        indexes = [models.Index(fields=['question'], condition=LIVE, name='quizanswer_live_question_idx')]
+
     def __str__(self):
         return f"Answer in {self.question.text}"
 
@@ -80,6 +405,13 @@ class UserProgress(BaseModel):
 
     class Meta:
         unique_together = ('user', 'course')
+        indexes = [
+            models.Index(fields=['course'], condition=LIVE, name='userprogress_live_course_idx'),
+            # A learner's courses, most recently active first; (user, course) lookups use the unique index.
+            models.Index(
+                fields=['user', '-updated_at'], include=['course'], condition=LIVE, name='userprogress_live_user_idx',
+            ),
+        ]
 
     def __str__(self):
         return f"Progress for {self.user.username} in {self.course.title}"
@@ -87,15 +419,88 @@ class UserProgress(BaseModel):
 class Certificate(BaseModel):
     user = models.ForeignKey(User, related_name='certificates', on_delete=models.CASCADE)
     course = models.ForeignKey(Course, related_name='certificates', null=True, on_delete=models.SET_NULL)
+    pdf = models.FileField(upload_to='certificates/', blank=True)
 
     class Meta:
         unique_together = ('user', 'course')
+        indexes = [
+            models.Index(
+                fields=['course', '-created_at'], include=['user'], condition=LIVE,
+                name='certificate_live_course_idx',
+            ),
+        ]
 
     def __str__(self):
         return f"Certificate for {self.user.username} in {self.course.title}"
 
+class QuizCompletionQuerySet(SoftDeleteQuerySet):
+    def leaderboard(self, course_id, limit=10):
+        return (
+            self.filter(course_id=course_id)
+            .values('user_id', 'user__username')
+            .annotate(completed=Count('id'), total_score=Sum('score'))
+            .order_by('-completed', '-total_score', 'user_id')[:limit]
+        )
 
+    def eligible_for_certificate(self):
+        """``(user_id, course_id)`` rows for users who completed every quiz of a course."""
+        quiz_count = Quiz.objects.filter(course=OuterRef('course')).values('course').annotate(n=Count('id')).values('n')
+        return (
+            # Completions of soft-deleted quizzes count no more than the quizzes do.
+            self.filter(quiz__deleted_at__isnull=True)
+            .values('user_id', 'course_id')
+            .annotate(completed=Count('quiz'))
+            .filter(completed=Subquery(quiz_count))
+            .order_by()
+        )
 
+class QuizCompletion(BaseModel):
+    user = models.ForeignKey(User, related_name='quiz_completions', on_delete=models.CASCADE)
+    quiz = models.ForeignKey(Quiz, related_name='completions', on_delete=models.CASCADE)
+    # Denormalized from quiz.course so per-course stats never join through Quiz.
+    course = models.ForeignKey(Course, related_name='quiz_completions', on_delete=models.CASCADE)
+    score = models.FloatField(null=True, blank=True)
+    completed_at = models.DateTimeField()
 
+    objects = LiveManager.from_queryset(QuizCompletionQuerySet)()
+    all_objects = QuizCompletionQuerySet.as_manager()
 
+    class Meta:
+        unique_together = ('user', 'quiz')
+        indexes = [
+            models.Index(fields=['quiz', 'completed_at'], name='quizcompl_quiz_completed_idx'),
+            models.Index(fields=['course', 'user'], name='quizcompl_course_user_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id} completed quiz {self.quiz_id}"
+
+class Job(BaseModel):
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
 
+    kind = models.CharField(max_length=100)
+    payload = models.JSONField(default=dict)
+    status = models.CharField(max_length=10, default=PENDING)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    run_after = models.DateTimeField()
+    locked_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    # Hash of kind and payload for enqueue(unique=True); at most one pending job holds each.
+    dedupe_key = models.CharField(max_length=64, blank=True, editable=False)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['dedupe_key'], condition=Q(status='pending') & ~Q(dedupe_key=''),
+                name='job_pending_dedupe_uniq',
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['status', 'run_after'], name='job_status_run_after_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} job {self.pk} ({self.status})"
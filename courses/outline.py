@@ -0,0 +1,115 @@
+import json
+import threading
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Prefetch
+from django.urls import reverse
+from django.utils import timezone
+
+from .models import Course, CoursePart, CourseTopic, TopicDocument, TopicText
+
+COURSE_KEY = 'courses:outline:course:{course_id}'
+BUILT_KEY = 'courses:outline:course:{course_id}:built'
+PART_KEY = 'courses:outline:part:{part_id}'
+OUTLINE_TIMEOUT = None
+
+_pending = threading.local()
+
+
+def _part_subtrees(part_ids):
+    # Four queries however many topics, documents and texts the parts hold.
+    parts = (
+        CoursePart.objects
+        .filter(id__in=part_ids)
+        .only('id', 'title')
+        .prefetch_related(
+            Prefetch('topics', queryset=CourseTopic.objects.only('id', 'title', 'part_id').order_by('id')),
+            Prefetch('topics__documents', queryset=TopicDocument.objects.only('id', 'name', 'topic_id').order_by('created_at', 'id')),
+            Prefetch('topics__texts', queryset=TopicText.objects.only('id', 'text', 'topic_id').order_by('id')),
+        )
+    )
+    return {
+        part.id: {
+            'id': part.id,
+            'title': part.title,
+            'topics': [
+                {
+                    'id': topic.id,
+                    'title': topic.title,
+                    'documents': [
+                        {'id': doc.id, 'name': doc.name, 'url': reverse('serve_document', args=[doc.id])}
+                        for doc in topic.documents.all()
+                    ],
+                    'texts': [{'id': text.id, 'text': text.text} for text in topic.texts.all()],
+                }
+                for topic in part.topics.all()
+            ],
+        }
+        for part in parts
+    }
+
+
+def rebuild_course(course_id, part_ids=None):
+    """
+    Rebuild and cache the outline of ``course_id``, returning it as JSON.
+
+    Only the parts in ``part_ids`` are re-read from the database; the other
+    parts come from their cached subtrees. ``None`` rebuilds every part.
+    """
+    course = Course.objects.filter(id=course_id).values('id', 'title', 'description').first()
+    if course is None:
+        # Deleted or soft-deleted: drop every part subtree so a restore re-reads them.
+        stale_parts = CoursePart.all_objects.filter(course_id=course_id).values_list('id', flat=True)
+        cache.delete_many([COURSE_KEY.format(course_id=course_id), BUILT_KEY.format(course_id=course_id)])
+        cache.delete_many([PART_KEY.format(part_id=pk) for pk in {*stale_parts, *(part_ids or ())}])
+        return None
+
+    all_part_ids = list(CoursePart.objects.filter(course_id=course_id).order_by('id').values_list('id', flat=True))
+    stale = set(all_part_ids) if part_ids is None else set(part_ids)
+    cached = cache.get_many([PART_KEY.format(part_id=pk) for pk in all_part_ids if pk not in stale])
+    subtrees = {tree['id']: tree for tree in cached.values()}
+
+    to_build = [pk for pk in all_part_ids if pk not in subtrees]
+    built = _part_subtrees(to_build) if to_build else {}
+    cache.set_many({PART_KEY.format(part_id=pk): tree for pk, tree in built.items()}, OUTLINE_TIMEOUT)
+    cache.delete_many([PART_KEY.format(part_id=pk) for pk in stale - set(all_part_ids)])
+    subtrees.update(built)
+
+    course['parts'] = [subtrees[pk] for pk in all_part_ids if pk in subtrees]
+    snapshot = json.dumps(course)
+    cache.set_many(
+        {COURSE_KEY.format(course_id=course_id): snapshot, BUILT_KEY.format(course_id=course_id): timezone.now()},
+        OUTLINE_TIMEOUT,
+    )
+    return snapshot
+
+
+def course_outline_json(course_id):
+    return cache.get(COURSE_KEY.format(course_id=course_id)) or rebuild_course(course_id)
+
+
+def outline_built_at(course_id):
+    """When the cached outline of ``course_id`` was built, building it if needed; ``None`` without a course."""
+    built = cache.get(BUILT_KEY.format(course_id=course_id))
+    if built is None and rebuild_course(course_id) is not None:
+        built = cache.get(BUILT_KEY.format(course_id=course_id))
+    return built
+
+
+def schedule_rebuild(course_id, part_id=None):
+    """Queue a rebuild for after commit, coalescing every change made in the transaction."""
+    if getattr(_pending, 'courses', None) is None:
+        _pending.courses = {}
+    parts = _pending.courses.setdefault(course_id, set())
+    if part_id is not None:
+        parts.add(part_id)
+    # The first callback to run rebuilds everything queued; the rest find nothing to do.
+    transaction.on_commit(_flush)
+
+
+def _flush():
+    pending = getattr(_pending, 'courses', None) or {}
+    _pending.courses = None
+    for course_id, part_ids in pending.items():
+        rebuild_course(course_id, part_ids)
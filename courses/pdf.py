@@ -0,0 +1,56 @@
+"""
+Tiny single-page PDF writer for certificates.
+
+Kept free of Django imports so it can run in ``spawn``-ed worker processes.
+"""
+
+PAGE_WIDTH, PAGE_HEIGHT = 842, 595  # A4 landscape, in points
+
+
+def _escape(text):
+    return text.replace('\\', '\\\\').replace('(', '\\(').replace(')', '\\)')
+
+
+def render_text_pdf(lines):
+    """Render ``[(font_size, text), ...]`` centred down the page and return the PDF bytes."""
+    commands = ['BT']
+    y = PAGE_HEIGHT - 150
+    for size, text in lines:
+        # Helvetica averages about half an em per glyph; good enough for centring.
+        x = max(40, (PAGE_WIDTH - len(text) * size * 0.5) / 2)
+        commands.append(f'/F1 {size} Tf 1 0 0 1 {x:.1f} {y} Tm ({_escape(text)}) Tj')
+        y -= size * 2
+    commands.append('ET')
+    stream = '\n'.join(commands).encode('latin-1', 'replace')
+
+    objects = [
+        b'<< /Type /Catalog /Pages 2 0 R >>',
+        b'<< /Type /Pages /Kids [3 0 R] /Count 1 >>',
+        f'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {PAGE_WIDTH} {PAGE_HEIGHT}] '
+        f'/Contents 4 0 R /Resources << /Font << /F1 5 0 R >> >> >>'.encode(),
+        b'<< /Length %d >>\nstream\n' % len(stream) + stream + b'\nendstream',
+        b'<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>',
+    ]
+
+    out = bytearray(b'%PDF-1.4\n')
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += b'%d 0 obj\n' % number + body + b'\nendobj\n'
+    xref = len(out)
+    out += b'xref\n0 %d\n0000000000 65535 f \n' % (len(objects) + 1)
+    for offset in offsets:
+        out += b'%010d 00000 n \n' % offset
+    out += b'trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n' % (len(objects) + 1, xref)
+    return bytes(out)
+
+
+def render_certificate(username, course_title, issued_on):
+    return render_text_pdf([
+        (36, 'Certificate of Completion'),
+        (18, 'This certifies that'),
+        (28, username),
+        (18, 'has completed the course'),
+        (24, course_title),
+        (14, f'Issued on {issued_on}'),
+    ])
@@ -0,0 +1,243 @@
+"""
+Quiz completion write path.
+
+A completion is written to the normalized ``QuizCompletion`` table and merged
+into the legacy ``UserProgress.completed_quizzes`` blob. ``write_completions``
+does both for a batch of events, in a few statements whatever the batch size.
+On PostgreSQL the blob is patched in place with ``jsonb ||``. Elsewhere the
+rows are locked with ``SKIP LOCKED``, merged and written with ``bulk_update``,
+and rows another flush holds are handed back for later. ``ProgressBuffer``
+gathers high-frequency events in memory and a background thread flushes them
+in batches, so requests never wait on the write. Events still in the buffer
+are lost if the process dies without running its exit hook (``SIGKILL``, OOM,
+a crash): at most ``PROGRESS_FLUSH_SECONDS`` worth, plus whatever a failing
+database kept buffered.
+"""
+import atexit
+import json
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.db import InterfaceError, OperationalError, connection, transaction
+from django.utils import timezone
+
+from .certificates import schedule_issuance
+from .counters import recount
+from .models import Course, QuizCompletion, UserProgress
+
+logger = logging.getLogger(__name__)
+
+# The database could not be reached; the events are fine and are kept for the next flush.
+UNAVAILABLE = (OperationalError, InterfaceError)
+
+
+def _patches(events):
+    patches = {}
+    for (user_id, quiz_id), (course_id, score, completed_at) in events.items():
+        patches.setdefault((user_id, course_id), {})[str(quiz_id)] = {
+            'score': score, 'completed_at': completed_at.isoformat(),
+        }
+    return patches
+
+
+def _merge_jsonb(patches, now):
+    table = connection.ops.quote_name(UserProgress._meta.db_table)
+    batch = [{'user_id': user_id, 'course_id': course_id, 'patch': patch} for (user_id, course_id), patch in patches.items()]
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'UPDATE {table} AS progress '
+            'SET completed_quizzes = progress.completed_quizzes || batch.patch, updated_at = %s '
+            'FROM jsonb_to_recordset(%s::jsonb) AS batch(user_id bigint, course_id bigint, patch jsonb) '
+            'WHERE progress.user_id = batch.user_id AND progress.course_id = batch.course_id',
+            [now, json.dumps(batch)],
+        )
+    return set()
+
+
+def _merge_locked(patches, now, skip_locked):
+    rows = (
+        UserProgress.all_objects
+        .select_for_update(skip_locked=skip_locked)
+        .filter(user_id__in={user_id for user_id, _ in patches}, course_id__in={course_id for _, course_id in patches})
+    )
+    locked = [row for row in rows if (row.user_id, row.course_id) in patches]
+    for row in locked:
+        row.completed_quizzes.update(patches[row.user_id, row.course_id])
+        row.updated_at = now
+    UserProgress.all_objects.bulk_update(locked, ['completed_quizzes', 'updated_at'])
+    return set(patches) - {(row.user_id, row.course_id) for row in locked}
+
+
+def write_completions(events, skip_locked=True):
+    """
+    Write ``{(user_id, quiz_id): (course_id, score, completed_at)}``.
+
+    Returns the events whose progress row was locked by another writer and
+    skipped, which the caller should retry; without ``skip_locked`` it waits.
+    """
+    if not events:
+        return {}
+    now = timezone.now()
+    patches = _patches(events)
+    with transaction.atomic():
+        QuizCompletion.all_objects.bulk_create(
+            [
+                QuizCompletion(user_id=user_id, quiz_id=quiz_id, course_id=course_id, score=score, completed_at=completed_at)
+                for (user_id, quiz_id), (course_id, score, completed_at) in events.items()
+            ],
+            update_conflicts=True,
+            unique_fields=['user', 'quiz'],
+            update_fields=['course', 'score', 'completed_at', 'deleted_at', 'updated_at'],
+        )
+        existing = set(
+            UserProgress.all_objects
+            .filter(user_id__in={user_id for user_id, _ in patches}, course_id__in={course_id for _, course_id in patches})
+            .values_list('user_id', 'course_id')
+        )
+        missing = set(patches) - existing
+        if missing:
+            UserProgress.all_objects.bulk_create(
+                [UserProgress(user_id=user_id, course_id=course_id) for user_id, course_id in missing],
+                ignore_conflicts=True,
+            )
+            # bulk_create sends no signals; enrolled_count is refreshed here.
+            recount(Course.objects.filter(pk__in={course_id for _, course_id in missing}))
+        if connection.vendor == 'postgresql':
+            skipped = _merge_jsonb(patches, now)
+        else:
+            skipped = _merge_locked(patches, now, skip_locked)
+        schedule_issuance({course_id for _, course_id in patches})
+    return {
+        (user_id, quiz_id): event
+        for (user_id, quiz_id), event in events.items()
+        if (user_id, event[0]) in skipped
+    }
+
+
+def record_quiz_completion(user, quiz, score=None, completed_at=None):
+    """Record one completion right away. ``progress_buffer`` batches high event rates."""
+    write_completions({(user.pk, quiz.pk): (quiz.course_id, score, completed_at or timezone.now())}, skip_locked=False)
+    return QuizCompletion.objects.get(user=user, quiz=quiz)
+
+
+class ProgressBuffer:
+    """
+    Quiz completion events held in memory and written with ``write_completions``.
+
+    Repeated events for one (user, quiz) collapse into the latest. A daemon
+    thread, started with the first event, flushes every
+    ``PROGRESS_FLUSH_SECONDS`` and as soon as the buffer holds
+    ``PROGRESS_BUFFER_SIZE`` events. With ``PROGRESS_BACKGROUND_FLUSH`` off,
+    ``add`` flushes inline once either limit is reached instead.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.flush_lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.flusher = None
+        self.events = {}
+        self.oldest = None
+
+    def __len__(self):
+        return len(self.events)
+
+    def add(self, user_id, quiz_id, course_id, score=None, completed_at=None):
+        event = (course_id, score, completed_at or timezone.now())
+        with self.lock:
+            self._keep_latest((user_id, quiz_id), event)
+            if self.oldest is None:
+                self.oldest = time.monotonic()
+            full = len(self.events) >= getattr(settings, 'PROGRESS_BUFFER_SIZE', 500)
+            overdue = time.monotonic() - self.oldest >= getattr(settings, 'PROGRESS_FLUSH_SECONDS', 5)
+        if getattr(settings, 'PROGRESS_BACKGROUND_FLUSH', True):
+            self._start_flusher()
+            if full:
+                self.wakeup.set()
+        elif full or overdue:
+            self.flush()
+
+    def _keep_latest(self, key, event):
+        current = self.events.get(key)
+        if current is None or current[2] <= event[2]:
+            self.events[key] = event
+
+    def _start_flusher(self):
+        # Also after a fork: the child inherits the buffer but not the thread.
+        with self.lock:
+            if self.flusher is None or not self.flusher.is_alive():
+                self.flusher = threading.Thread(target=self._run, name='progress-flusher', daemon=True)
+                self.flusher.start()
+
+    def _run(self):
+        while True:
+            self.wakeup.wait(getattr(settings, 'PROGRESS_FLUSH_SECONDS', 5))
+            self.wakeup.clear()
+            try:
+                self.flush()
+            except Exception:
+                logger.exception('Progress flush failed')
+            finally:
+                connection.close()  # this thread's connection; a fresh one is opened next time
+
+    def flush(self):
+        """
+        Write the buffered events; returns how many were written.
+
+        Events the database could not take because it was unreachable are kept
+        for the next flush. When a batch fails for any other reason its events
+        are written one by one, and those that still fail are logged and dropped.
+        """
+        # One flush at a time per process; another thread arriving meanwhile finds the buffer drained.
+        with self.flush_lock:
+            with self.lock:
+                events, self.events, self.oldest = self.events, {}, None
+            if not events:
+                return 0
+            try:
+                skipped, dropped = self._write(events)
+            except UNAVAILABLE:
+                logger.exception('Database unavailable; keeping %d progress events', len(events))
+                self._requeue(events)
+                return 0
+            self._requeue(skipped)
+            return len(events) - len(skipped) - dropped
+
+    def _write(self, events):
+        """Return ``(skipped events, number dropped)``, isolating the events a failed batch held."""
+        try:
+            return write_completions(events), 0
+        except UNAVAILABLE:
+            raise
+        except Exception:
+            if len(events) == 1:
+                logger.exception('Dropping progress event %r', events)
+                return {}, 1
+            logger.warning('Writing %d progress events failed; retrying one by one', len(events), exc_info=True)
+        skipped, dropped = {}, 0
+        for key, event in events.items():
+            one_skipped, one_dropped = self._write({key: event})
+            skipped.update(one_skipped)
+            dropped += one_dropped
+        return skipped, dropped
+
+    def _requeue(self, events):
+        if not events:
+            return
+        with self.lock:
+            for key, event in events.items():
+                self._keep_latest(key, event)
+            if self.oldest is None:
+                self.oldest = time.monotonic()
+
+
+progress_buffer = ProgressBuffer()
+
+
+@atexit.register
+def _flush_on_exit():
+    progress_buffer.flush()
+    if len(progress_buffer):
+        logger.error('Could not flush %d buffered progress events', len(progress_buffer))
@@ -0,0 +1,108 @@
+"""
+Primary/replica routing.
+
+Reads of the models in ``DATABASE_REPLICA_MODELS`` go to a random alias from
+``DATABASE_REPLICAS``; everything else, every write, and every read made after
+a write in the same request (or inside a transaction) goes to the primary.
+``ReplicaPinningMiddleware`` carries the pin over to the client's next requests
+for ``REPLICA_PIN_SECONDS`` so a redirect after a POST sees its own write
+despite replication lag.
+"""
+import random
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+PIN_COOKIE = 'pin_primary'
+
+DEFAULT_REPLICA_MODELS = {
+    'courses.Course',
+    'courses.CoursePart',
+    'courses.CourseTopic',
+    'courses.TopicDocument',
+    'courses.TopicText',
+    'courses.Quiz',
+    'courses.QuizQuestion',
+    'courses.QuizAnswer',
+}
+
+_pinned = ContextVar('pinned_to_primary', default=False)
+_wrote = ContextVar('wrote_to_primary', default=False)
+
+
+def replicas():
+    return getattr(settings, 'DATABASE_REPLICAS', [])
+
+
+class PrimaryReplicaRouter:
+    def db_for_read(self, model, **hints):
+        aliases = replicas()
+        if not aliases or _pinned.get():
+            return DEFAULT_DB_ALIAS
+        if model._meta.label not in getattr(settings, 'DATABASE_REPLICA_MODELS', DEFAULT_REPLICA_MODELS):
+            return DEFAULT_DB_ALIAS
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS  # reads inside a transaction must see its writes
+        instance = hints.get('instance')
+        if instance is not None and instance._state.db in aliases:
+            return instance._state.db  # follow relations on the replica the instance came from
+        return random.choice(aliases)
+
+    def db_for_write(self, model, **hints):
+        _pinned.set(True)
+        _wrote.set(True)
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        aliases = {DEFAULT_DB_ALIAS, *replicas()}
+        if obj1._state.db in aliases and obj2._state.db in aliases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas receive the schema through replication.
+        return False if db in replicas() else None
+
+
+class ReplicaPinningMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        tokens = self._start(request)
+        try:
+            return self._finish(self.get_response(request))
+        finally:
+            self._reset(tokens)
+
+    async def __acall__(self, request):
+        # sync_to_async copies context variables back, so writes made in the ORM's thread still pin.
+        tokens = self._start(request)
+        try:
+            return self._finish(await self.get_response(request))
+        finally:
+            self._reset(tokens)
+
+    def _start(self, request):
+        return _pinned.set(request.COOKIES.get(PIN_COOKIE) == '1'), _wrote.set(False)
+
+    def _finish(self, response):
+        if _wrote.get() and replicas():
+            response.set_cookie(
+                PIN_COOKIE, '1', max_age=getattr(settings, 'REPLICA_PIN_SECONDS', 5), httponly=True, samesite='Lax',
+            )
+        return response
+
+    def _reset(self, tokens):
+        pinned, wrote = tokens
+        _pinned.reset(pinned)
+        _wrote.reset(wrote)
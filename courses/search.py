@@ -0,0 +1,268 @@
+import math
+import re
+import threading
+from collections import defaultdict
+from itertools import islice
+
+from django.conf import settings
+from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector
+from django.db import connection
+from django.db.models import CharField, F, FloatField, Value
+
+from .extraction import extract_text
+from .jobs import enqueue, enqueue_unique, register
+from .models import Course, QuizQuestion, TopicDocument, TopicText
+from .storage import file_sha256
+
+EXTRACT_DOCUMENT_TEXT = 'extract_document_text'
+EXTRACT_BATCH_SIZE = 1000
+
+# kind -> (model, [(field, weight)], title field)
+SOURCES = {
+    'course': (Course, [('title', 'A'), ('description', 'B')], 'title'),
+    'document': (TopicDocument, [('name', 'A'), ('text_content', 'C')], 'name'),
+    'text': (TopicText, [('text', 'B')], 'text'),
+    'question': (QuizQuestion, [('text', 'B')], 'text'),
+}
+KIND_BY_MODEL = {model: kind for kind, (model, _, _) in SOURCES.items()}
+# kind -> lookup from the model to its course id
+COURSE_PATHS = {
+    'course': 'id',
+    'document': 'topic__part__course_id',
+    'text': 'topic__part__course_id',
+    'question': 'quiz__course_id',
+}
+# PostgreSQL's default ts_rank weights for D, C, B, A.
+WEIGHTS = {'A': 1.0, 'B': 0.4, 'C': 0.2, 'D': 0.1}
+TITLE_LENGTH = 120
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def tokenize(text):
+    return TOKEN_RE.findall(text.lower())
+
+
+def _search_config():
+    return getattr(settings, 'SEARCH_CONFIG', 'english')
+
+
+class PostgresSearchBackend:
+    """``tsvector`` columns with GIN indexes, kept current with one UPDATE per save."""
+
+    def vector(self, fields):
+        vector = None
+        for field, weight in fields:
+            part = SearchVector(field, weight=weight, config=_search_config())
+            vector = part if vector is None else vector + part
+        return vector
+
+    def update(self, instance):
+        model, fields, _ = SOURCES[KIND_BY_MODEL[type(instance)]]
+        model.objects.filter(pk=instance.pk).update(search_vector=self.vector(fields))
+
+    def update_courses(self, course_ids):
+        for kind, (model, fields, _) in SOURCES.items():
+            model.objects.filter(**{f'{COURSE_PATHS[kind]}__in': course_ids}).update(search_vector=self.vector(fields))
+
+    def remove(self, instance):
+        pass  # deleted rows are gone and soft-deleted ones are filtered by the live manager
+
+    def invalidate(self):
+        pass
+
+    def search(self, query, offset, limit):
+        search_query = SearchQuery(query, config=_search_config(), search_type='websearch')
+        querysets = [
+            model.objects
+            .filter(search_vector=search_query)
+            .annotate(
+                kind=Value(kind, output_field=CharField()),
+                label=F(title_field),
+                rank=SearchRank(F('search_vector'), search_query, output_field=FloatField()),
+            )
+            .values('kind', 'id', 'label', 'rank')
+            .order_by()
+            for kind, (model, _, title_field) in SOURCES.items()
+        ]
+        combined = querysets[0].union(*querysets[1:], all=True)
+        total = combined.count()
+        hits = list(combined.order_by('-rank', 'kind', 'id')[offset:offset + limit])
+        return total, hits
+
+
+class InvertedIndexBackend:
+    """
+    In-process inverted index used where PostgreSQL full-text search is not
+    available. Built lazily from the database on first query and then kept
+    current by the same save/delete hooks as the PostgreSQL backend.
+    Scores are weighted term frequency times inverse document frequency.
+
+    Each process holds its own copy and only sees the writes made in that
+    process, so with several workers (or the job worker extracting text) it
+    goes stale until the process restarts. It suits development and
+    single-process deployments; use PostgreSQL for anything else.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.loaded = False
+        self.postings = defaultdict(dict)  # term -> {(kind, id): weighted tf}
+        self.terms = {}  # (kind, id) -> set of terms
+        self.titles = {}
+
+    def _index(self, kind, pk, values):
+        key = (kind, pk)
+        self._unindex(key)
+        _, fields, title_field = SOURCES[kind]
+        weights = defaultdict(float)
+        for field, weight in fields:
+            for term in tokenize(values.get(field) or ''):
+                weights[term] += WEIGHTS[weight]
+        for term, score in weights.items():
+            self.postings[term][key] = score
+        self.terms[key] = set(weights)
+        self.titles[key] = values.get(title_field) or ''
+
+    def _unindex(self, key):
+        for term in self.terms.pop(key, ()):
+            postings = self.postings.get(term)
+            if postings is not None:
+                postings.pop(key, None)
+                if not postings:
+                    del self.postings[term]
+        self.titles.pop(key, None)
+
+    def _load(self):
+        for kind, (model, fields, title_field) in SOURCES.items():
+            names = {field for field, _ in fields} | {title_field}
+            for values in model.objects.values('id', *names).iterator(chunk_size=2000):
+                self._index(kind, values['id'], values)
+        self.loaded = True
+
+    def update(self, instance):
+        kind = KIND_BY_MODEL[type(instance)]
+        _, fields, title_field = SOURCES[kind]
+        with self.lock:
+            if self.loaded:
+                values = {name: getattr(instance, name) for name in {f for f, _ in fields} | {title_field}}
+                self._index(kind, instance.pk, values)
+
+    def remove(self, instance):
+        with self.lock:
+            if self.loaded:
+                self._unindex((KIND_BY_MODEL[type(instance)], instance.pk))
+
+    def invalidate(self):
+        # Cascading soft deletes change rows without loading them; rebuild on next query.
+        with self.lock:
+            self.__init__()
+
+    reset = invalidate
+
+    def update_courses(self, course_ids):
+        self.invalidate()
+
+    def search(self, query, offset, limit):
+        with self.lock:
+            if not self.loaded:
+                self._load()
+            terms = set(tokenize(query))
+            if not terms or any(term not in self.postings for term in terms):
+                return 0, []
+            # Every term must match, like websearch_to_tsquery without operators.
+            matches = set.intersection(*(set(self.postings[term]) for term in terms))
+            document_count = len(self.terms) or 1
+            scores = {
+                key: sum(
+                    self.postings[term][key] * math.log(1 + document_count / len(self.postings[term]))
+                    for term in terms
+                )
+                for key in matches
+            }
+            ranked = sorted(scores.items(), key=lambda item: (-item[1], item[0]))
+            hits = [
+                {'kind': kind, 'id': pk, 'label': self.titles[(kind, pk)], 'rank': score}
+                for (kind, pk), score in ranked[offset:offset + limit]
+            ]
+        return len(ranked), hits
+
+
+_inverted_index = InvertedIndexBackend()
+
+
+def get_backend():
+    name = getattr(settings, 'SEARCH_BACKEND', None)
+    if name is None:
+        name = 'postgres' if connection.vendor == 'postgresql' else 'inverted'
+    return PostgresSearchBackend() if name == 'postgres' else _inverted_index
+
+
+def search(query, page=1, page_size=20):
+    total, hits = get_backend().search(query, (page - 1) * page_size, page_size)
+    return total, [
+        {'kind': hit['kind'], 'id': hit['id'], 'title': hit['label'][:TITLE_LENGTH], 'rank': hit['rank']}
+        for hit in hits
+    ]
+
+
+def reindex_courses(course_ids):
+    """Reindex everything under ``course_ids`` after writes that bypassed the save signals."""
+    if course_ids:
+        get_backend().update_courses(list(course_ids))
+
+
+def index_instance(sender, instance, **kwargs):
+    get_backend().update(instance)
+    if sender is TopicDocument and getattr(instance, 'file_changed', False):
+        enqueue(EXTRACT_DOCUMENT_TEXT, {'document_id': instance.pk}, unique=True)
+
+
+def unindex_instance(sender, instance, **kwargs):
+    get_backend().remove(instance)
+
+
+def subtree_soft_deleted(sender, instance, **kwargs):
+    backend = get_backend()
+    if sender in KIND_BY_MODEL:
+        backend.remove(instance)
+    if instance.soft_delete_cascade:
+        backend.invalidate()
+
+
+def subtree_restored(sender, instance, **kwargs):
+    backend = get_backend()
+    if sender in KIND_BY_MODEL:
+        backend.update(instance)
+    if instance.soft_delete_cascade:
+        backend.invalidate()
+
+
+def schedule_extraction(documents=None, batch_size=EXTRACT_BATCH_SIZE):
+    """
+    Queue an extract job for each document in ``documents``, by default every
+    live document with a file and no text yet, e.g. those uploaded before
+    extraction existed. Returns how many documents were considered.
+    """
+    if documents is None:
+        documents = TopicDocument.objects.filter(text_content='').exclude(file='')
+    ids = documents.order_by('pk').values_list('pk', flat=True).iterator(chunk_size=batch_size)
+    count = 0
+    while batch := list(islice(ids, batch_size)):
+        enqueue_unique(EXTRACT_DOCUMENT_TEXT, [{'document_id': pk} for pk in batch])
+        count += len(batch)
+    return count
+
+
+@register(EXTRACT_DOCUMENT_TEXT)
+def extract_document_text(document_id):
+    document = TopicDocument.objects.filter(pk=document_id).first()
+    if document is None or not document.file:
+        return
+    document.text_content = extract_text(document.file)
+    changes = {'text_content': document.text_content}
+    if not document.sha256:
+        # Saved before hashing happened at save time, or under an assigned name.
+        changes['sha256'] = document.sha256 = file_sha256(document.file.path)
+    TopicDocument.objects.filter(pk=document_id).update(**changes)
+    get_backend().update(document)
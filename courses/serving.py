@@ -0,0 +1,182 @@
+import mimetypes
+import os
+import re
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, parse_http_date_safe, quote_etag
+
+from .models import UserProgress
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+class RangeNotSatisfiable(Exception):
+    pass
+
+
+class FileRange:
+    """
+    Read-limited view of an open file positioned at the start of a range.
+
+    ``fileno()`` is kept so WSGI servers that honour ``wsgi.file_wrapper``
+    (gunicorn, uWSGI) can still hand the descriptor to ``sendfile`` and stop
+    at Content-Length; everything else gets a plain bounded ``read()``.
+    """
+
+    def __init__(self, file, start, length):
+        file.seek(start)
+        self.file = file
+        self.remaining = length
+
+    def read(self, size=-1):
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def fileno(self):
+        return self.file.fileno()
+
+    def close(self):
+        self.file.close()
+
+
+class AsyncFileResponse(FileResponse):
+    """``FileResponse`` whose blocks are read in a worker thread, so the event loop never waits on disk."""
+
+    def _set_streaming_content(self, value):
+        if not hasattr(value, 'read'):
+            return super()._set_streaming_content(value)
+        self.file_to_stream = value
+        if hasattr(value, 'close'):
+            self._resource_closers.append(value.close)
+        self.set_headers(value)
+        StreamingHttpResponse._set_streaming_content(self, _aread_blocks(value, self.block_size))
+
+
+async def _aread_blocks(filelike, block_size):
+    read = sync_to_async(filelike.read, thread_sensitive=False)
+    while data := await read(block_size):
+        yield data
+
+
+def document_etag(document):
+    """The content hash saved with the file; documents not hashed yet fall back to their version."""
+    if document.sha256:
+        return quote_etag(document.sha256)
+    return quote_etag(f'{document.pk}-{document.updated_at.timestamp()}')
+
+
+def can_view_document(user, document):
+    if not user.is_authenticated:
+        return False
+    if user.is_staff or document.created_by_id == user.pk:
+        return True
+    return UserProgress.objects.filter(user=user, course_id=document.topic.part.course_id).exists()
+
+
+async def acan_view_document(user, document):
+    if not user.is_authenticated:
+        return False
+    if user.is_staff or document.created_by_id == user.pk:
+        return True
+    return await UserProgress.objects.filter(user=user, course_id=document.topic.part.course_id).aexists()
+
+
+def parse_range(header, size):
+    """
+    Return ``(start, length)`` for a single-range ``Range`` header, or ``None``
+    when the whole file should be sent. Multiple ranges are answered with the
+    full body, which RFC 9110 allows.
+    """
+    match = RANGE_RE.match(header.strip())
+    if not match:
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        length = min(int(last), size)
+        if length == 0:
+            raise RangeNotSatisfiable
+        return size - length, length
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or end < start:
+        raise RangeNotSatisfiable
+    return start, end - start + 1
+
+
+def _if_range_passes(request, etag, last_modified):
+    if_range = request.headers.get('If-Range')
+    if not if_range:
+        return True
+    if if_range.startswith('"'):
+        return if_range == etag
+    return parse_http_date_safe(if_range) == last_modified
+
+
+def serve_document_file(request, document, response_class=FileResponse):
+    etag = document_etag(document)
+    last_modified = int(document.updated_at.timestamp())
+
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None:
+        mode = getattr(settings, 'DOCUMENT_SERVE_MODE', 'direct')
+        if mode == 'x-accel-redirect':
+            response = _accel_response(document, 'X-Accel-Redirect', settings.DOCUMENT_SERVE_ACCEL_PREFIX + document.file.name)
+        elif mode == 'x-sendfile':
+            response = _accel_response(document, 'X-Sendfile', document.file.path)
+        else:
+            response = _file_response(request, document, etag, last_modified, response_class)
+
+    response.headers['ETag'] = etag
+    response.headers['Last-Modified'] = http_date(last_modified)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+async def aserve_document_file(request, document):
+    # Nothing below touches the database, only the file system,
+    # so it may run outside the thread that owns the connection.
+    return await sync_to_async(serve_document_file, thread_sensitive=False)(
+        request, document, response_class=AsyncFileResponse,
+    )
+
+
+def _accel_response(document, header, target):
+    # The front proxy does ranges and conditionals itself; we only authorise.
+    content_type, _ = mimetypes.guess_type(document.file.name)
+    response = HttpResponse(content_type=content_type or 'application/octet-stream')
+    response.headers[header] = target
+    return response
+
+
+def _file_response(request, document, etag, last_modified, response_class):
+    fh = document.file.open('rb')
+    size = document.file.size
+    filename = os.path.basename(document.file.name)
+
+    byte_range = None
+    if 'Range' in request.headers and _if_range_passes(request, etag, last_modified):
+        try:
+            byte_range = parse_range(request.headers['Range'], size)
+        except RangeNotSatisfiable:
+            fh.close()
+            response = HttpResponse(status=416)
+            response.headers['Content-Range'] = f'bytes */{size}'
+            return response
+
+    if byte_range is None:
+        response = response_class(fh, filename=filename)
+    else:
+        start, length = byte_range
+        response = response_class(FileRange(fh, start, length), filename=filename, status=206)
+        response.headers['Content-Length'] = length
+        response.headers['Content-Range'] = f'bytes {start}-{start + length - 1}/{size}'
+    response.headers['Accept-Ranges'] = 'bytes'
+    return response
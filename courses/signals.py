@@ -0,0 +1,130 @@
+from django.db.models.signals import post_delete, post_save
+
+from .cleanup import document_deleted, document_file_replaced
+from .counters import (
+    LEAF_COUNTERS, course_counts_restored, leaf_counts_changed, part_counts_changed, topic_counts_changed,
+)
+from .grading import invalidate_answer_key
+from .http_cache import invalidate_document_list
+from .models import (
+    Course, CoursePart, CourseTopic, Quiz, QuizAnswer, QuizQuestion, TopicDocument, TopicText, restored, soft_deleted,
+)
+from .outline import schedule_rebuild
+from .search import SOURCES, index_instance, subtree_restored, subtree_soft_deleted, unindex_instance
+from .topic_choices import invalidate_topic_choices
+
+# Soft deletes and restores change what readers see just like saves and deletes do.
+CHANGE_SIGNALS = {'save': post_save, 'delete': post_delete, 'soft_delete': soft_deleted, 'restore': restored}
+
+
+def connect_changes(handler, model, prefix):
+    for name, signal in CHANGE_SIGNALS.items():
+        signal.connect(handler, sender=model, dispatch_uid=f'{prefix}_{name}_{model.__name__}')
+
+
+for model in (CoursePart, CourseTopic):
+    connect_changes(invalidate_topic_choices, model, 'topic_choices')
+# A course's soft delete and restore reach its parts and topics with bulk UPDATEs, which send nothing.
+soft_deleted.connect(invalidate_topic_choices, sender=Course, dispatch_uid='topic_choices_soft_delete_Course')
+restored.connect(invalidate_topic_choices, sender=Course, dispatch_uid='topic_choices_restore_Course')
+
+for model in (Course, CoursePart, CourseTopic, TopicDocument):
+    connect_changes(invalidate_document_list, model, 'document_list')
+
+
+def course_changed(sender, instance, **kwargs):
+    schedule_rebuild(instance.pk)
+
+
+def part_changed(sender, instance, **kwargs):
+    schedule_rebuild(instance.course_id, instance.pk)
+    old_course_id = instance.moved_from('course_id')
+    if old_course_id is not None:
+        schedule_rebuild(old_course_id)  # reassembled without the part
+
+
+def _rebuild_part(part_id):
+    course_id = CoursePart.all_objects.filter(pk=part_id).values_list('course_id', flat=True).first()
+    if course_id is not None:
+        schedule_rebuild(course_id, part_id)
+
+
+def _rebuild_topic(topic_id):
+    path = CourseTopic.all_objects.filter(pk=topic_id).values_list('part_id', 'part__course_id').first()
+    if path is not None:
+        part_id, course_id = path
+        schedule_rebuild(course_id, part_id)
+
+
+def topic_changed(sender, instance, **kwargs):
+    _rebuild_part(instance.part_id)
+    old_part_id = instance.moved_from('part_id')
+    if old_part_id is not None:
+        _rebuild_part(old_part_id)
+
+
+def topic_content_changed(sender, instance, **kwargs):
+    _rebuild_topic(instance.topic_id)
+    old_topic_id = instance.moved_from('topic_id')
+    if old_topic_id is not None:
+        _rebuild_topic(old_topic_id)
+
+
+for model, handler in (
+    (Course, course_changed),
+    (CoursePart, part_changed),
+    (CourseTopic, topic_changed),
+    (TopicDocument, topic_content_changed),
+    (TopicText, topic_content_changed),
+):
+    connect_changes(handler, model, 'outline')
+
+
+def quiz_changed(sender, instance, **kwargs):
+    invalidate_answer_key(instance.pk)
+
+
+def question_changed(sender, instance, **kwargs):
+    invalidate_answer_key(instance.quiz_id)
+    old_quiz_id = instance.moved_from('quiz_id')
+    if old_quiz_id is not None:
+        invalidate_answer_key(old_quiz_id)
+
+
+def _question_quiz_changed(question_id):
+    quiz_id = QuizQuestion.all_objects.filter(pk=question_id).values_list('quiz_id', flat=True).first()
+    if quiz_id is not None:
+        invalidate_answer_key(quiz_id)
+
+
+def answer_changed(sender, instance, **kwargs):
+    _question_quiz_changed(instance.question_id)
+    old_question_id = instance.moved_from('question_id')
+    if old_question_id is not None:
+        _question_quiz_changed(old_question_id)
+
+
+for model, handler in (
+    (Quiz, quiz_changed),
+    (QuizQuestion, question_changed),
+    (QuizAnswer, answer_changed),
+):
+    connect_changes(handler, model, 'answer_key')
+
+
+for model, _, _ in SOURCES.values():
+    post_save.connect(index_instance, sender=model, dispatch_uid=f'search_save_{model.__name__}')
+    post_delete.connect(unindex_instance, sender=model, dispatch_uid=f'search_delete_{model.__name__}')
+
+for model in {model for model, _, _ in SOURCES.values()} | {CoursePart, CourseTopic}:
+    soft_deleted.connect(subtree_soft_deleted, sender=model, dispatch_uid=f'search_soft_delete_{model.__name__}')
+    restored.connect(subtree_restored, sender=model, dispatch_uid=f'search_restore_{model.__name__}')
+
+post_save.connect(document_file_replaced, sender=TopicDocument, dispatch_uid='cleanup_replaced_file')
+post_delete.connect(document_deleted, sender=TopicDocument, dispatch_uid='cleanup_deleted_file')
+
+for model in LEAF_COUNTERS:
+    connect_changes(leaf_counts_changed, model, 'counters')
+connect_changes(topic_counts_changed, CourseTopic, 'counters')
+connect_changes(part_counts_changed, CoursePart, 'counters')
+restored.connect(course_counts_restored, sender=Course, dispatch_uid='counters_restore_Course')
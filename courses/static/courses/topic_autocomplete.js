@@ -0,0 +1,53 @@
+// Topic selects with a data-autocomplete-url only ship the selected option.
+// A search box in front of them fills the options from the topic_search view.
+(function () {
+    'use strict';
+
+    function attach(select) {
+        var search = document.createElement('input');
+        search.type = 'search';
+        search.placeholder = 'Search topics';
+        search.setAttribute('aria-label', 'Search topics');
+        search.setAttribute('autocomplete', 'off');
+        select.parentNode.insertBefore(search, select);
+
+        var timer = null;
+        var latest = 0;
+        search.addEventListener('input', function () {
+            clearTimeout(timer);
+            timer = setTimeout(function () {
+                var term = search.value.trim();
+                if (!term) {
+                    return;
+                }
+                var request = ++latest;
+                var url = select.dataset.autocompleteUrl + '?q=' + encodeURIComponent(term);
+                fetch(url, {credentials: 'same-origin'})
+                    .then(function (response) { return response.json(); })
+                    .then(function (data) {
+                        if (request !== latest) {
+                            return;  // a newer search already answered
+                        }
+                        var selected = select.value;
+                        var empty = select.querySelector('option[value=""]');
+                        select.innerHTML = '';
+                        if (empty) {
+                            select.appendChild(empty);
+                        }
+                        data.results.forEach(function (result) {
+                            var option = new Option(result.text, result.id);
+                            option.selected = String(result.id) === selected;
+                            select.appendChild(option);
+                        });
+                        if (data.results.length && !select.value) {
+                            select.value = String(data.results[0].id);
+                        }
+                    });
+            }, 250);
+        });
+    }
+
+    document.addEventListener('DOMContentLoaded', function () {
+        document.querySelectorAll('select[data-autocomplete-url]').forEach(attach);
+    });
+}());
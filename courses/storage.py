@@ -0,0 +1,147 @@
+import hashlib
+import os
+import tempfile
+
+from django.core.files.storage import FileSystemStorage, storages
+
+HASH_BUFFER_SIZE = 64 * 1024
+
+
+def document_storage():
+    return storages['documents']
+
+
+def file_sha256(path):
+    hasher = hashlib.sha256()
+    with open(path, 'rb') as fh:
+        while data := fh.read(HASH_BUFFER_SIZE):
+            hasher.update(data)
+    return hasher.hexdigest()
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    Filesystem storage that keeps one blob per unique content.
+
+    Blobs live under ``<location>/<blob_dir>/ab/cd/<sha256>`` and every saved
+    name is a hard link to its blob, so the blob's link count doubles as its
+    reference count and byte-identical uploads take no extra disk space.
+    Content carrying a ``sha256`` attribute is trusted to hash to it, so a
+    caller that already hashed the bytes spares the storage another pass;
+    after saving, the attribute holds the digest either way.
+    """
+
+    def __init__(self, blob_dir='.blobs', **kwargs):
+        super().__init__(**kwargs)
+        self.blob_dir = blob_dir
+
+    def blob_path(self, digest):
+        return os.path.join(self.location, self.blob_dir, digest[:2], digest[2:4], digest)
+
+    def references(self, digest):
+        try:
+            return os.stat(self.blob_path(digest)).st_nlink - 1
+        except FileNotFoundError:
+            return 0
+
+    def _makedirs(self, directory):
+        if self.directory_permissions_mode is not None:
+            old_umask = os.umask(0o777 & ~self.directory_permissions_mode)
+            try:
+                os.makedirs(directory, self.directory_permissions_mode, exist_ok=True)
+            finally:
+                os.umask(old_umask)
+        else:
+            os.makedirs(directory, exist_ok=True)
+
+    def _publish_blob(self, path, digest):
+        """Hard-link ``path`` as the blob of ``digest`` unless that blob is stored already."""
+        blob = self.blob_path(digest)
+        self._makedirs(os.path.dirname(blob))
+        try:
+            os.link(path, blob)
+        except FileExistsError:
+            pass  # an identical upload got there first; replacing its inode would orphan its links
+        return blob
+
+    def _store_blob(self, content):
+        staging = os.path.join(self.location, self.blob_dir, 'tmp')
+        self._makedirs(staging)
+        digest = getattr(content, 'sha256', None)
+
+        if hasattr(content, 'temporary_file_path'):
+            source = content.temporary_file_path()
+            digest = digest or file_sha256(source)
+            try:
+                blob = self._publish_blob(source, digest)
+            except OSError:
+                pass  # on another file system: copied in through the staging directory below
+            else:
+                os.remove(source)  # moved, as FileSystemStorage moves temporary files
+                return digest, blob
+
+        hasher = None if digest else hashlib.sha256()
+        fd, staged = tempfile.mkstemp(dir=staging)
+        try:
+            with os.fdopen(fd, 'wb') as out:
+                for chunk in content.chunks():
+                    if isinstance(chunk, str):
+                        chunk = chunk.encode()
+                    if hasher:
+                        hasher.update(chunk)
+                    out.write(chunk)
+            digest = digest or hasher.hexdigest()
+            blob = self._publish_blob(staged, digest)
+        finally:
+            os.remove(staged)
+        return digest, blob
+
+    def link_blob(self, blob, name):
+        """Hard-link ``blob`` under ``name`` (or the next free variant) and return its full path."""
+        full_path = self.path(name)
+        self._makedirs(os.path.dirname(full_path))
+        while True:
+            try:
+                os.link(blob, full_path)
+            except FileExistsError:
+                name = self.get_available_name(name)
+                full_path = self.path(name)
+            else:
+                break
+        return full_path
+
+    def _save(self, name, content):
+        digest, blob = self._store_blob(content)
+        content.sha256 = digest
+        # mkstemp() creates 0600 files; blobs must stay readable like regular uploads.
+        os.chmod(blob, self.file_permissions_mode if self.file_permissions_mode is not None else 0o644)
+        full_path = self.link_blob(blob, name)
+        self._ensure_location_group_id(full_path)
+        return os.path.relpath(full_path, self.location).replace('\\', '/')
+
+    def delete(self, name):
+        if not name:
+            raise ValueError("The name must be given to delete().")
+        path = self.path(name)
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return
+        if os.path.isdir(path):
+            return super().delete(name)
+
+        # Only the last reference pays for hashing, to find the blob it frees.
+        digest = file_sha256(path) if stat.st_nlink == 2 else None
+        super().delete(name)
+        if digest and self.references(digest) == 0:
+            try:
+                os.remove(self.blob_path(digest))
+            except FileNotFoundError:
+                pass
+
+    def iter_blobs(self):
+        root = os.path.join(self.location, self.blob_dir)
+        for dirpath, dirnames, filenames in os.walk(root):
+            dirnames[:] = [d for d in dirnames if d != 'tmp']
+            for filename in filenames:
+                yield filename, os.path.join(dirpath, filename)
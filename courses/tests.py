@@ -1,3 +1,1360 @@
-from django.test import TestCase
+import hashlib
+import importlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+import zipfile
+from contextvars import copy_context
+from datetime import timedelta
+from io import StringIO
+from unittest import skipUnless
 
-# Create your tests here.
+from asgiref.sync import iscoroutinefunction
+from django.apps import apps
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import IntegrityError, connection
+from django.db import transaction
+from django.forms import modelform_factory
+from django.http import HttpResponse
+from django.test import AsyncRequestFactory, RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from . import async_views
+from .benchmark import compare, generate, run as run_benchmarks
+from .certificates import _insert_certificates, issue_certificates, schedule_issuance
+from .checks import check_shared_cache
+from .counters import reconcile, recount
+from .exchange import BundleError, import_courses
+from .forms import TopicDocumentForm
+from .grading import Submission, answer_keys, grade_submissions
+from .jobs import run_pending
+from .metrics import RequestMetricsMiddleware, registry
+from .models import (
+    Certificate, Course, CoursePart, CourseTopic, DocumentUpload, Job, Quiz, QuizAnswer, QuizCompletion, QuizQuestion,
+    TopicDocument, TopicText, UserProgress,
+)
+from .outline import course_outline_json
+from .pagination import keyset_paginate
+from .progress import ProgressBuffer, _merge_jsonb, record_quiz_completion
+from .routers import PIN_COOKIE, PrimaryReplicaRouter, ReplicaPinningMiddleware
+from .search import _inverted_index, extract_document_text
+from .storage import document_storage
+from .topic_choices import topic_choice_count, topic_choices
+from .uploads import assemble
+
+# The database cache counts as queries; tests asserting query counts measure the
+# application's own, so they run on a cache that stays out of the database.
+LOCAL_CACHE = override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+
+
+def make_topic(course_title='Python', part_title='Basics', topic_title='Syntax'):
+    course = Course.objects.create(title=course_title, description='')
+    part = CoursePart.objects.create(course=course, title=part_title)
+    return CourseTopic.objects.create(part=part, title=topic_title)
+
+
+def make_documents(topic, count, start=0):
+    TopicDocument.objects.bulk_create(
+        [
+            TopicDocument(topic=topic, name=f'doc-{i}', file=f'topic_documents/doc-{i}.pdf')
+            for i in range(start, start + count)
+        ],
+        batch_size=5000,
+    )
+
+
+class DocumentListTests(TestCase):
+    def setUp(self):
+        self.topic = make_topic()
+
+    def count_queries(self, url):
+        self.client.get(url)  # CSRF cookie, so the page goes through the response cache
+        cache.clear()
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(ctx.captured_queries)
+
+    def test_query_count_does_not_grow_with_table(self):
+        url = reverse('document_list')
+        make_documents(self.topic, 10)
+        small = self.count_queries(url)
+
+        make_documents(self.topic, 100_000 - 10, start=10)
+        large = self.count_queries(url)
+
+        self.assertEqual(small, large)
+
+    def test_keyset_pages_cover_every_row_once(self):
+        make_documents(self.topic, 25)
+        seen = []
+        cursor = None
+        while True:
+            page = keyset_paginate(TopicDocument.objects.all(), cursor=cursor, page_size=10)
+            seen.extend(doc.pk for doc in page)
+            if not page.has_next:
+                break
+            cursor = page.next_cursor
+
+        self.assertEqual(len(seen), 25)
+        self.assertEqual(set(seen), set(TopicDocument.objects.values_list('pk', flat=True)))
+
+    def test_invalid_cursor_is_rejected(self):
+        response = self.client.get(reverse('document_list'), {'cursor': '!!!'})
+        self.assertEqual(response.status_code, 400)
+
+
+class SharedCacheCheckTests(TestCase):
+    def test_a_per_process_cache_is_refused_outside_debug(self):
+        self.assertEqual(check_shared_cache(None), [])
+        with LOCAL_CACHE:
+            self.assertEqual([error.id for error in check_shared_cache(None)], ['courses.E001'])
+            with override_settings(DEBUG=True):
+                self.assertEqual(check_shared_cache(None), [])
+
+
+@LOCAL_CACHE
+class TopicChoicesTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.topic = make_topic()
+
+    def test_choices_are_cached_until_topics_change(self):
+        self.assertEqual(topic_choices(), [(self.topic.pk, 'Basics-Syntax')])
+        with self.assertNumQueries(0):
+            topic_choices()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.topic.part.title = 'Intro'
+            self.topic.part.save()
+            self.assertEqual(topic_choices(), [(self.topic.pk, 'Basics-Syntax')])
+        self.assertEqual(topic_choices(), [(self.topic.pk, 'Intro-Syntax')])
+
+    def test_count_is_cached_apart_from_the_choices(self):
+        self.assertEqual(topic_choice_count(), 1)
+        with self.assertNumQueries(0):
+            topic_choice_count()
+        with self.captureOnCommitCallbacks(execute=True):
+            CourseTopic.objects.create(part=self.topic.part, title='Loops')
+        self.assertEqual(topic_choice_count(), 2)
+
+    def test_soft_deleting_the_course_hides_its_topics(self):
+        self.assertEqual(topic_choices(), [(self.topic.pk, 'Basics-Syntax')])
+        self.assertEqual(topic_choice_count(), 1)
+        course = self.topic.part.course
+        with self.captureOnCommitCallbacks(execute=True):
+            course.soft_delete()
+        self.assertEqual(topic_choices(), [])
+        self.assertEqual(topic_choice_count(), 0)
+        with self.captureOnCommitCallbacks(execute=True):
+            course.restore()
+        self.assertEqual(topic_choice_count(), 1)
+
+    @override_settings(TOPIC_CHOICES_INLINE_LIMIT=0)
+    def test_large_topic_sets_switch_to_autocomplete(self):
+        CourseTopic.objects.create(part=self.topic.part, title='Loops')
+        form = TopicDocumentForm(initial={'topic': self.topic.pk})
+        widget = form.fields['topic'].widget
+        self.assertEqual(list(widget.choices), [('', 'Select a topic'), (self.topic.pk, 'Basics-Syntax')])
+        self.assertEqual(widget.attrs['data-autocomplete-url'], reverse('topic_search'))
+        self.assertIn('courses/topic_autocomplete.js', str(form.media))
+
+    @override_settings(TOPIC_CHOICES_INLINE_LIMIT=0)
+    def test_autocomplete_form_accepts_any_topic(self):
+        other = CourseTopic.objects.create(part=self.topic.part, title='Loops')
+        form = TopicDocumentForm(
+            data={'name': 'Notes', 'topic': other.pk},
+            files={'file': SimpleUploadedFile('notes.pdf', b'%PDF')},
+        )
+        self.assertTrue(form.is_valid(), form.errors)
+        self.assertEqual(form.cleaned_data['topic'], other)
+
+    def test_topic_search(self):
+        CourseTopic.objects.create(part=self.topic.part, title='Loops')
+        response = self.client.get(reverse('topic_search'), {'q': 'loop'})
+        self.assertEqual(response.json()['results'][0]['text'], 'Basics-Loops')
+
+
+class TempMediaMixin:
+    def setUp(self):
+        super().setUp()
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        settings_override = override_settings(
+            MEDIA_ROOT=self.media_root,
+            DOCUMENT_UPLOAD_CHUNK_ROOT=f'{self.media_root}/chunks',
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+
+@override_settings(DOCUMENT_UPLOAD_CHUNK_SIZE=4)
+class ChunkedUploadTests(TempMediaMixin, TestCase):
+    payload = b'0123456789'
+
+    def setUp(self):
+        super().setUp()
+        self.topic = make_topic()
+        response = self.client.post(reverse('upload_create'), {
+            'name': 'Lecture', 'topic': self.topic.pk, 'filename': 'lecture.pdf', 'size': len(self.payload),
+        })
+        self.assertEqual(response.status_code, 201)
+        self.token = response.json()['id']
+
+    def put_chunk(self, index):
+        data = self.payload[index * 4:(index + 1) * 4]
+        return self.client.put(
+            reverse('upload_chunk', args=[self.token, index]), data, content_type='application/octet-stream'
+        )
+
+    def test_out_of_order_chunks_resume_and_assemble(self):
+        self.put_chunk(2)
+        self.put_chunk(0)
+        status = self.client.get(reverse('upload_status', args=[self.token])).json()
+        self.assertEqual(status['chunk_count'], 3)
+        self.assertEqual(status['received_chunks'], [0, 2])
+
+        self.put_chunk(1)
+        sha256 = hashlib.sha256(self.payload).hexdigest()
+        response = self.client.post(reverse('upload_complete', args=[self.token]), {'sha256': sha256})
+        self.assertEqual(response.status_code, 200)
+
+        document = TopicDocument.objects.get(pk=response.json()['document_id'])
+        self.assertEqual(document.sha256, sha256)
+        self.assertTrue(document.file.name.startswith('topic_documents/lecture'))
+        with document.file.open('rb') as fh:
+            self.assertEqual(fh.read(), self.payload)
+        self.assertEqual(DocumentUpload.objects.get(token=self.token).sha256, sha256)
+
+    def test_second_complete_reuses_the_document(self):
+        for index in range(3):
+            self.put_chunk(index)
+        stale = DocumentUpload.objects.get(token=self.token)
+        first = assemble(DocumentUpload.objects.get(token=self.token))
+        # A complete that loaded the row before the first one finished.
+        self.assertEqual(assemble(stale), first)
+        self.assertEqual(stale.document_id, first.pk)
+        self.assertEqual(TopicDocument.objects.filter(topic=self.topic).count(), 1)
+
+    def test_wrong_chunk_size_is_rejected(self):
+        response = self.client.put(
+            reverse('upload_chunk', args=[self.token, 0]), b'01', content_type='application/octet-stream'
+        )
+        self.assertEqual(response.status_code, 400)
+        response = self.client.post(reverse('upload_complete', args=[self.token]))
+        self.assertEqual(response.status_code, 400)
+
+
+class ContentAddressedStorageTests(TempMediaMixin, TestCase):
+    def test_identical_content_shares_one_blob(self):
+        storage = document_storage()
+        first = storage.save('topic_documents/a.pdf', ContentFile(b'same bytes'))
+        second = storage.save('topic_documents/a.pdf', ContentFile(b'same bytes'))
+        self.assertNotEqual(first, second)
+        self.assertTrue(os.path.samefile(storage.path(first), storage.path(second)))
+
+        digest = hashlib.sha256(b'same bytes').hexdigest()
+        self.assertEqual(storage.references(digest), 2)
+        storage.delete(first)
+        self.assertEqual(storage.references(digest), 1)
+        storage.delete(second)
+        self.assertFalse(os.path.exists(storage.blob_path(digest)))
+
+    def test_a_stored_blob_is_never_replaced(self):
+        storage = document_storage()
+        name = storage.save('topic_documents/a.pdf', ContentFile(b'same bytes'))
+        digest = hashlib.sha256(b'same bytes').hexdigest()
+        inode = os.stat(storage.blob_path(digest)).st_ino
+        # An identical upload that raced past any existence check.
+        staged = os.path.join(self.media_root, 'staged')
+        with open(staged, 'wb') as fh:
+            fh.write(b'same bytes')
+        storage._publish_blob(staged, digest)
+        self.assertEqual(os.stat(storage.blob_path(digest)).st_ino, inode)
+        self.assertEqual(storage.references(digest), 1)
+        self.assertTrue(os.path.samefile(storage.path(name), storage.blob_path(digest)))
+
+    def test_a_known_digest_is_not_recomputed(self):
+        storage = document_storage()
+        content = ContentFile(b'hashed upstream')
+        content.sha256 = 'f' * 64
+        name = storage.save('topic_documents/a.pdf', content)
+        self.assertTrue(os.path.samefile(storage.path(name), storage.blob_path('f' * 64)))
+
+    def test_dedupe_command_links_existing_duplicates(self):
+        directory = os.path.join(self.media_root, 'topic_documents')
+        os.makedirs(directory)
+        for name in ('test.pdf', 'test_2RrhfNo.pdf'):
+            with open(os.path.join(directory, name), 'wb') as fh:
+                fh.write(b'%PDF duplicate')
+
+        call_command('dedupe_documents', stdout=StringIO())
+
+        self.assertTrue(os.path.samefile(
+            os.path.join(directory, 'test.pdf'), os.path.join(directory, 'test_2RrhfNo.pdf')
+        ))
+        with open(os.path.join(directory, 'test_2RrhfNo.pdf'), 'rb') as fh:
+            self.assertEqual(fh.read(), b'%PDF duplicate')
+
+
+class ServeDocumentTests(TempMediaMixin, TestCase):
+    payload = b'0123456789abcdef'
+
+    def setUp(self):
+        super().setUp()
+        topic = make_topic()
+        self.document = TopicDocument(topic=topic, name='Slides')
+        self.document.file.save('slides.pdf', ContentFile(self.payload))
+        self.url = reverse('serve_document', args=[self.document.pk])
+        self.user = User.objects.create_user('student')
+        UserProgress.objects.create(user=self.user, course=topic.part.course)
+        self.client.force_login(self.user)
+
+    def test_full_response_carries_content_etag(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), self.payload)
+        self.assertEqual(response['ETag'], '"%s"' % hashlib.sha256(self.payload).hexdigest())
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+
+    def test_range_request(self):
+        response = self.client.get(self.url, headers={'Range': 'bytes=4-7'})
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], 'bytes 4-7/16')
+        self.assertEqual(b''.join(response.streaming_content), b'4567')
+
+        response = self.client.get(self.url, headers={'Range': 'bytes=-3'})
+        self.assertEqual(b''.join(response.streaming_content), b'def')
+
+        response = self.client.get(self.url, headers={'Range': 'bytes=99-'})
+        self.assertEqual(response.status_code, 416)
+
+    def test_conditional_requests(self):
+        etag = self.client.get(self.url)['ETag']
+        response = self.client.get(self.url, headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+
+        response = self.client.get(self.url, headers={'Range': 'bytes=0-1', 'If-Range': '"stale"'})
+        self.assertEqual(response.status_code, 200)
+
+    def test_the_digest_is_saved_with_the_file(self):
+        document = TopicDocument.objects.create(
+            topic=self.document.topic, name='Notes', file=SimpleUploadedFile('notes.pdf', b'notes'),
+        )
+        self.assertEqual(TopicDocument.objects.get(pk=document.pk).sha256, hashlib.sha256(b'notes').hexdigest())
+
+    def test_unhashed_documents_are_served_without_reading_them(self):
+        TopicDocument.objects.filter(pk=self.document.pk).update(sha256='')
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(TopicDocument.objects.get(pk=self.document.pk).sha256, '')
+
+        extract_document_text(self.document.pk)
+        self.assertEqual(TopicDocument.objects.get(pk=self.document.pk).sha256, hashlib.sha256(self.payload).hexdigest())
+
+    @override_settings(DOCUMENT_SERVE_MODE='x-accel-redirect')
+    def test_accel_redirect_mode(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response['X-Accel-Redirect'], '/protected-media/' + self.document.file.name)
+
+    def test_requires_access(self):
+        self.client.logout()
+        self.assertEqual(self.client.get(self.url).status_code, 403)
+        self.client.force_login(User.objects.create_user('outsider'))
+        self.assertEqual(self.client.get(self.url).status_code, 403)
+
+
+class AsyncDocumentViewTests(TempMediaMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.topic = make_topic()
+        self.document = TopicDocument(topic=self.topic, name='Slides')
+        self.document.file.save('slides.pdf', ContentFile(b'0123456789'))
+        self.user = User.objects.create_user('student', is_staff=True)
+        self.factory = AsyncRequestFactory()
+
+    def request(self, method, path, **kwargs):
+        request = getattr(self.factory, method)(path, **kwargs)
+
+        async def auser():
+            return self.user
+
+        request.user, request.auser = self.user, auser
+        return request
+
+    async def test_serve_streams_range_asynchronously(self):
+        request = self.request('get', '/', headers={'Range': 'bytes=2-5'})
+        response = await async_views.serve_document(request, self.document.pk)
+        self.assertEqual(response.status_code, 206)
+        self.assertTrue(response.is_async)
+        self.assertEqual(b''.join([chunk async for chunk in response.streaming_content]), b'2345')
+
+    async def test_list_and_delete(self):
+        response = await async_views.document_list(self.request('get', '/'))
+        self.assertContains(response, 'Slides')
+
+        response = await async_views.delete_document(self.request('post', '/'), self.document.pk)
+        self.assertEqual(response.status_code, 302)
+        self.assertFalse(await TopicDocument.objects.filter(pk=self.document.pk).aexists())
+
+
+@LOCAL_CACHE
+class CourseOutlineTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        # Run the rebuilds setUp queues so they do not mask the ones a test expects.
+        with self.captureOnCommitCallbacks(execute=True):
+            self.topic = make_topic()
+            self.course = self.topic.part.course
+            other_part = CoursePart.objects.create(course=self.course, title='Advanced')
+            for i in range(5):
+                topic = CourseTopic.objects.create(part=other_part, title=f'Topic {i}')
+                TopicText.objects.create(topic=topic, text=f'text {i}')
+        cache.clear()
+        self.url = reverse('course_outline', args=[self.course.pk])
+
+    def test_outline_is_built_with_bounded_queries_and_cached(self):
+        cache.clear()
+        # Course, part ids, then parts, topics, documents, texts; the ETag is the build time
+        with self.assertNumQueries(6):
+            outline = self.client.get(self.url).json()
+        self.assertEqual([part['title'] for part in outline['parts']], ['Basics', 'Advanced'])
+        self.assertEqual(len(outline['parts'][1]['topics']), 5)
+
+        with self.assertNumQueries(0):
+            self.client.get(self.url)
+
+    def test_change_rebuilds_only_the_affected_part(self):
+        course_outline_json(self.course.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            TopicText.objects.create(topic=self.topic, text='new text')
+
+        with self.assertNumQueries(0):
+            outline = self.client.get(self.url).json()
+        self.assertEqual(outline['parts'][0]['topics'][0]['texts'][0]['text'], 'new text')
+
+    def test_moving_a_topic_rebuilds_both_parts(self):
+        course_outline_json(self.course.pk)
+        topic = CourseTopic.objects.get(title='Topic 0')
+        with self.captureOnCommitCallbacks(execute=True):
+            topic.part = self.topic.part
+            topic.save()
+
+        outline = json.loads(course_outline_json(self.course.pk))
+        self.assertEqual([t['title'] for t in outline['parts'][0]['topics']], ['Syntax', 'Topic 0'])
+        self.assertNotIn('Topic 0', [t['title'] for t in outline['parts'][1]['topics']])
+
+    def test_moving_a_part_rebuilds_the_course_it_left(self):
+        other = Course.objects.create(title='Rust', description='')
+        course_outline_json(self.course.pk)
+        part = self.topic.part
+        with self.captureOnCommitCallbacks(execute=True):
+            part.course = other
+            part.save()
+
+        self.assertNotIn('Basics', course_outline_json(self.course.pk))
+        self.assertIn('Basics', course_outline_json(other.pk))
+
+    def test_missing_course(self):
+        self.assertEqual(self.client.get(reverse('course_outline', args=[0])).status_code, 404)
+
+
+@LOCAL_CACHE
+class HttpCacheTests(TestCase):
+    def setUp(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.topic = make_topic()
+            self.course = self.topic.part.course
+            make_documents(self.topic, 3)
+        cache.clear()
+
+    def test_unchanged_outline_answers_304_until_the_subtree_changes(self):
+        url = reverse('course_outline', args=[self.course.pk])
+        response = self.client.get(url)
+        etag = response['ETag']
+        self.assertIn('Last-Modified', response)
+
+        with self.assertNumQueries(0):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            TopicDocument.objects.first().soft_delete()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+        etag = response['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            TopicDocument.all_objects.filter(pk=TopicDocument.objects.first().pk).delete()
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_document_list_is_served_from_the_response_cache(self):
+        url = reverse('document_list')
+        self.client.get(url)  # sets the CSRF cookie the cached page depends on
+        first = self.client.get(url)
+        self.assertTemplateUsed(first, 'document_list.html')
+
+        cached = self.client.get(url)
+        self.assertEqual(cached.templates, [])
+        self.assertEqual(cached.content, first.content)
+        self.assertEqual(cached['ETag'], first['ETag'])
+        self.assertIn('private', cached['Cache-Control'])
+
+        with self.assertNumQueries(0):
+            self.client.get(url)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.course.save()  # an ancestor title shows on every row
+        self.assertTemplateUsed(self.client.get(url), 'document_list.html')
+
+        document = TopicDocument.objects.first()
+        document.name = 'Renamed'
+        with self.captureOnCommitCallbacks(execute=True):
+            document.save()
+        changed = self.client.get(url)
+        self.assertTemplateUsed(changed, 'document_list.html')
+        self.assertContains(changed, 'Renamed')
+
+    def test_requests_without_the_csrf_cookie_bypass_the_cache(self):
+        response = self.client.get(reverse('document_list'))
+        self.assertNotIn('ETag', response)
+
+
+class IndexUsageTests(TestCase):
+    def setUp(self):
+        self.topic = make_topic()
+        self.course = self.topic.part.course
+        self.user = User.objects.create_user('learner')
+        make_documents(self.topic, 20)
+        UserProgress.objects.create(user=self.user, course=self.course)
+        Certificate.objects.create(user=self.user, course=self.course)
+
+    def assertUsesIndex(self, queryset, name):
+        if connection.vendor == 'postgresql':
+            # A handful of rows is cheaper to scan; ask for the plan a large table would get.
+            with connection.cursor() as cursor:
+                cursor.execute('SET LOCAL enable_seqscan = off')
+        self.assertIn(name, queryset.explain())
+
+    def test_documents_per_topic_newest_first(self):
+        self.assertUsesIndex(
+            TopicDocument.objects.filter(topic=self.topic).order_by('-created_at', '-id').only('id', 'name'),
+            'topicdoc_live_topic_cover_idx',
+        )
+
+    def test_document_list_page(self):
+        self.assertUsesIndex(TopicDocument.objects.order_by('-created_at', '-id')[:50], 'topicdoc_live_listing_idx')
+
+    def test_progress_per_user(self):
+        self.assertUsesIndex(
+            UserProgress.objects.filter(user=self.user).order_by('-updated_at').values('course_id'),
+            'userprogress_live_user_idx',
+        )
+
+    def test_certificates_per_course(self):
+        self.assertUsesIndex(
+            Certificate.objects.filter(course=self.course).order_by('-created_at').values('user_id'),
+            'certificate_live_course_idx',
+        )
+
+
+class CounterTests(TestCase):
+    def setUp(self):
+        self.topic = make_topic()
+        self.part = self.topic.part
+        self.course = self.part.course
+        for i in range(3):
+            TopicDocument.objects.create(topic=self.topic, name=f'doc-{i}', file=f'topic_documents/doc-{i}.pdf')
+        TopicText.objects.create(topic=self.topic, text='notes')
+        self.other = CourseTopic.objects.create(part=self.part, title='Loops')
+        make_documents(self.other, 2, start=3)  # bulk_create sends no signals
+        recount(CourseTopic.objects.filter(pk=self.other.pk))
+        recount(CoursePart.objects.filter(pk=self.part.pk))
+        recount(Course.objects.filter(pk=self.course.pk))
+
+    def counts(self, instance):
+        return dict(type(instance).all_objects.filter(pk=instance.pk).values(*type(instance).COUNTERS).get())
+
+    def assertNoDrift(self):
+        self.assertEqual([reconcile(model, dry_run=True) for model in (CourseTopic, CoursePart, Course)], [0, 0, 0])
+
+    def test_creates_and_deletes_update_every_ancestor(self):
+        self.assertEqual(self.counts(self.topic), {'document_count': 3, 'text_count': 1})
+        self.assertEqual(self.counts(self.part), {'topic_count': 2, 'document_count': 5})
+        user = User.objects.create_user('learner')
+        UserProgress.objects.create(user=user, course=self.course)
+        Certificate.objects.create(user=user, course=self.course)
+        TopicDocument.objects.filter(topic=self.topic).first().delete()
+        self.assertEqual(self.counts(self.course), {
+            'part_count': 1, 'topic_count': 2, 'document_count': 4, 'enrolled_count': 1, 'certificate_count': 1,
+        })
+        self.assertEqual(Course.objects.get(pk=self.course.pk).completion_percent, 100)
+
+        self.part.delete()
+        self.assertEqual(self.counts(self.course)['document_count'], 0)
+        self.assertNoDrift()
+
+    def test_soft_deleted_subtrees_stop_counting_until_restored(self):
+        TopicDocument.objects.filter(topic=self.topic).first().soft_delete()
+        self.topic.soft_delete()
+        self.assertEqual(self.counts(self.part), {'topic_count': 1, 'document_count': 2})
+        TopicDocument.objects.create(topic=self.other, name='while deleted', file='topic_documents/x.pdf')
+        self.part.soft_delete()
+        self.assertEqual(self.counts(self.course)['topic_count'], 0)
+
+        self.part.restore()
+        self.topic.refresh_from_db()
+        self.topic.restore()
+        # The document deleted on its own before the topic stays deleted and uncounted.
+        self.assertEqual(self.counts(self.part), {'topic_count': 2, 'document_count': 5})
+        self.assertEqual(self.counts(self.course)['document_count'], 5)
+        self.assertNoDrift()
+
+    def test_moves_update_old_and_new_ancestors(self):
+        other_course = Course.objects.create(title='Rust', description='')
+        other_part = CoursePart.objects.create(course=other_course, title='Ownership')
+        document = TopicDocument.objects.filter(topic=self.topic).first()
+        document.topic = self.other
+        document.save()
+        self.assertEqual(self.counts(self.topic)['document_count'], 2)
+        self.assertEqual(self.counts(self.other)['document_count'], 3)
+
+        self.other.part = other_part
+        self.other.save()
+        self.assertEqual(self.counts(self.part), {'topic_count': 1, 'document_count': 2})
+        self.assertEqual(self.counts(other_part), {'topic_count': 1, 'document_count': 3})
+
+        other_part.course = self.course
+        other_part.save()
+        self.assertEqual(self.counts(self.course)['document_count'], 5)
+        self.assertEqual(self.counts(other_course)['part_count'], 0)
+        # Saving again is not another move.
+        other_part.save()
+        self.assertNoDrift()
+
+    def test_catalog_is_one_query(self):
+        Course.objects.create(title='Rust', description='')
+        with self.assertNumQueries(1):
+            catalog = [(course.title, course.part_count, course.document_count) for course in Course.objects.for_catalog()]
+        self.assertEqual(catalog, [('Python', 1, 5), ('Rust', 0, 0)])
+
+    def test_reconcile_fixes_drift(self):
+        Course.objects.filter(pk=self.course.pk).update(topic_count=40)
+        CourseTopic.objects.filter(pk=self.topic.pk).update(document_count=0)
+        out = StringIO()
+        call_command('reconcile_counters', '--batch-size', '1', stdout=out)
+        self.assertIn('1 course topics, 0 course parts, 1 courses', out.getvalue())
+        self.assertNoDrift()
+
+
+class QuizCompletionTests(TestCase):
+    def setUp(self):
+        self.course = Course.objects.create(title='Python', description='')
+        self.quizzes = [Quiz.objects.create(course=self.course, title=f'Quiz {i}') for i in range(2)]
+        self.alice = User.objects.create_user('alice')
+        self.bob = User.objects.create_user('bob')
+        for user in (self.alice, self.bob):
+            UserProgress.objects.create(user=user, course=self.course)
+
+    def test_eligibility_leaderboard_and_stats(self):
+        record_quiz_completion(self.alice, self.quizzes[0], score=8)
+        record_quiz_completion(self.alice, self.quizzes[1], score=9)
+        record_quiz_completion(self.bob, self.quizzes[0], score=10)
+
+        self.assertEqual(
+            list(QuizCompletion.objects.eligible_for_certificate().values_list('user_id', 'course_id')),
+            [(self.alice.pk, self.course.pk)],
+        )
+        board = list(QuizCompletion.objects.leaderboard(self.course.pk))
+        self.assertEqual([row['user__username'] for row in board], ['alice', 'bob'])
+        self.assertEqual(board[0]['total_score'], 17)
+
+        course = Course.objects.with_completion_stats().get()
+        self.assertEqual((course.quiz_count, course.enrolled_count, course.completed_count), (2, 2, 1))
+        self.assertEqual(UserProgress.objects.get(user=self.bob).completed_quizzes[str(self.quizzes[0].pk)]['score'], 10)
+
+    def test_soft_deleted_quizzes_drop_out_of_eligibility(self):
+        record_quiz_completion(self.alice, self.quizzes[0])
+        record_quiz_completion(self.alice, self.quizzes[1])
+        record_quiz_completion(self.bob, self.quizzes[0])
+        self.quizzes[1].soft_delete()
+        self.assertEqual(
+            sorted(QuizCompletion.objects.eligible_for_certificate().values_list('user_id', flat=True)),
+            [self.alice.pk, self.bob.pk],
+        )
+        self.assertEqual(Course.objects.with_completion_stats().get().completed_count, 2)
+
+    def test_backfill_from_json(self):
+        migration = importlib.import_module('courses.migrations.0005_quiz_completion')
+        UserProgress.objects.filter(user=self.alice).update(completed_quizzes={
+            str(self.quizzes[0].pk): 7,
+            str(self.quizzes[1].pk): {'score': 5, 'completed_at': '2025-01-01T00:00:00+00:00'},
+            '999': True,
+        })
+        migration.backfill_completions(apps, None)
+
+        scores = dict(QuizCompletion.objects.values_list('quiz_id', 'score'))
+        self.assertEqual(scores, {self.quizzes[0].pk: 7, self.quizzes[1].pk: 5})
+
+
+@override_settings(PROGRESS_BACKGROUND_FLUSH=False)
+class ProgressBufferTests(TestCase):
+    def setUp(self):
+        self.course = Course.objects.create(title='Python', description='')
+        self.quizzes = [Quiz.objects.create(course=self.course, title=f'Quiz {i}') for i in range(3)]
+
+    def fill(self, buffer, users):
+        for user in users:
+            for quiz in self.quizzes:
+                buffer.add(user.pk, quiz.pk, self.course.pk, score=1)
+
+    def test_flush_cost_does_not_grow_with_events(self):
+        few = [User.objects.create_user(f'few-{i}') for i in range(2)]
+        many = [User.objects.create_user(f'many-{i}') for i in range(20)]
+        schedule_issuance([self.course.pk])  # both flushes then share the pending issuance job
+        counts = []
+        for users in (few, many):
+            buffer = ProgressBuffer()
+            self.fill(buffer, users)
+            with CaptureQueriesContext(connection) as queries:
+                self.assertEqual(buffer.flush(), len(users) * len(self.quizzes))
+            counts.append(len(queries))
+        self.assertEqual(counts[0], counts[1])
+        self.assertEqual(QuizCompletion.objects.count(), 66)
+        self.assertEqual(Course.objects.get().enrolled_count, 22)
+
+    def test_events_merge_into_the_progress_blob(self):
+        user = User.objects.create_user('alice')
+        UserProgress.objects.create(user=user, course=self.course, completed_quizzes={'999': {'score': 3}})
+        buffer = ProgressBuffer()
+        later = timezone.now()
+        buffer.add(user.pk, self.quizzes[0].pk, self.course.pk, score=9, completed_at=later)
+        buffer.add(user.pk, self.quizzes[0].pk, self.course.pk, score=1, completed_at=later - timedelta(minutes=1))
+        buffer.add(user.pk, self.quizzes[1].pk, self.course.pk, score=5)
+        self.assertEqual(len(buffer), 2)
+        buffer.flush()
+
+        blob = UserProgress.objects.get(user=user).completed_quizzes
+        self.assertEqual(blob.keys(), {'999', str(self.quizzes[0].pk), str(self.quizzes[1].pk)})
+        self.assertEqual(blob[str(self.quizzes[0].pk)]['score'], 9)
+        self.assertEqual(len(buffer), 0)
+
+    def post(self, events):
+        return self.client.post(reverse('progress_events'), {'events': events}, content_type='application/json')
+
+    @override_settings(PROGRESS_BUFFER_SIZE=2)
+    def test_events_endpoint_buffers_until_the_batch_is_full(self):
+        user = User.objects.create_user('alice')
+        self.client.force_login(user)
+        self.assertEqual(self.post([{'quiz': self.quizzes[0].pk, 'score': 4}]).status_code, 202)
+        self.assertFalse(QuizCompletion.objects.exists())
+        self.post([{'quiz': self.quizzes[1].pk, 'score': 6, 'completed_at': '2026-01-01T10:00:00+00:00'}])
+        self.assertEqual(QuizCompletion.objects.count(), 2)
+
+        self.assertEqual(self.post([{'quiz': 0}]).status_code, 400)
+        self.assertEqual(self.post([{'quiz': self.quizzes[0].pk, 'completed_at': 'yesterday'}]).status_code, 400)
+        for score in ('high', True, [1]):
+            self.assertEqual(self.post([{'quiz': self.quizzes[0].pk, 'score': score}]).status_code, 400)
+        response = self.client.post(
+            reverse('progress_events'), f'{{"events": [{{"quiz": {self.quizzes[0].pk}, "score": NaN}}]}}',
+            content_type='application/json',
+        )
+        self.assertEqual(response.status_code, 400)
+
+    def test_a_bad_event_is_dropped_without_blocking_the_rest(self):
+        users = [User.objects.create_user(f'user-{i}') for i in range(2)]
+        buffer = ProgressBuffer()
+        self.fill(buffer, users)
+        buffer.add(users[0].pk, self.quizzes[0].pk, self.course.pk, score='high')
+        with self.assertLogs('courses.progress', 'ERROR'):
+            self.assertEqual(buffer.flush(), 5)
+        self.assertEqual(len(buffer), 0)
+        self.assertEqual(QuizCompletion.objects.count(), 5)
+
+    @override_settings(PROGRESS_BACKGROUND_FLUSH=True, PROGRESS_BUFFER_SIZE=2)
+    def test_a_full_buffer_wakes_the_background_flusher(self):
+        buffer = ProgressBuffer()
+        flushed = threading.Event()
+        buffer.flush = flushed.set  # the thread's own database connection cannot see this test's rows
+        self.fill(buffer, [User.objects.create_user('alice')])
+        self.assertTrue(flushed.wait(1))
+        self.assertTrue(buffer.flusher.is_alive())
+        self.assertFalse(QuizCompletion.objects.exists())
+
+    @skipUnless(connection.vendor == 'postgresql', 'jsonb merge')
+    def test_jsonb_merge_patches_only_the_given_rows(self):
+        users = [User.objects.create_user(f'user-{i}') for i in range(2)]
+        for user in users:
+            UserProgress.objects.create(user=user, course=self.course, completed_quizzes={'999': {'score': 3}})
+        now = timezone.now()
+        patch = {str(self.quizzes[0].pk): {'score': 7, 'completed_at': now.isoformat()}, '999': {'score': 4}}
+        self.assertEqual(_merge_jsonb({(users[0].pk, self.course.pk): patch}, now), set())
+
+        merged, untouched = (UserProgress.objects.get(user=user) for user in users)
+        self.assertEqual(merged.completed_quizzes, patch)
+        self.assertEqual(merged.updated_at, now)
+        self.assertEqual(untouched.completed_quizzes, {'999': {'score': 3}})
+
+
+@LOCAL_CACHE
+class GradingTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        course = Course.objects.create(title='Python', description='')
+        self.quiz = Quiz.objects.create(course=course, title='Basics')
+        self.q1 = QuizQuestion.objects.create(quiz=self.quiz, text='Pick one')
+        self.q1_right = QuizAnswer.objects.create(question=self.q1, text='a', is_correct=True)
+        self.q1_wrong = QuizAnswer.objects.create(question=self.q1, text='b', is_correct=False)
+        self.q2 = QuizQuestion.objects.create(quiz=self.quiz, text='Pick two')
+        self.q2_answers = {
+            QuizAnswer.objects.create(question=self.q2, text=text, is_correct=True).pk for text in 'cd'
+        }
+        self.users = [User.objects.create_user(f'user{i}') for i in range(3)]
+
+    def test_batch_is_graded_from_cached_key_and_upserted(self):
+        answer_keys([self.quiz.pk])
+        submissions = [
+            Submission(self.users[0].pk, self.quiz.pk, {self.q1.pk: [self.q1_right.pk], self.q2.pk: self.q2_answers}),
+            Submission(self.users[1].pk, self.quiz.pk, {self.q1.pk: [self.q1_wrong.pk], self.q2.pk: self.q2_answers}),
+            Submission(self.users[2].pk, self.quiz.pk, {}),
+        ]
+        # upsert, certificate job lookup and insert (in its own savepoint), inside a savepoint
+        with self.assertNumQueries(7):
+            results = grade_submissions(submissions)
+        self.assertEqual([r.score for r in results], [100, 50, 0])
+
+        QuizCompletion.objects.get(user=self.users[2]).soft_delete()
+        grade_submissions([Submission(self.users[2].pk, self.quiz.pk, {self.q1.pk: [self.q1_right.pk]})])
+        self.assertEqual(QuizCompletion.objects.get(user=self.users[2]).score, 50)
+        self.assertEqual(QuizCompletion.objects.count(), 3)
+
+    def test_editing_answers_invalidates_key(self):
+        self.assertEqual(answer_keys([self.quiz.pk])[self.quiz.pk]['questions'][self.q1.pk], {self.q1_right.pk})
+        with self.captureOnCommitCallbacks(execute=True):
+            self.q1_wrong.is_correct = True
+            self.q1_wrong.save()
+            self.assertEqual(answer_keys([self.quiz.pk])[self.quiz.pk]['questions'][self.q1.pk], {self.q1_right.pk})
+        self.assertEqual(
+            answer_keys([self.quiz.pk])[self.quiz.pk]['questions'][self.q1.pk], {self.q1_right.pk, self.q1_wrong.pk}
+        )
+
+    def test_moving_a_question_invalidates_both_keys(self):
+        other = Quiz.objects.create(course=self.quiz.course, title='Advanced')
+        self.assertIn(self.q2.pk, answer_keys([self.quiz.pk, other.pk])[self.quiz.pk]['questions'])
+        question = QuizQuestion.objects.get(pk=self.q2.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            question.quiz = other
+            question.save()
+        keys = answer_keys([self.quiz.pk, other.pk])
+        self.assertNotIn(self.q2.pk, keys[self.quiz.pk]['questions'])
+        self.assertEqual(keys[other.pk]['questions'][self.q2.pk], self.q2_answers)
+
+
+@override_settings(CERTIFICATE_RENDER_PROCESSES=1)
+class CertificatePipelineTests(TempMediaMixin, TestCase):
+    def test_completions_issue_and_render_certificates_once(self):
+        course = Course.objects.create(title='Python', description='')
+        quiz = Quiz.objects.create(course=course, title='Final')
+        alice, bob = User.objects.create_user('alice'), User.objects.create_user('bob')
+        record_quiz_completion(alice, quiz, score=90)
+        record_quiz_completion(bob, quiz, score=70)
+        self.assertEqual(Job.objects.filter(status=Job.PENDING).count(), 1)
+
+        while run_pending():
+            pass
+        certificates = Certificate.objects.order_by('user__username')
+        self.assertEqual([c.user.username for c in certificates], ['alice', 'bob'])
+        with certificates[0].pdf.open('rb') as fh:
+            self.assertTrue(fh.read().startswith(b'%PDF'))
+
+        record_quiz_completion(alice, quiz, score=95)
+        while run_pending():
+            pass
+        self.assertEqual(Certificate.objects.count(), 2)
+        self.assertFalse(Job.objects.exclude(status=Job.DONE).exists())
+
+    def test_issuance_counts_only_inserted_certificates(self):
+        course = Course.objects.create(title='Python', description='')
+        quiz = Quiz.objects.create(course=course, title='Final')
+        alice, bob = User.objects.create_user('alice'), User.objects.create_user('bob')
+        for user in (alice, bob):
+            QuizCompletion.objects.create(user=user, quiz=quiz, course=course, score=90, completed_at=timezone.now())
+        # Issued meanwhile by another worker: eligible when read, a conflict when inserted.
+        self.assertEqual(_insert_certificates([(alice.pk, course.pk)]), 1)
+        self.assertEqual(_insert_certificates([(alice.pk, course.pk), (bob.pk, course.pk)]), 1)
+        self.assertEqual(Certificate.objects.count(), 2)
+        self.assertEqual(issue_certificates([course.pk]), 0)
+
+    def test_unique_jobs_share_one_pending_row(self):
+        first = schedule_issuance([2, 1])
+        self.assertEqual(schedule_issuance([1, 2]), first)
+        Job.objects.filter(pk=first.pk).update(status=Job.RUNNING)
+        second = schedule_issuance([1, 2])
+        self.assertNotEqual(second, first)
+        # Two enqueues racing past the lookup: the partial unique index admits one.
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Job.objects.create(kind=second.kind, payload=second.payload, run_after=timezone.now(),
+                               dedupe_key=second.dedupe_key)
+
+
+class SearchTests(TempMediaMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        _inverted_index.reset()
+        self.addCleanup(_inverted_index.reset)
+        self.topic = make_topic()
+        Course.objects.create(title='Django internals', description='Querysets and the ORM')
+        TopicText.objects.create(topic=self.topic, text='Python generators and the ORM')
+
+    def search(self, query, **params):
+        return self.client.get(reverse('search'), {'q': query, **params}).json()
+
+    def test_ranked_search_across_models(self):
+        result = self.search('orm')
+        self.assertEqual(result['count'], 2)
+        self.assertEqual([hit['kind'] for hit in result['results']], ['course', 'text'])
+
+        result = self.search('orm', page=2)
+        self.assertEqual(result['results'], [])
+
+    def test_index_follows_saves_and_deletes(self):
+        self.search('orm')
+        text = TopicText.objects.create(topic=self.topic, text='decorators')
+        self.assertEqual(self.search('decorators')['count'], 1)
+        text.delete()
+        self.assertEqual(self.search('decorators')['count'], 0)
+
+    def test_pdf_text_is_extracted_in_background(self):
+        from .pdf import render_text_pdf
+
+        document = TopicDocument(topic=self.topic, name='Handout')
+        document.file.save('handout.pdf', ContentFile(render_text_pdf([(12, 'Metaclasses explained')])))
+        self.assertEqual(self.search('metaclasses')['count'], 0)
+
+        run_pending()
+        result = self.search('metaclasses')
+        self.assertEqual(result['results'][0]['id'], document.pk)
+        self.assertEqual(TopicDocument.objects.get(pk=document.pk).text_content, 'Metaclasses explained')
+
+    def test_existing_documents_are_queued_for_extraction(self):
+        from .pdf import render_text_pdf
+
+        # Stored before extraction existed: bulk_create sends no signals, so no job was queued.
+        name = document_storage().save('topic_documents/old.pdf', ContentFile(render_text_pdf([(12, 'Descriptors')])))
+        document, = TopicDocument.objects.bulk_create([TopicDocument(topic=self.topic, name='Old', file=name)])
+        out = StringIO()
+        call_command('extract_documents', stdout=out)
+        call_command('extract_documents', stdout=out)
+        self.assertEqual(Job.objects.filter(kind='extract_document_text', status=Job.PENDING).count(), 1)
+
+        run_pending()
+        self.assertEqual(TopicDocument.objects.get(pk=document.pk).text_content, 'Descriptors')
+
+
+class SoftDeleteTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.topic = make_topic()
+        self.part = self.topic.part
+        self.course = self.part.course
+        make_documents(self.topic, 3)
+        TopicText.objects.create(topic=self.topic, text='notes')
+
+    def test_course_cascade_is_set_based(self):
+        # course, parts, topics, documents, texts inside one savepoint
+        with self.assertNumQueries(7):
+            self.course.soft_delete()
+
+        for model in (Course, CoursePart, CourseTopic, TopicDocument, TopicText):
+            self.assertFalse(model.objects.exists(), model)
+            self.assertTrue(model.all_objects.exists(), model)
+
+    def test_restore_keeps_children_deleted_on_their_own(self):
+        earlier = TopicDocument.objects.first()
+        earlier.soft_delete()
+        self.course.soft_delete()
+        self.course.restore()
+
+        self.assertEqual(TopicDocument.objects.count(), 2)
+        self.assertFalse(TopicDocument.objects.filter(pk=earlier.pk).exists())
+        self.assertTrue(CourseTopic.objects.filter(pk=self.topic.pk).exists())
+
+    def test_outline_and_topic_choices_hide_soft_deleted_rows(self):
+        other = CourseTopic.objects.create(part=self.part, title='Loops')
+        course_outline_json(self.course.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            other.soft_delete()
+
+        self.assertEqual(topic_choices(), [(self.topic.pk, 'Basics-Syntax')])
+        outline = self.client.get(reverse('course_outline', args=[self.course.pk])).json()
+        self.assertEqual([t['title'] for t in outline['parts'][0]['topics']], ['Syntax'])
+
+    def test_titles_of_soft_deleted_rows_can_be_reused(self):
+        CourseForm = modelform_factory(Course, fields=['title', 'description'])
+        self.assertFalse(CourseForm({'title': 'Python', 'description': 'Again'}).is_valid())
+        self.part.soft_delete()
+        self.course.soft_delete()
+
+        form = CourseForm({'title': 'Python', 'description': 'Again'})
+        self.assertTrue(form.is_valid(), form.errors)
+        course = form.save()
+        CoursePart.objects.create(course=self.course, title='Basics')
+        # The old course cannot come back while the new one holds its title.
+        with self.assertRaises(ValidationError):
+            self.course.restore()
+        course.soft_delete()
+        self.course.restore()
+
+    def test_soft_delete_twice_is_a_no_op(self):
+        document = TopicDocument.objects.create(topic=self.topic, name='extra', file='topic_documents/extra.pdf')
+        stale = TopicDocument.all_objects.get(pk=document.pk)
+        document.soft_delete()
+        # The guarded UPDATE matches nothing, so no cascade and no signal follow.
+        with self.assertNumQueries(3):
+            stale.soft_delete()
+        self.topic.refresh_from_db()
+        self.assertEqual(self.topic.document_count, 0)  # make_documents bulk-created the other three
+
+    def test_delete_document_view_soft_deletes(self):
+        document = TopicDocument.objects.first()
+        self.client.post(reverse('delete_document', args=[document.pk]))
+        self.assertIsNotNone(TopicDocument.all_objects.get(pk=document.pk).deleted_at)
+        self.assertEqual(self.client.get(reverse('update_document', args=[document.pk])).status_code, 404)
+
+
+class FileCleanupTests(TempMediaMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.topic = make_topic()
+        self.document = TopicDocument(topic=self.topic, name='Slides')
+        self.document.file.save('slides.pdf', ContentFile(b'version one'))
+        self.storage = document_storage()
+
+    def test_replaced_file_is_removed_by_the_worker(self):
+        old_name = self.document.file.name
+        document = TopicDocument.objects.get(pk=self.document.pk)
+        document.file = ContentFile(b'version two', name='slides.pdf')
+        document.save()
+
+        self.assertTrue(self.storage.exists(old_name))
+        run_pending()
+        self.assertFalse(self.storage.exists(old_name))
+        self.assertTrue(self.storage.exists(document.file.name))
+
+    def test_hard_delete_removes_file_but_soft_delete_keeps_it(self):
+        name = self.document.file.name
+        self.document.soft_delete()
+        run_pending()
+        self.assertTrue(self.storage.exists(name))
+
+        self.document.delete()
+        run_pending()
+        self.assertFalse(self.storage.exists(name))
+
+    def test_purge_removes_files_of_expired_soft_deletes(self):
+        name = self.document.file.name
+        kept = TopicDocument(topic=self.topic, name='Notes')
+        kept.file.save('notes.pdf', ContentFile(b'recent'))
+        self.client.post(reverse('delete_document', args=[self.document.pk]))
+        TopicDocument.all_objects.filter(pk=self.document.pk).update(deleted_at=timezone.now() - timedelta(days=31))
+        kept.soft_delete()
+
+        out = StringIO()
+        call_command('purge_deleted', '--days=30', stdout=out)
+        self.assertIn('1 topic documents', out.getvalue())
+        run_pending()
+        self.assertFalse(TopicDocument.all_objects.filter(pk=self.document.pk).exists())
+        self.assertFalse(self.storage.exists(name))
+        self.assertTrue(self.storage.exists(kept.file.name))
+
+    def test_reconcile_command_removes_only_orphans(self):
+        orphan = self.storage.save('topic_documents/orphan.pdf', ContentFile(b'nobody owns me'))
+        out = StringIO()
+        call_command('reconcile_documents', '--min-age=0', '--batch-size=1', '--check-missing', stdout=out)
+
+        self.assertFalse(self.storage.exists(orphan))
+        self.assertTrue(self.storage.exists(self.document.file.name))
+        self.assertIn('removed 1 orphans', out.getvalue())
+
+
+class CourseExchangeTests(TempMediaMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.topic = make_topic()
+        self.course = self.topic.part.course
+        TopicText.objects.create(topic=self.topic, text='Indentation matters')
+        document = TopicDocument(topic=self.topic, name='Cheatsheet')
+        document.file.save('cheatsheet.txt', ContentFile(b'print("hi")'))
+        quiz = Quiz.objects.create(course=self.course, title='Quiz 1')
+        question = QuizQuestion.objects.create(quiz=quiz, text='Is Python typed?')
+        QuizAnswer.objects.create(question=question, text='Dynamically', is_correct=True)
+        self.staff = User.objects.create_user('staff', password='pw', is_staff=True)
+
+    def export(self, fmt):
+        self.client.force_login(self.staff)
+        response = self.client.get(reverse('export_course', args=[self.course.pk]), {'format': fmt})
+        self.assertEqual(response.status_code, 200)
+        path = os.path.join(self.media_root, f'export.{fmt}')
+        with open(path, 'wb') as fh:
+            fh.writelines(response.streaming_content)
+        return path
+
+    def test_zip_round_trip_restores_course_and_files(self):
+        path = self.export('zip')
+        Course.all_objects.all().delete()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            importer = import_courses(path)
+
+        course = Course.objects.get(title='Python')
+        self.assertEqual(importer.counts['document'], 1)
+        self.assertEqual((course.part_count, course.document_count), (1, 1))
+        document = TopicDocument.objects.get(topic__part__course=course)
+        self.assertEqual(document.file.read(), b'print("hi")')
+        self.assertEqual(Job.objects.filter(kind='extract_document_text', payload={'document_id': document.pk}).count(), 1)
+        answer = QuizAnswer.objects.select_related('question__quiz').get()
+        self.assertEqual(answer.question.quiz.course, course)
+        self.assertTrue(answer.is_correct)
+        self.assertIn('Cheatsheet', course_outline_json(course.pk))
+
+    def test_reimport_adds_nothing(self):
+        path = self.export('zip')
+        models = (Course, CoursePart, CourseTopic, TopicText, TopicDocument, Quiz, QuizQuestion, QuizAnswer)
+        before = [model.objects.count() for model in models]
+        files = sorted(os.listdir(os.path.join(self.media_root, 'topic_documents')))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            import_courses(path)
+        self.assertEqual([model.objects.count() for model in models], before)
+        self.assertEqual(sorted(os.listdir(os.path.join(self.media_root, 'topic_documents'))), files)
+
+    def test_failed_import_removes_its_files(self):
+        path = self.export('zip')
+        Course.all_objects.all().delete()
+        run_pending()
+        broken = os.path.join(self.media_root, 'broken.zip')
+        with zipfile.ZipFile(path) as source, zipfile.ZipFile(broken, 'w') as target:
+            for item in source.infolist():
+                data = source.read(item)
+                if item.filename.endswith('.jsonl'):
+                    data += b'{"type": "answer", "question": 0, "text": "?", "is_correct": false}\n'
+                target.writestr(item, data)
+
+        with self.assertRaises(BundleError):
+            import_courses(broken)
+        self.assertFalse(TopicDocument.all_objects.exists())
+        self.assertEqual(os.listdir(os.path.join(self.media_root, 'topic_documents')), [])
+
+    def test_import_reuses_natural_keys_in_batches(self):
+        path = os.path.join(self.media_root, 'topics.jsonl')
+        with open(path, 'w') as fh:
+            fh.write('{"type": "course", "title": "Python", "description": ""}\n')
+            fh.write('{"type": "part", "course": "Python", "title": "Basics"}\n')
+            for i in range(300):
+                fh.write(f'{{"type": "topic", "course": "Python", "part": "Basics", "title": "Topic {i}"}}\n')
+                fh.write(f'{{"type": "text", "course": "Python", "part": "Basics", "topic": "Topic {i}", "text": "t"}}\n')
+
+        with CaptureQueriesContext(connection) as queries:
+            import_courses(path, batch_size=100)
+
+        self.assertLess(len(queries), 40)
+        self.assertEqual(Course.objects.count(), 1)
+        self.assertEqual(CoursePart.objects.filter(course=self.course).count(), 1)
+        self.assertEqual(CourseTopic.objects.filter(part__course=self.course).count(), 301)
+        self.assertEqual(TopicText.objects.filter(topic__part__course=self.course).count(), 301)
+
+
+@override_settings(DATABASE_REPLICAS=['replica_1'])
+class ReplicaRoutingTests(TransactionTestCase):
+    # Not TestCase: its wrapping transaction would pin every read to the primary.
+    router = PrimaryReplicaRouter()
+
+    def in_request(self, view, cookies=None):
+        request = RequestFactory().get('/')
+        request.COOKIES.update(cookies or {})
+        return copy_context().run(ReplicaPinningMiddleware(view), request)
+
+    def test_content_reads_go_to_replicas_and_writes_pin_the_primary(self):
+        def view(request):
+            self.assertEqual(self.router.db_for_read(Course), 'replica_1')
+            self.assertEqual(self.router.db_for_read(Job), 'default')
+            with transaction.atomic():
+                self.assertEqual(self.router.db_for_read(Course), 'default')
+            self.assertEqual(self.router.db_for_write(Course), 'default')
+            self.assertEqual(self.router.db_for_read(Course), 'default')
+            return HttpResponse()
+
+        response = self.in_request(view)
+        self.assertEqual(response.cookies[PIN_COOKIE].value, '1')
+
+    def test_pin_cookie_reads_from_primary(self):
+        def view(request):
+            self.assertEqual(self.router.db_for_read(Course), 'default')
+            return HttpResponse()
+
+        response = self.in_request(view, {PIN_COOKIE: '1'})
+        self.assertNotIn(PIN_COOKIE, response.cookies)
+
+    async def test_async_requests_pin_after_a_write(self):
+        async def view(request):
+            await Job.objects.acreate(kind='noop', run_after=timezone.now())
+            self.assertEqual(self.router.db_for_read(Course), 'default')
+            return HttpResponse()
+
+        middleware = ReplicaPinningMiddleware(view)
+        self.assertTrue(iscoroutinefunction(middleware))
+        response = await middleware(AsyncRequestFactory().get('/'))
+        self.assertEqual(response.cookies[PIN_COOKIE].value, '1')
+
+    @override_settings(DATABASE_REPLICAS=[])
+    def test_without_replicas_everything_uses_default(self):
+        self.assertEqual(self.router.db_for_read(Course), 'default')
+        self.assertIsNone(self.router.allow_migrate('default', 'courses'))
+        with self.settings(DATABASE_REPLICAS=['replica_1']):
+            self.assertFalse(self.router.allow_migrate('replica_1', 'courses'))
+
+
+@LOCAL_CACHE
+class RequestMetricsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        registry.reset()
+        self.addCleanup(registry.reset)
+        self.topic = make_topic()
+        make_documents(self.topic, 3)
+
+    def test_requests_are_measured_per_view(self):
+        with self.assertLogs('courses.metrics', 'INFO') as logs:
+            self.client.get(reverse('document_list'))
+        sample = json.loads(logs.records[0].getMessage())
+        self.assertEqual(sample['view'], 'document_list')
+        self.assertEqual(sample['status'], 200)
+        self.assertGreater(sample['queries'], 0)
+        self.assertEqual(sample['duplicate_queries'], 0)
+
+        body = self.client.get(reverse('metrics')).content.decode()
+        self.assertIn('courses_http_requests_total{view="document_list",method="GET",status="200"} 1', body)
+        self.assertIn('courses_http_request_duration_seconds_count{view="document_list",method="GET"} 1', body)
+        self.assertIn('courses_db_queries_per_request_bucket{view="document_list",method="GET",le="+Inf"} 1', body)
+
+    def test_repeated_statements_are_flagged(self):
+        def view(request):
+            for document in TopicDocument.objects.all():
+                document.topic.title  # one query per row
+            return HttpResponse()
+
+        with self.assertLogs('courses.metrics', 'INFO') as logs:
+            RequestMetricsMiddleware(view)(RequestFactory().get('/'))
+        sample = json.loads(logs.records[0].getMessage())
+        self.assertEqual(sample['duplicate_queries'], 2)
+        self.assertEqual(sample['most_repeated_count'], 3)
+
+    async def test_async_requests_are_measured(self):
+        async def view(request):
+            await TopicDocument.objects.acount()
+            return HttpResponse()
+
+        middleware = RequestMetricsMiddleware(view)
+        self.assertTrue(iscoroutinefunction(middleware))
+        with self.assertLogs('courses.metrics', 'INFO') as logs:
+            await middleware(AsyncRequestFactory().get('/'))
+        self.assertEqual(json.loads(logs.records[0].getMessage())['queries'], 1)
+
+    @override_settings(METRICS_ALLOWED_IPS=[])
+    def test_endpoint_is_local_only(self):
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 404)
+
+    def test_proxied_requests_need_the_token(self):
+        url = reverse('metrics')
+        self.assertEqual(self.client.get(url, HTTP_X_FORWARDED_FOR='203.0.113.9').status_code, 404)
+        with self.settings(METRICS_TOKEN='s3cret'):
+            self.assertEqual(self.client.get(url).status_code, 404)
+            response = self.client.get(url, HTTP_X_FORWARDED_FOR='203.0.113.9', HTTP_AUTHORIZATION='Bearer s3cret')
+            self.assertEqual(response.status_code, 200)
+
+
+@LOCAL_CACHE
+class BenchmarkSuiteTests(TestCase):
+    def test_generator_and_benchmark_results(self):
+        created = generate(courses=3, parts=2, topics=2, users=4, progress_per_user=2, batch_size=5)
+        self.assertEqual(created['topic'], 12)
+        self.assertEqual(UserProgress.objects.count(), 8)
+        self.assertEqual(QuizCompletion.objects.count(), 8)
+
+        results = run_benchmarks(iterations=2, warmup=0, host='testserver')
+        scenarios = results['scenarios']
+        self.assertLessEqual({'document_list', 'update_document_post', 'record_quiz_completion'}, scenarios.keys())
+        self.assertEqual(scenarios['document_list']['duplicate_queries'], 0)
+        self.assertEqual(results['meta']['rows']['topic'], 12)
+        self.assertEqual(compare(results, results), [])
+        # Write scenarios are rolled back.
+        self.assertEqual(QuizCompletion.objects.count(), 8)
+
+
+class AdminTests(TestCase):
+    def setUp(self):
+        self.client.force_login(User.objects.create_superuser('admin', password='pw'))
+        self.topic = make_topic()
+
+    def changelist_queries(self, model):
+        url = reverse(f'admin:courses_{model._meta.model_name}_changelist')
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.client.get(url).status_code, 200)
+        return len(queries)
+
+    def test_changelists_do_not_query_per_row(self):
+        part = self.topic.part
+        question = QuizQuestion.objects.create(quiz=Quiz.objects.create(course=part.course, title='Q'), text='?')
+        models = [CourseTopic, TopicDocument, TopicText, QuizAnswer]
+        make_documents(self.topic, 2)
+        QuizAnswer.objects.create(question=question, text='a', is_correct=True)
+        TopicText.objects.create(topic=self.topic, text='t')
+        before = [self.changelist_queries(model) for model in models]
+
+        for i in range(10):
+            topic = CourseTopic.objects.create(part=part, title=f'Topic {i}')
+            TopicText.objects.create(topic=topic, text='t')
+            QuizAnswer.objects.create(question=question, text=f'a{i}', is_correct=False)
+        make_documents(self.topic, 10, start=2)
+        self.assertEqual([self.changelist_queries(model) for model in models], before)
+
+    def autocomplete_queries(self, model, field_name):
+        url = reverse('admin:autocomplete')
+        params = {'app_label': 'courses', 'model_name': model._meta.model_name, 'field_name': field_name, 'term': ''}
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.client.get(url, params).status_code, 200)
+        return len(queries)
+
+    def test_autocomplete_results_do_not_query_per_row(self):
+        fields = [(TopicDocument, 'topic'), (QuizQuestion, 'quiz'), (QuizAnswer, 'question')]
+        quiz = Quiz.objects.create(course=self.topic.part.course, title='Q')
+        QuizQuestion.objects.create(quiz=quiz, text='?')
+        before = [self.autocomplete_queries(model, field) for model, field in fields]
+
+        for i in range(10):
+            CourseTopic.objects.create(part=self.topic.part, title=f'Topic {i}')
+            other = Quiz.objects.create(course=self.topic.part.course, title=f'Q{i}')
+            QuizQuestion.objects.create(quiz=other, text=f'?{i}')
+        self.assertEqual([self.autocomplete_queries(model, field) for model, field in fields], before)
+
+    def test_inline_rows_do_not_query_per_row(self):
+        url = reverse('admin:courses_coursepart_change', args=[self.topic.part_id])
+        self.client.get(url)  # warm the content type cache
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(url)
+        before = len(queries)
+        for i in range(10):
+            CourseTopic.objects.create(part=self.topic.part, title=f'Topic {i}')
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.client.get(url).status_code, 200)
+        self.assertEqual(len(queries), before)
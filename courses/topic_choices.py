@@ -0,0 +1,64 @@
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Q
+
+from .models import CourseTopic
+
+VERSION_KEY = 'courses:topic_choices:version'
+CHOICES_KEY = 'courses:topic_choices:v{version}'
+COUNT_KEY = 'courses:topic_choices:count:v{version}'
+CHOICES_TIMEOUT = 60 * 60 * 24
+
+
+def topic_label(part_title, topic_title):
+    # Mirrors CourseTopic.__str__ without touching the related part.
+    return f"{part_title}-{topic_title}"
+
+
+def topic_choices_version():
+    return cache.get_or_set(VERSION_KEY, 1, timeout=None)
+
+
+def _bump_version():
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        cache.set(VERSION_KEY, 1, timeout=None)
+
+
+def invalidate_topic_choices(**kwargs):
+    # After commit: bumping earlier lets a concurrent request cache the old rows under the new version.
+    transaction.on_commit(_bump_version)
+
+
+def topic_choices():
+    """Return ``[(topic_id, label), ...]`` for every topic, cached per version."""
+    key = CHOICES_KEY.format(version=topic_choices_version())
+    choices = cache.get(key)
+    if choices is None:
+        rows = CourseTopic.objects.order_by('part__title', 'title').values_list(
+            'id', 'part__title', 'title'
+        )
+        choices = [(pk, topic_label(part_title, title)) for pk, part_title, title in rows]
+        cache.set(key, choices, CHOICES_TIMEOUT)
+    return choices
+
+
+def topic_choice_count():
+    """``len(topic_choices())`` without loading the cached list."""
+    key = COUNT_KEY.format(version=topic_choices_version())
+    count = cache.get(key)
+    if count is None:
+        count = CourseTopic.objects.count()
+        cache.set(key, count, CHOICES_TIMEOUT)
+    return count
+
+
+def search_topics(term, limit=20):
+    rows = (
+        CourseTopic.objects
+        .filter(Q(title__icontains=term) | Q(part__title__icontains=term))
+        .order_by('part__title', 'title')
+        .values_list('id', 'part__title', 'title')[:limit]
+    )
+    return [(pk, topic_label(part_title, title)) for pk, part_title, title in rows]
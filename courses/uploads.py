@@ -0,0 +1,151 @@
+import hashlib
+import os
+import shutil
+from pathlib import Path
+
+from django.conf import settings
+from django.core.files import File
+from django.db import transaction
+
+from .models import DocumentUpload, TopicDocument
+
+COPY_BUFFER_SIZE = 64 * 1024
+
+
+class UploadError(Exception):
+    pass
+
+
+class AssembledFile(File):
+    # FileSystemStorage moves files exposing temporary_file_path() instead of copying them.
+    def __init__(self, file, name=None, sha256=None):
+        super().__init__(file, name)
+        self.sha256 = sha256  # hashed while assembling; the storage need not read it again
+
+    def temporary_file_path(self):
+        return self.file.name
+
+
+def default_chunk_size():
+    return getattr(settings, 'DOCUMENT_UPLOAD_CHUNK_SIZE', 8 * 1024 * 1024)
+
+
+def chunk_root():
+    return Path(getattr(settings, 'DOCUMENT_UPLOAD_CHUNK_ROOT', Path(settings.MEDIA_ROOT).parent / 'upload_chunks'))
+
+
+def chunk_dir(upload):
+    return chunk_root() / upload.token.hex
+
+
+def received_chunks(upload):
+    directory = chunk_dir(upload)
+    if not directory.is_dir():
+        return []
+    return sorted(int(entry.name) for entry in directory.iterdir() if entry.name.isdigit())
+
+
+def write_chunk(upload, index, stream, expected_sha256=None):
+    """
+    Stream one fixed-size chunk from ``stream`` to disk and return its sha256.
+
+    At most ``COPY_BUFFER_SIZE`` bytes are held in memory. The chunk only
+    becomes visible to ``received_chunks`` once it is complete and verified,
+    so a dropped connection leaves nothing behind but a ``.part`` file.
+    """
+    if upload.document_id:
+        raise UploadError('Upload is already complete')
+    if not 0 <= index < upload.chunk_count:
+        raise UploadError(f'Chunk index {index} out of range')
+
+    expected_size = upload.expected_chunk_size(index)
+    directory = chunk_dir(upload)
+    directory.mkdir(parents=True, exist_ok=True)
+    final_path = directory / str(index)
+    part_path = directory / f'{index}.part'
+
+    hasher = hashlib.sha256()
+    written = 0
+    with open(part_path, 'wb') as out:
+        while written <= expected_size:
+            data = stream.read(COPY_BUFFER_SIZE)
+            if not data:
+                break
+            written += len(data)
+            hasher.update(data)
+            out.write(data)
+
+    digest = hasher.hexdigest()
+    if written != expected_size:
+        part_path.unlink()
+        raise UploadError(f'Chunk {index} must be {expected_size} bytes, got {written}')
+    if expected_sha256 and expected_sha256.lower() != digest:
+        part_path.unlink()
+        raise UploadError(f'Chunk {index} checksum mismatch')
+
+    os.replace(part_path, final_path)
+    return digest
+
+
+def assemble(upload, expected_sha256=None):
+    """
+    Concatenate received chunks into a ``TopicDocument``, hashing as they are copied.
+
+    The upload row stays locked until the document is saved, so of two
+    concurrent completes the second waits and returns the first one's document.
+    """
+    with transaction.atomic():
+        locked = DocumentUpload.objects.select_for_update().get(pk=upload.pk)
+        if locked.document_id:
+            upload.document_id, upload.sha256 = locked.document_id, locked.sha256
+            return locked.document
+        document = _assemble_locked(locked, expected_sha256)
+        upload.document, upload.sha256 = document, locked.sha256
+    shutil.rmtree(chunk_dir(upload), ignore_errors=True)
+    return document
+
+
+def _assemble_locked(upload, expected_sha256):
+    missing = sorted(set(range(upload.chunk_count)) - set(received_chunks(upload)))
+    if missing:
+        raise UploadError(f'Missing chunks: {missing}')
+
+    directory = chunk_dir(upload)
+    assembled_path = directory / 'assembled'
+    hasher = hashlib.sha256()
+    with open(assembled_path, 'wb') as out:
+        for index in range(upload.chunk_count):
+            with open(directory / str(index), 'rb') as chunk:
+                while data := chunk.read(COPY_BUFFER_SIZE):
+                    hasher.update(data)
+                    out.write(data)
+
+    digest = hasher.hexdigest()
+    if expected_sha256 and expected_sha256.lower() != digest:
+        assembled_path.unlink()
+        raise UploadError('File checksum mismatch')
+
+    document = TopicDocument(topic_id=upload.topic_id, name=upload.name, created_by=upload.created_by)
+    with open(assembled_path, 'rb') as fh:
+        document.file.save(upload.filename, AssembledFile(fh, name=upload.filename, sha256=digest), save=False)
+    document.sha256 = digest
+    try:
+        document.save()
+        upload.document = document
+        upload.sha256 = digest
+        upload.save(update_fields=['document', 'sha256', 'updated_at'])
+    except Exception:
+        document.file.delete(save=False)  # stored before the rows, which roll back
+        raise
+    return document
+
+
+def start_upload(topic, name, filename, size, created_by=None):
+    return DocumentUpload.objects.create(
+        topic=topic,
+        name=name,
+        filename=os.path.basename(filename),
+        size=size,
+        chunk_size=default_chunk_size(),
+        created_by=created_by,
+    )
@@ -1,8 +1,34 @@
+import hmac
+import json
+import math
+
+from django.conf import settings
+from django.core.exceptions import PermissionDenied
+from django.utils.dateparse import parse_datetime
+from django.http import Http404, HttpResponse, HttpResponseBadRequest, JsonResponse, StreamingHttpResponse
 from django.shortcuts import render, redirect, get_object_or_404
+from django.views.decorators.http import require_GET, require_POST, require_http_methods
+
+from .exchange import export_jsonl, export_zip
+from .forms import DocumentUploadForm, TopicDocumentForm
+from .http_cache import DOCUMENT_LIST, conditional_page, scope_version
+from .metrics import registry
+from .models import Course, DocumentUpload, Quiz, TopicDocument
+from .outline import course_outline_json, outline_built_at
+from .pagination import InvalidCursor, keyset_paginate
+from .progress import progress_buffer
+from .search import search as run_search
+from .serving import can_view_document, serve_document_file
+from .topic_choices import search_topics, topic_choices_version
+from .uploads import UploadError, assemble, received_chunks, start_upload, write_chunk
 
-from .forms import TopicDocumentForm
-from .models import TopicDocument
+def _document_list_stamp(request):
+    # The listing and its ancestors' titles, plus the topic choices in the form; the cursor is in the URL.
+    changed = scope_version(DOCUMENT_LIST)
+    return changed, f'{changed.isoformat()}|{topic_choices_version()}'
 
+
+@conditional_page(_document_list_stamp, vary_cookies=(settings.CSRF_COOKIE_NAME,))
 def document_list(request):
     if request.method == 'POST':
         form = TopicDocumentForm(request.POST, request.FILES)
@@ -12,7 +38,14 @@ def document_list(request):
     else:
         form = TopicDocumentForm()
 
-    documents = TopicDocument.objects.all()
+    try:
+        documents = keyset_paginate(
+            TopicDocument.objects.for_listing(),
+            cursor=request.GET.get('cursor'),
+            page_size=getattr(settings, 'DOCUMENT_LIST_PAGE_SIZE', 50),
+        )
+    except InvalidCursor:
+        return HttpResponseBadRequest('Invalid cursor')
     return render(request, 'document_list.html', {'form': form, 'documents': documents})
 
 def update_document(request, document_id):
@@ -32,11 +65,184 @@ def delete_document(request, document_id):
     document = get_object_or_404(TopicDocument, id=document_id)
 
     if request.method == 'POST':
-        # delete file itself
-        # if document.file:
-        #     document.file.delete(save=False)
-        # delete db row
-        document.delete()
+        # Soft delete: the row and its file stay restorable until purge_deleted removes them.
+        document.soft_delete()
         return redirect('document_list')
 
-    return render(request, 'confirm_delete.html', {'document': document})
\ No newline at end of file
+    return render(request, 'confirm_delete.html', {'document': document})
+
+@conditional_page(lambda request: (None, str(topic_choices_version())))
+def topic_search(request):
+    term = request.GET.get('q', '').strip()
+    if not term:
+        return JsonResponse({'results': []})
+    results = [{'id': pk, 'text': label} for pk, label in search_topics(term)]
+    return JsonResponse({'results': results})
+
+
+def _upload_status(upload):
+    return {
+        'id': str(upload.token),
+        'size': upload.size,
+        'chunk_size': upload.chunk_size,
+        'chunk_count': upload.chunk_count,
+        'received_chunks': received_chunks(upload),
+        'document_id': upload.document_id,
+        'sha256': upload.sha256,
+    }
+
+@require_POST
+def upload_create(request):
+    form = DocumentUploadForm(request.POST)
+    if not form.is_valid():
+        return JsonResponse({'errors': form.errors}, status=400)
+    upload = start_upload(
+        topic=form.cleaned_data['topic'],
+        name=form.cleaned_data['name'],
+        filename=form.cleaned_data['filename'],
+        size=form.cleaned_data['size'],
+        created_by=request.user if request.user.is_authenticated else None,
+    )
+    return JsonResponse(_upload_status(upload), status=201)
+
+@require_GET
+def upload_status(request, token):
+    upload = get_object_or_404(DocumentUpload, token=token)
+    return JsonResponse(_upload_status(upload))
+
+@require_http_methods(['PUT'])
+def upload_chunk(request, token, index):
+    # Read the raw body as a stream; touching request.body would buffer the whole chunk.
+    upload = get_object_or_404(DocumentUpload, token=token)
+    try:
+        digest = write_chunk(upload, index, request, request.headers.get('X-Chunk-SHA256'))
+    except UploadError as exc:
+        return JsonResponse({'error': str(exc)}, status=400)
+    return JsonResponse({'index': index, 'sha256': digest})
+
+@require_POST
+def upload_complete(request, token):
+    upload = get_object_or_404(DocumentUpload, token=token)
+    try:
+        assemble(upload, request.POST.get('sha256'))
+    except UploadError as exc:
+        return JsonResponse({'error': str(exc), **_upload_status(upload)}, status=400)
+    return JsonResponse(_upload_status(upload))
+
+
+@require_GET
+def serve_document(request, document_id):
+    document = get_object_or_404(
+        TopicDocument.objects.select_related('topic__part').only(
+            'id', 'file', 'sha256', 'updated_at', 'created_by', 'topic__part__course',
+        ),
+        id=document_id,
+    )
+    if not can_view_document(request.user, document):
+        raise PermissionDenied
+    return serve_document_file(request, document)
+
+
+def _course_outline_stamp(request, course_id):
+    # The snapshot's build time: the signals rebuild it whenever the subtree changes.
+    built = outline_built_at(course_id)
+    return None if built is None else (built, built.isoformat())
+
+
+@require_GET
+@conditional_page(_course_outline_stamp, cache_responses=False)
+def course_outline(request, course_id):
+    # The snapshot is cached pre-serialized, so a hit never touches the ORM or the JSON encoder.
+    snapshot = course_outline_json(course_id)
+    if snapshot is None:
+        raise Http404
+    return HttpResponse(snapshot, content_type='application/json')
+
+
+@require_GET
+def export_course(request, course_id):
+    if not request.user.is_staff:
+        raise PermissionDenied
+    courses = Course.objects.filter(id=course_id)
+    if not courses.exists():
+        raise Http404
+    if request.GET.get('format', 'jsonl') == 'zip':
+        response = StreamingHttpResponse(export_zip(courses), content_type='application/zip')
+        extension = 'zip'
+    else:
+        response = StreamingHttpResponse(export_jsonl(courses), content_type='application/jsonl')
+        extension = 'jsonl'
+    response['Content-Disposition'] = f'attachment; filename="course-{course_id}.{extension}"'
+    return response
+
+
+def _is_score(value):
+    # bool is an int; NaN and infinity have no JSON form to merge into the progress blob.
+    return value is None or (isinstance(value, (int, float)) and not isinstance(value, bool) and math.isfinite(value))
+
+
+@require_POST
+def progress_events(request):
+    """
+    Accept ``{"events": [{"quiz": id, "score": n, "completed_at": iso}, ...]}`` for the
+    current user. Events are buffered and written in batches, so the answer is 202.
+    """
+    if not request.user.is_authenticated:
+        raise PermissionDenied
+    try:
+        events = json.loads(request.body)['events']
+        quiz_ids = {int(event['quiz']) for event in events}
+        completed = [parse_datetime(event['completed_at']) if event.get('completed_at') else None for event in events]
+    except (ValueError, KeyError, TypeError):
+        return HttpResponseBadRequest('Invalid events')
+    if any(
+        event.get('completed_at') and (completed_at is None or completed_at.tzinfo is None)
+        for event, completed_at in zip(events, completed)
+    ):
+        return HttpResponseBadRequest('completed_at must be an ISO 8601 timestamp with a time zone')
+    if not all(_is_score(event.get('score')) for event in events):
+        return HttpResponseBadRequest('score must be a number or null')
+    courses = dict(Quiz.objects.filter(pk__in=quiz_ids).values_list('pk', 'course_id'))
+    if len(courses) != len(quiz_ids):
+        return JsonResponse({'error': 'Unknown quiz', 'quizzes': sorted(quiz_ids - courses.keys())}, status=400)
+    for event, completed_at in zip(events, completed):
+        quiz_id = int(event['quiz'])
+        progress_buffer.add(request.user.pk, quiz_id, courses[quiz_id], event.get('score'), completed_at)
+    return JsonResponse({'accepted': len(events)}, status=202)
+
+
+@require_GET
+def search(request):
+    query = request.GET.get('q', '').strip()
+    try:
+        page = max(1, int(request.GET.get('page', 1)))
+    except ValueError:
+        return HttpResponseBadRequest('Invalid page')
+    page_size = getattr(settings, 'SEARCH_PAGE_SIZE', 20)
+    if not query:
+        return JsonResponse({'count': 0, 'page': page, 'results': []})
+    total, results = run_search(query, page=page, page_size=page_size)
+    return JsonResponse({
+        'count': total,
+        'page': page,
+        'has_next': page * page_size < total,
+        'results': results,
+    })
+
+
+def _may_scrape(request):
+    token = getattr(settings, 'METRICS_TOKEN', None)
+    if token:
+        return hmac.compare_digest(request.META.get('HTTP_AUTHORIZATION', ''), f'Bearer {token}')
+    # Behind a proxy REMOTE_ADDR is the proxy's own address, so forwarded requests need the token.
+    if 'HTTP_X_FORWARDED_FOR' in request.META or 'HTTP_FORWARDED' in request.META:
+        return False
+    return request.META.get('REMOTE_ADDR') in settings.METRICS_ALLOWED_IPS
+
+
+@require_GET
+def metrics(request):
+    # Not for the public internet: scrapers present METRICS_TOKEN, or connect from METRICS_ALLOWED_IPS.
+    if not _may_scrape(request):
+        raise Http404
+    return HttpResponse(registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
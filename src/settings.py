@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.1/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -41,6 +42,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'courses.metrics.RequestMetricsMiddleware',
+    'courses.routers.ReplicaPinningMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -74,16 +77,56 @@ WSGI_APPLICATION = 'src.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.1/ref/settings/#databases
 
+def _env_int(name, default):
+    return int(os.environ.get(name, default))
+
+
+# Connection settings come from the environment; the defaults match docker-compose.yml.
+# Connections are kept open for DB_CONN_MAX_AGE seconds and checked before reuse.
+# DB_POOL=1 uses psycopg's connection pool instead, which Django only allows with CONN_MAX_AGE = 0.
+DB_POOL = os.environ.get('DB_POOL', '') in ('1', 'true', 'yes')
+
 DATABASES = {
     "default": {
-        "ENGINE": "django.db.backends.postgresql",
-        "NAME": "online_courses",
-        "USER": "postgres",
-        "PASSWORD": "postgres",
-        "HOST": "127.0.0.1",
-        "PORT": "5431",
+        "ENGINE": os.environ.get('DB_ENGINE', 'django.db.backends.postgresql'),
+        "NAME": os.environ.get('DB_NAME', 'online_courses'),
+        "USER": os.environ.get('DB_USER', 'postgres'),
+        "PASSWORD": os.environ.get('DB_PASSWORD', 'postgres'),
+        "HOST": os.environ.get('DB_HOST', '127.0.0.1'),
+        "PORT": os.environ.get('DB_PORT', '5431'),
+        "CONN_MAX_AGE": 0 if DB_POOL else _env_int('DB_CONN_MAX_AGE', 60),
+        "CONN_HEALTH_CHECKS": True,
     }
 }
+if DB_POOL:
+    DATABASES['default']['OPTIONS'] = {
+        'pool': {
+            'min_size': _env_int('DB_POOL_MIN_SIZE', 2),
+            'max_size': _env_int('DB_POOL_MAX_SIZE', 10),
+            'timeout': _env_int('DB_POOL_TIMEOUT', 10),
+        },
+    }
+
+# Read replicas: DB_REPLICAS is a comma-separated list of host[:port] entries, or of
+# database files for SQLite. Each becomes a replica_<n> alias with the primary's
+# credentials; courses.routers sends course content reads to them.
+DATABASE_REPLICAS = []
+for _number, _entry in enumerate(filter(None, os.environ.get('DB_REPLICAS', '').split(',')), start=1):
+    _replica = {**DATABASES['default'], 'TEST': {'MIRROR': 'default'}}
+    if _replica['ENGINE'].endswith('sqlite3'):
+        _replica['NAME'] = _entry
+    else:
+        _host, _, _port = _entry.partition(':')
+        _replica.update(HOST=_host, PORT=_port or _replica['PORT'])
+    DATABASES[f'replica_{_number}'] = _replica
+    DATABASE_REPLICAS.append(f'replica_{_number}')
+
+DATABASE_ROUTERS = ['courses.routers.PrimaryReplicaRouter']
+# How long a client keeps reading from the primary after one of its requests wrote.
+REPLICA_PIN_SECONDS = _env_int('REPLICA_PIN_SECONDS', 5)
+
+# Covering indexes (Index.include) are PostgreSQL-only; SQLite builds them without the extra columns.
+SILENCED_SYSTEM_CHECKS = ['models.W040']
 
 
 
@@ -126,6 +169,102 @@ STATIC_URL = 'static/'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+STORAGES = {
+    'default': {
+        'BACKEND': 'django.core.files.storage.FileSystemStorage',
+    },
+    'staticfiles': {
+        'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage',
+    },
+    # Topic documents are stored once per unique content and hard-linked per upload.
+    'documents': {
+        'BACKEND': 'courses.storage.ContentAddressedStorage',
+    },
+}
+
+# How serve_document delivers files: 'direct' streams them from Django (sendfile
+# where the WSGI server supports it), 'x-accel-redirect' or 'x-sendfile' hand the
+# transfer to a front proxy after the access check.
+DOCUMENT_SERVE_MODE = 'direct'
+DOCUMENT_SERVE_ACCEL_PREFIX = '/protected-media/'
+
+# Route the document list/update/delete/serve endpoints to courses.async_views.
+# Only worth it under an ASGI server (src.asgi); under WSGI each coroutine gets its own event loop.
+ASYNC_DOCUMENT_VIEWS = False
+
+# Outline snapshots, topic choices, answer keys and page stamps are invalidated by
+# writing cache keys after commit, so every process must read the same cache. REDIS_URL
+# selects Redis (needs the redis package); otherwise the database holds it, in a table
+# created by "manage.py createcachetable". Outside DEBUG the courses app refuses locmem.
+if os.environ.get('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ['REDIS_URL'],
+        },
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+            'LOCATION': 'courses_cache',
+            'OPTIONS': {'MAX_ENTRIES': _env_int('CACHE_MAX_ENTRIES', 100_000)},
+        },
+    }
+
+# Read views answer conditional GETs (ETag/Last-Modified from cached versions) and
+# keep rendered pages in this CACHES alias, keyed by those versions.
+RESPONSE_CACHE_ALIAS = 'default'
+RESPONSE_CACHE_TIMEOUT = 300
+
+# Worker processes used by the render_certificates job; None means one per CPU.
+CERTIFICATE_RENDER_PROCESSES = None
+
+# Full-text search: PostgreSQL tsvector columns, or an in-process inverted index elsewhere.
+# The inverted index is per process and misses other processes' writes: single-process only.
+SEARCH_CONFIG = 'english'
+SEARCH_PAGE_SIZE = 20
+
+# Per-view latency/query metrics, served at /metrics. With METRICS_TOKEN set the
+# scraper must send "Authorization: Bearer <token>"; without it only direct
+# (unproxied) requests from METRICS_ALLOWED_IPS are answered. Behind a reverse
+# proxy every request comes from the proxy's address, so set the token there.
+# The courses.metrics logger writes one JSON line per request at INFO, and at
+# WARNING for requests that look like N+1 loops.
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+METRICS_ALLOWED_IPS = ['127.0.0.1', '::1']
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'courses.metrics': {
+            'handlers': ['console'],
+            'level': os.environ.get('METRICS_LOG_LEVEL', 'WARNING'),
+            'propagate': False,
+        },
+    },
+}
+
+# Quiz completion events posted to /progress/events are buffered per process and
+# written in batches by a background thread every this many seconds, or sooner
+# once this many are waiting. A process killed outright loses up to that many
+# seconds of events. Without the thread, requests crossing a limit flush inline.
+PROGRESS_BUFFER_SIZE = 500
+PROGRESS_FLUSH_SECONDS = 5
+PROGRESS_BACKGROUND_FLUSH = True
+
+# Soft-deleted rows stay restorable this long; the purge_deleted command then
+# hard-deletes them and queues their document files for removal.
+SOFT_DELETE_RETENTION_DAYS = 30
+
+# Resumable document uploads are staged here chunk by chunk, outside MEDIA_ROOT.
+DOCUMENT_UPLOAD_CHUNK_ROOT = BASE_DIR / 'upload_chunks'
+DOCUMENT_UPLOAD_CHUNK_SIZE = 8 * 1024 * 1024
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.1/ref/settings/#default-auto-field
 
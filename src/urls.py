@@ -18,11 +18,25 @@ from django.contrib import admin
 from django.urls import path
 from django.conf.urls.static import static
 from django.conf import settings
-from courses import views
+from courses import async_views, views
+
+# Over ASGI the document endpoints can run as coroutines instead of holding a worker thread.
+document_views = async_views if settings.ASYNC_DOCUMENT_VIEWS else views
 
 urlpatterns = [
     path('admin/', admin.site.urls),
-    path('document_list/', views.document_list, name='document_list'),
-    path('update_document/<int:document_id>', views.update_document, name='update_document'),
-    path('delete_document/<int:document_id>', views.delete_document, name='delete_document'),
+    path('document_list/', document_views.document_list, name='document_list'),
+    path('update_document/<int:document_id>', document_views.update_document, name='update_document'),
+    path('delete_document/<int:document_id>', document_views.delete_document, name='delete_document'),
+    path('documents/<int:document_id>/file', document_views.serve_document, name='serve_document'),
+    path('courses/<int:course_id>/outline', views.course_outline, name='course_outline'),
+    path('courses/<int:course_id>/export', views.export_course, name='export_course'),
+    path('metrics', views.metrics, name='metrics'),
+    path('progress/events', views.progress_events, name='progress_events'),
+    path('search/', views.search, name='search'),
+    path('topics/search/', views.topic_search, name='topic_search'),
+    path('uploads/', views.upload_create, name='upload_create'),
+    path('uploads/<uuid:token>', views.upload_status, name='upload_status'),
+    path('uploads/<uuid:token>/chunks/<int:index>', views.upload_chunk, name='upload_chunk'),
+    path('uploads/<uuid:token>/complete', views.upload_complete, name='upload_complete'),
 ] + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)